@@ -217,6 +217,15 @@ DEFAULT_CLI_ARGS = {
                      "(status and stdout still included for other events)"
             ),
         ),
+        (
+            ("--event-data-fields",),
+            dict(
+                nargs='*',
+                help="list of event data keys or dotted paths (e.g. res.rc) to keep "
+                     "in the callback payloads, the rest is dropped before it is "
+                     "encoded (default=None)"
+            ),
+        ),
         (
             ("-q", "--quiet",),
             dict(
@@ -878,6 +887,7 @@ def main(sys_args=None):
                                    json_mode=vargs.get('json'),
                                    omit_event_data=vargs.get('omit_event_data'),
                                    only_failed_event_data=vargs.get('only_failed_event_data'),
+                                   event_data_fields=vargs.get('event_data_fields'),
                                    inventory=vargs.get('inventory'),
                                    forks=vargs.get('forks'),
                                    project_dir=vargs.get('project_dir'),
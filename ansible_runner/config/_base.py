@@ -44,7 +44,15 @@ from ansible_runner.utils import (
     sanitize_container_name,
     cli_mounts,
     register_for_cleanup,
+    DEFAULT_COALESCE_LINES,
+    DEFAULT_COALESCE_BYTES,
+    DEFAULT_COALESCE_INTERVAL,
 )
+from ansible_runner.utils.durability import DEFAULT_COMMIT_INTERVAL, DEFAULT_COMMIT_BATCH
+from ansible_runner.utils.event_channel import EVENT_FRAMING_BINARY
+from ansible_runner.utils.event_writer import DEFAULT_QUEUE_SIZE, BACKPRESSURE_BLOCK
+from ansible_runner.utils.journal import DEFAULT_SEGMENT_SIZE, DEFAULT_FLUSH_INTERVAL
+from ansible_runner.utils.timing_profile import DEFAULT_SLOWEST
 
 logger = logging.getLogger('ansible-runner')
 
@@ -188,6 +196,26 @@ class BaseConfig(object):
             else:
                 self.subprocess_timeout = self.settings.get('subprocess_timeout', None)
 
+        self.event_journal = self.settings.get('event_journal', False)
+        self.event_journal_segment_size = self.settings.get('event_journal_segment_size', DEFAULT_SEGMENT_SIZE)
+        self.event_journal_flush_interval = self.settings.get('event_journal_flush_interval', DEFAULT_FLUSH_INTERVAL)
+        self.event_pipe = self.settings.get('event_pipe', True)
+        self.event_framing = self.settings.get('event_framing', EVENT_FRAMING_BINARY)
+        self.event_passthrough = self.settings.get('event_passthrough', False)
+        self.event_writer = self.settings.get('event_writer', False)
+        self.event_writer_queue_size = self.settings.get('event_writer_queue_size', DEFAULT_QUEUE_SIZE)
+        self.event_writer_backpressure = self.settings.get('event_writer_backpressure', BACKPRESSURE_BLOCK)
+        self.event_durability = self.settings.get('event_durability', None)
+        self.event_durability_interval = self.settings.get('event_durability_interval', DEFAULT_COMMIT_INTERVAL)
+        self.event_durability_batch = self.settings.get('event_durability_batch', DEFAULT_COMMIT_BATCH)
+        self.event_fsync = self.settings.get('event_fsync', False)
+        self.event_coalesce_verbose = self.settings.get('event_coalesce_verbose', False)
+        self.event_coalesce_lines = self.settings.get('event_coalesce_lines', DEFAULT_COALESCE_LINES)
+        self.event_coalesce_bytes = self.settings.get('event_coalesce_bytes', DEFAULT_COALESCE_BYTES)
+        self.event_coalesce_interval = self.settings.get('event_coalesce_interval', DEFAULT_COALESCE_INTERVAL)
+        self.timing_profile_slowest = self.settings.get('timing_profile_slowest', DEFAULT_SLOWEST)
+        self.event_compact_context = self.settings.get('event_compact_context', False)
+
         self.process_isolation = self.settings.get('process_isolation', self.process_isolation)
         self.process_isolation_executable = self.settings.get('process_isolation_executable', self.process_isolation_executable)
 
@@ -72,7 +72,7 @@ class RunnerConfig(BaseConfig):
                  resource_profiling_memory_poll_interval=0.25, resource_profiling_pid_poll_interval=0.25,
                  resource_profiling_results_dir=None, tags=None, skip_tags=None,
                  directory_isolation_base_path=None, forks=None, cmdline=None, omit_event_data=False,
-                 only_failed_event_data=False, **kwargs):
+                 only_failed_event_data=False, event_data_fields=None, **kwargs):
 
         self.runner_mode = "pexpect"
 
@@ -110,6 +110,7 @@ class RunnerConfig(BaseConfig):
 
         self.omit_event_data = omit_event_data
         self.only_failed_event_data = only_failed_event_data
+        self.event_data_fields = event_data_fields
 
     @property
     def sandboxed(self):
@@ -241,6 +242,20 @@ class RunnerConfig(BaseConfig):
 
         self.env["RUNNER_OMIT_EVENTS"] = str(self.omit_event_data)
         self.env["RUNNER_ONLY_FAILED_EVENTS"] = str(self.only_failed_event_data)
+        if self.event_data_fields:
+            self.env["RUNNER_EVENT_DATA_FIELDS"] = ','.join(self.event_data_fields)
+
+        self.event_item_aggregation = self.settings.get('event_item_aggregation', False)
+        if self.event_item_aggregation:
+            self.env['RUNNER_ITEM_AGGREGATION'] = 'True'
+            if 'event_item_aggregation_batch' in self.settings:
+                self.env['RUNNER_ITEM_AGGREGATION_BATCH'] = str(self.settings['event_item_aggregation_batch'])
+            if 'event_item_aggregation_interval' in self.settings:
+                self.env['RUNNER_ITEM_AGGREGATION_INTERVAL'] = str(self.settings['event_item_aggregation_interval'])
+
+        self.event_blob_threshold = self.settings.get('event_blob_threshold', None)
+        if self.event_blob_threshold:
+            self.env['RUNNER_BLOB_THRESHOLD'] = str(self.event_blob_threshold)
 
     def prepare_command(self):
         try:
@@ -26,10 +26,16 @@ import uuid
 from ansible.utils.display import Display
 
 # Tower Display Callback
-from .events import event_context
+from .events import BufferedOutput, event_context
 
 __all__ = []
 
+# lets threads collect the output of an event before writing it
+if not isinstance(sys.stdout, BufferedOutput):
+    sys.stdout = BufferedOutput(sys.stdout, event_context)
+if not isinstance(sys.stderr, BufferedOutput):
+    sys.stderr = BufferedOutput(sys.stderr, event_context)
+
 
 def with_context(**context):
     global event_context
@@ -78,11 +84,11 @@ def display_with_context(f):
         log_only = args[5] if len(args) >= 6 else kwargs.get('log_only', False)
         stderr = args[3] if len(args) >= 4 else kwargs.get('stderr', False)
         event_uuid = event_context.get().get('uuid', None)
-        with event_context.display_lock:
-            # If writing only to a log file or there is already an event UUID
-            # set (from a callback module method), skip dumping the event data.
-            if log_only or event_uuid:
-                return f(*args, **kwargs)
+        # If writing only to a log file or there is already an event UUID
+        # set (from a callback module method), skip dumping the event data.
+        if log_only or event_uuid:
+            return f(*args, **kwargs)
+        with event_context.buffered():
             try:
                 fileobj = sys.stderr if stderr else sys.stdout
                 event_context.add_local(uuid=str(uuid.uuid4()))
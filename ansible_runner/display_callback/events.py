@@ -21,15 +21,37 @@ from __future__ import (absolute_import, division, print_function)
 import base64
 import contextlib
 import datetime
+import hashlib
 import json
 import multiprocessing
 import os
 import stat
+import struct
 import threading
+import time
 import uuid
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 __all__ = ['event_context']
 
+# loop items counted before their summary is reported, and seconds at most between summaries
+DEFAULT_ITEM_BATCH = 1000
+DEFAULT_ITEM_INTERVAL = 5.0
+
+# event_data Runner reads itself, kept when the event data is projected
+RUNNER_FIELDS = ('host', 'task', 'task_uuid', 'ignore_errors', 'duration', 'res.changed')
+
+# key of the references to payloads in the blob store, see ansible_runner.utils.blob_store
+BLOB_KEY = '__runner_blob'
+# result fields that stay in the event whatever their size, Runner and the
+# consumers of its events read them
+RESULT_STATUS_FIELDS = frozenset(['changed', 'failed', 'skipped', 'unreachable']).union(
+    path[len('res.'):] for path in RUNNER_FIELDS if path.startswith('res.'))
+
 
 # use a custom JSON serializer so we can properly handle !unsafe and !vault
 # objects that may exist in events emitted by the callback plugin
@@ -51,6 +73,140 @@ class AnsibleJSONEncoderLocal(json.JSONEncoder):
         return super(AnsibleJSONEncoderLocal, self).default(o)
 
 
+_encoder = AnsibleJSONEncoderLocal()
+_encode_string = json.encoder.encode_basestring_ascii
+
+
+def json_dumpb(obj):
+    '''
+    Encode ``obj`` as UTF-8 JSON with orjson when Ansible's interpreter has it,
+    the callback can't rely on ansible_runner.utils.json_codec being importable
+    '''
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_encoder.default,
+                                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            pass
+    return json.dumps(obj, cls=AnsibleJSONEncoderLocal).encode('utf-8')
+
+
+def encoded_size(obj, limit):
+    '''
+    Returns the length of ``obj`` encoded as JSON with the default separators,
+    counting stops as soon as it exceeds ``limit``
+    '''
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, str):
+            size += len(_encode_string(obj))
+        elif obj is None or obj is True:
+            size += 4
+        elif obj is False:
+            size += 5
+        elif isinstance(obj, int):
+            size += len(int.__repr__(obj))
+        elif isinstance(obj, float):
+            size += len(_encoder.encode(obj))
+        elif isinstance(obj, dict):
+            # braces, ', ' between and ': ' within the items
+            size += 4 * len(obj) or 2
+            for key, value in obj.items():
+                size += len(_encode_string(key if isinstance(key, str) else _encoder.encode(key)))
+                stack.append(value)
+        elif isinstance(obj, (list, tuple)):
+            size += 2 * len(obj) or 2
+            stack.extend(obj)
+        else:
+            stack.append(_encoder.default(obj))
+        if size > limit:
+            break
+    return size
+
+
+def _truncate_fields(obj, limit):
+    if isinstance(obj, dict):
+        return dict((key, _truncate_fields(value, limit)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        # lists are bounded by their encoded size too, not their length
+        items = []
+        size = 0
+        for value in obj:
+            value = _truncate_fields(value, limit)
+            size += encoded_size(value, limit) + 2
+            if size > limit:
+                break
+            items.append(value)
+        if len(items) < len(obj):
+            items.append(u'... [truncated {} items]'.format(len(obj) - len(items)))
+        return items
+    if isinstance(obj, str) and len(obj) > limit:
+        return obj[:limit] + u'... [truncated {} characters]'.format(len(obj) - limit)
+    return obj
+
+
+def truncate_res(res, max_size, min_field_size=16):
+    '''
+    Bound the JSON encoded size of a module result to ``max_size``
+
+    Results within the budget are returned as they are. Otherwise the strings
+    and lists in it are cut down, so a long stdout or stdout_lines loses its
+    tail while the small fields of the result survive. If even that does
+    not fit, an empty result is returned.
+    '''
+    if encoded_size(res, max_size) <= max_size:
+        return res
+    limit = max_size // 2
+    while limit >= min_field_size:
+        truncated = _truncate_fields(res, limit)
+        if encoded_size(truncated, max_size) <= max_size:
+            return truncated
+        limit //= 2
+    return {}
+
+
+def parse_fields(paths):
+    '''
+    Turns event_data keys and dotted paths (``res.rc``) into the tree
+    ``project`` walks, ``{'res': {'rc': True}}``. A key named on its own
+    keeps all of its value.
+    '''
+    fields = {}
+    for path in paths:
+        node = fields
+        keys = path.split('.')
+        for key in keys[:-1]:
+            child = node.setdefault(key, {})
+            if child is True:
+                break
+            node = child
+        else:
+            node[keys[-1]] = True
+    return fields
+
+
+def project(data, fields):
+    '''
+    Returns the parts of ``data`` named in the ``fields`` tree, leaving
+    ``data`` alone. Paths into a list apply to the dicts in it, like the
+    ``results`` of a loop.
+    '''
+    projected = {}
+    for key, subfields in fields.items():
+        if key not in data:
+            continue
+        value = data[key]
+        if subfields is True:
+            projected[key] = value
+        elif isinstance(value, dict):
+            projected[key] = project(value, subfields)
+        elif isinstance(value, list):
+            projected[key] = [project(item, subfields) if isinstance(item, dict) else item for item in value]
+    return projected
+
+
 class IsolatedFileWrite:
     '''
     Class that will write partial event data to a file
@@ -68,12 +224,242 @@ class IsolatedFileWrite:
             os.mkdir(os.path.join(self.private_data_dir, 'job_events'), 0o700)
         dropoff_location = os.path.join(self.private_data_dir, 'job_events', filename)
         write_location = '.'.join([dropoff_location, 'tmp'])
-        partial_data = json.dumps(value, cls=AnsibleJSONEncoderLocal)
-        with os.fdopen(os.open(write_location, os.O_WRONLY | os.O_CREAT, stat.S_IRUSR | stat.S_IWUSR), 'w') as f:
+        partial_data = json_dumpb(value)
+        with os.fdopen(os.open(write_location, os.O_WRONLY | os.O_CREAT, stat.S_IRUSR | stat.S_IWUSR), 'wb') as f:
             f.write(partial_data)
         os.rename(write_location, dropoff_location)
 
 
+class BlobWrite:
+    '''
+    Writes the large payloads of events once to the content addressed blob
+    store in the artifact directory, see ansible_runner.utils.blob_store,
+    and returns the references events hold instead
+    '''
+
+    def __init__(self, root, threshold):
+        self.root = root
+        self.threshold = threshold
+
+    def put(self, value):
+        data = json_dumpb(value)
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.root, digest[:2], digest)
+        # the same payload, a file diffed on every host, is only written once
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), 0o700, exist_ok=True)
+            write_location = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+            with os.fdopen(os.open(write_location, os.O_WRONLY | os.O_CREAT, stat.S_IRUSR | stat.S_IWUSR), 'wb') as f:
+                f.write(data)
+            os.rename(write_location, path)
+        return {BLOB_KEY: digest, 'size': len(data)}
+
+    def _store_large(self, value):
+        # only payloads, a flag or number stays what it is
+        if isinstance(value, (str, list, dict)) and encoded_size(value, self.threshold) > self.threshold:
+            return self.put(value)
+        return value
+
+    def offload(self, event_data):
+        '''
+        Returns ``event_data`` with its diff and the payload fields of its
+        result that are larger than the threshold replaced by references
+        '''
+        if event_data.get('diff'):
+            event_data['diff'] = self._store_large(event_data['diff'])
+        res = event_data.get('res')
+        if isinstance(res, dict) and encoded_size(res, self.threshold) > self.threshold:
+            event_data['res'] = dict((key, value if key in RESULT_STATUS_FIELDS else self._store_large(value))
+                                     for key, value in res.items())
+        return event_data
+
+
+def event_summary(event_dict):
+    '''
+    The fields of an event Runner reads itself (for the event index, its
+    live stats and timing profile) when it passes the encoded event through
+    '''
+    event_data = event_dict.get('event_data') or {}
+    summary_data = dict((key, event_data[key]) for key in ('host', 'task', 'task_uuid', 'ignore_errors', 'duration') if key in event_data)
+    res = event_data.get('res')
+    if isinstance(res, dict) and 'changed' in res:
+        summary_data['res'] = {'changed': res['changed']}
+    return {'uuid': event_dict.get('uuid'), 'event': event_dict.get('event'), 'event_data': summary_data}
+
+
+class InstrumentedLock(object):
+    '''
+    Wraps a (multiprocessing) lock and counts how often it was acquired and
+    how long it was waited for and held, in the process using it
+    '''
+
+    def __init__(self, lock):
+        self._lock = lock
+        self._local = threading.local()
+        self.acquisitions = 0
+        self.wait_time = 0.0
+        self.hold_time = 0.0
+        self.max_hold_time = 0.0
+
+    def acquire(self):
+        start = time.perf_counter()
+        self._lock.acquire()
+        acquired = time.perf_counter()
+        # reentrant locks are acquired again by the thread holding them
+        if not hasattr(self._local, 'acquired'):
+            self._local.acquired = []
+        self._local.acquired.append(acquired)
+        self.acquisitions += 1
+        self.wait_time += acquired - start
+
+    def release(self):
+        held = time.perf_counter() - self._local.acquired.pop()
+        self.hold_time += held
+        self.max_hold_time = max(self.max_hold_time, held)
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    @property
+    def stats(self):
+        return {
+            'acquisitions': self.acquisitions,
+            'wait_time': self.wait_time,
+            'hold_time': self.hold_time,
+            'max_hold_time': self.max_hold_time,
+        }
+
+
+class BufferedOutput(object):
+    '''
+    Stands in for sys.stdout and sys.stderr of the Ansible process. While a
+    thread collects the output of an event (see ``EventContext.buffered``)
+    its writes are kept back, so that the complete event is written at once.
+    '''
+
+    def __init__(self, stream, event_context):
+        self.stream = stream
+        self._event_context = event_context
+
+    def write(self, data):
+        buffer = self._event_context.output_buffer
+        if buffer is None:
+            return self.stream.write(data)
+        buffer.append((self.stream, data))
+        return len(data)
+
+    def flush(self):
+        if self._event_context.output_buffer is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class ItemAggregator(object):
+    '''
+    Counts the loop items of every task on every host, so that they are
+    reported in batches instead of one event per item. ``add`` returns the
+    counts of the current batch once ``batch`` items were added or
+    ``interval`` seconds passed since the last one was reported, ``finish``
+    returns the totals of a task on a host when its result is in.
+    '''
+
+    STATUSES = ('ok', 'changed', 'skipped', 'failed')
+
+    def __init__(self, batch=DEFAULT_ITEM_BATCH, interval=DEFAULT_ITEM_INTERVAL):
+        self.batch = batch
+        self.interval = interval
+        self._lock = threading.Lock()
+        # (host, task uuid) -> [task, batch counts, total counts, batch started]
+        self._loops = {}
+
+    @classmethod
+    def _counts(cls):
+        return dict({'items': 0}, **dict.fromkeys(cls.STATUSES, 0))
+
+    def add(self, host, task_uuid, status, changed=False, task=None):
+        now = time.monotonic()
+        with self._lock:
+            loop = self._loops.get((host, task_uuid))
+            if loop is None:
+                loop = self._loops[(host, task_uuid)] = [task, self._counts(), self._counts(), now]
+            for counts in loop[1:3]:
+                counts['items'] += 1
+                counts[status] += 1
+                if changed:
+                    counts['changed'] += 1
+            if loop[1]['items'] < self.batch and now - loop[3] < self.interval:
+                return None
+            counts, loop[1], loop[3] = loop[1], self._counts(), now
+            return counts
+
+    def finish(self, host, task_uuid):
+        with self._lock:
+            loop = self._loops.pop((host, task_uuid), None)
+        return loop[2] if loop else None
+
+    def finish_all(self):
+        '''
+        Returns (host, task, totals) of every loop that never got a result
+        '''
+        with self._lock:
+            loops, self._loops = self._loops, {}
+        return [(host, loop[0], loop[2]) for (host, task_uuid), loop in loops.items()]
+
+
+class EventPipeWrite:
+    '''
+    Class that will write partial event data to the pipe inherited from Runner
+    '''
+
+    def __init__(self, fd, framing='lines', passthrough=False):
+        self.fd = fd
+        self.framing = framing
+        self.passthrough = passthrough
+        # records longer than PIPE_BUF are written in pieces, which must not
+        # interleave with those of other forks
+        self.lock = InstrumentedLock(multiprocessing.Lock())
+
+    def set(self, key, value):
+        # One JSON document per record, the uuid inside the value identifies it
+        payload = json_dumpb(value)
+        if self.passthrough and 'res' in (value.get('event_data') or {}):
+            # Runner decodes the summary and stores the event without decoding it,
+            # encoded JSON never contains a NUL byte
+            payload = json_dumpb(event_summary(value)) + b'\x00' + payload
+        if self.framing == 'binary':
+            data = memoryview(struct.pack('!I', len(payload)) + payload)
+        else:
+            data = memoryview(payload + b'\n')
+        with self.lock:
+            while data:
+                written = os.write(self.fd, data)
+                data = data[written:]
+
+
+def _inherited_event_fd():
+    event_fd = os.environ.pop('RUNNER_EVENT_FD', None)
+    if not event_fd:
+        return None
+    try:
+        event_fd = int(event_fd)
+        is_pipe = stat.S_ISFIFO(os.fstat(event_fd).st_mode)
+    except (ValueError, OSError):
+        # wrapped by something that closed it, fall back to partial files
+        return None
+    if not is_pipe:
+        # closed and the number reused for something else, which must not
+        # get event data written to it
+        return None
+    return event_fd
+
+
 class EventContext(object):
     '''
     Store global and local (per thread/process) data associated with callback
@@ -81,10 +467,45 @@ class EventContext(object):
     '''
 
     def __init__(self):
-        self.display_lock = multiprocessing.RLock()
+        # only held to write the complete output of an event
+        self.display_lock = InstrumentedLock(multiprocessing.RLock())
         self._local = threading.local()
-        if os.getenv('AWX_ISOLATED_DATA_DIR', False):
+        event_fd = _inherited_event_fd()
+        event_framing = os.environ.pop('RUNNER_EVENT_FRAMING', 'lines')
+        event_passthrough = os.environ.pop('RUNNER_EVENT_PASSTHROUGH', '') == '1'
+        if event_fd is not None:
+            self.cache = EventPipeWrite(event_fd, event_framing, event_passthrough)
+        elif os.getenv('AWX_ISOLATED_DATA_DIR', False):
             self.cache = IsolatedFileWrite()
+        self.configure()
+
+    def configure(self):
+        '''
+        Resolve the settings Runner passes in the environment once, when the
+        plugin is loaded, instead of for every event
+        '''
+        self.omit_event_data = os.getenv("RUNNER_OMIT_EVENTS", "False").lower() == "true"
+        self.include_only_failed_event_data = os.getenv("RUNNER_ONLY_FAILED_EVENTS", "False").lower() == "true"
+        self.max_event_res = int(os.getenv("MAX_EVENT_RES", 700000))
+        # Runner indexes and counts events by these whatever else is kept
+        self.event_data_fields = None
+        if os.getenv("RUNNER_EVENT_DATA_FIELDS", ""):
+            paths = os.getenv("RUNNER_EVENT_DATA_FIELDS").split(",") + list(RUNNER_FIELDS)
+            self.event_data_fields = parse_fields(path.strip() for path in paths if path.strip())
+        self.item_aggregation = os.getenv("RUNNER_ITEM_AGGREGATION", "False").lower() == "true"
+        self.item_batch = int(os.getenv("RUNNER_ITEM_AGGREGATION_BATCH", DEFAULT_ITEM_BATCH))
+        self.item_interval = float(os.getenv("RUNNER_ITEM_AGGREGATION_INTERVAL", DEFAULT_ITEM_INTERVAL))
+        self.blobs = None
+        if os.getenv('RUNNER_BLOB_THRESHOLD', '') and os.getenv('AWX_ISOLATED_DATA_DIR', ''):
+            self.blobs = BlobWrite(os.path.join(os.getenv('AWX_ISOLATED_DATA_DIR'), 'blobs'), int(os.getenv('RUNNER_BLOB_THRESHOLD')))
+        # fields that are the same for every event
+        self.envelope = {}
+        if os.getenv('JOB_ID', ''):
+            self.envelope['job_id'] = int(os.getenv('JOB_ID', '0'))
+        if os.getenv('AD_HOC_COMMAND_ID', ''):
+            self.envelope['ad_hoc_command_id'] = int(os.getenv('AD_HOC_COMMAND_ID', '0'))
+        if os.getenv('PROJECT_UPDATE_ID', ''):
+            self.envelope['project_update_id'] = int(os.getenv('PROJECT_UPDATE_ID', '0'))
 
     def add_local(self, **kwargs):
         tls = vars(self._local)
@@ -127,6 +548,37 @@ class EventContext(object):
     def get_global(self):
         return getattr(self, '_global_ctx', {})
 
+    @property
+    def output_buffer(self):
+        return getattr(self._local, 'output', None)
+
+    @contextlib.contextmanager
+    def buffered(self):
+        '''
+        Collect the output this thread writes to the event tokens and to
+        ``BufferedOutput`` streams, then write all of it with a single hold
+        of the display lock. Building the event doesn't need the lock.
+        '''
+        if self.output_buffer is not None:
+            yield
+            return
+        buffer = self._local.output = []
+        try:
+            yield
+        finally:
+            self._local.output = None
+            self.write_buffered(buffer)
+
+    def write_buffered(self, buffer):
+        streams = []
+        with self.display_lock:
+            for stream, data in buffer:
+                stream.write(data)
+                if stream not in streams:
+                    streams.append(stream)
+            for stream in streams:
+                stream.flush()
+
     def get(self):
         ctx = {}
         ctx.update(self.get_global())
@@ -134,8 +586,7 @@ class EventContext(object):
         return ctx
 
     def get_begin_dict(self):
-        omit_event_data = os.getenv("RUNNER_OMIT_EVENTS", "False").lower() == "true"
-        include_only_failed_event_data = os.getenv("RUNNER_ONLY_FAILED_EVENTS", "False").lower() == "true"
+        include_only_failed_event_data = self.include_only_failed_event_data
         event_data = self.get()
         event = event_data.pop('event', None)
         if not event:
@@ -147,15 +598,11 @@ class EventContext(object):
         event_dict = dict(event=event)
         should_process_event_data = (include_only_failed_event_data and event in ('runner_on_failed', 'runner_on_async_failed', 'runner_on_item_failed')) \
             or not include_only_failed_event_data
-        if os.getenv('JOB_ID', ''):
-            event_dict['job_id'] = int(os.getenv('JOB_ID', '0'))
-        if os.getenv('AD_HOC_COMMAND_ID', ''):
-            event_dict['ad_hoc_command_id'] = int(os.getenv('AD_HOC_COMMAND_ID', '0'))
-        if os.getenv('PROJECT_UPDATE_ID', ''):
-            event_dict['project_update_id'] = int(os.getenv('PROJECT_UPDATE_ID', '0'))
-        event_dict['pid'] = event_data.get('pid', os.getpid())
-        event_dict['uuid'] = event_data.get('uuid', str(uuid.uuid4()))
-        event_dict['created'] = event_data.get('created', datetime.datetime.utcnow().isoformat())
+        event_dict.update(self.envelope)
+        # only compute the defaults an event doesn't bring along
+        event_dict['pid'] = event_data['pid'] if 'pid' in event_data else os.getpid()
+        event_dict['uuid'] = event_data['uuid'] if 'uuid' in event_data else str(uuid.uuid4())
+        event_dict['created'] = event_data['created'] if 'created' in event_data else datetime.datetime.utcnow().isoformat()
         if not event_data.get('parent_uuid', None):
             for key in ('task_uuid', 'play_uuid', 'playbook_uuid'):
                 parent_uuid = event_data.get(key, None)
@@ -166,10 +613,13 @@ class EventContext(object):
             event_dict['parent_uuid'] = event_data.get('parent_uuid', None)
         if "verbosity" in event_data.keys():
             event_dict["verbosity"] = event_data.pop("verbosity")
-        if not omit_event_data and should_process_event_data:
-            max_res = int(os.getenv("MAX_EVENT_RES", 700000))
-            if event not in ('playbook_on_stats',) and "res" in event_data and len(str(event_data['res'])) > max_res:
-                event_data['res'] = {}
+        if not self.omit_event_data and should_process_event_data:
+            if self.event_data_fields is not None and event not in ('playbook_on_stats',):
+                event_data = project(event_data, self.event_data_fields)
+            if self.blobs is not None:
+                event_data = self.blobs.offload(event_data)
+            if event not in ('playbook_on_stats',) and "res" in event_data:
+                event_data['res'] = truncate_res(event_data['res'], self.max_event_res)
         else:
             event_data = dict()
         event_dict['event_data'] = event_data
@@ -179,15 +629,20 @@ class EventContext(object):
         return {}
 
     def dump(self, fileobj, data, max_width=78, flush=False):
-        b64data = base64.b64encode(json.dumps(data).encode('utf-8')).decode()
+        b64data = base64.b64encode(json_dumpb(data)).decode()
+        # pattern corresponding to OutputEventFilter expectation
+        chunks = [u'\x1b[K']
+        for offset in range(0, len(b64data), max_width):
+            chunk = b64data[offset:offset + max_width]
+            chunks.append(u'{}\x1b[{}D'.format(chunk, len(chunk)))
+        chunks.append(u'\x1b[K')
+        token = u''.join(chunks)
+        buffer = self.output_buffer
+        if buffer is not None:
+            buffer.append((fileobj.stream if isinstance(fileobj, BufferedOutput) else fileobj, token))
+            return
         with self.display_lock:
-            # pattern corresponding to OutputEventFilter expectation
-            fileobj.write(u'\x1b[K')
-            for offset in range(0, len(b64data), max_width):
-                chunk = b64data[offset:offset + max_width]
-                escaped_chunk = u'{}\x1b[{}D'.format(chunk, len(chunk))
-                fileobj.write(escaped_chunk)
-            fileobj.write(u'\x1b[K')
+            fileobj.write(token)
             if flush:
                 fileobj.flush()
 
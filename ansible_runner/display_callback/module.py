@@ -31,7 +31,7 @@ from ansible.plugins.callback import CallbackBase
 from ansible.plugins.callback.default import CallbackModule as DefaultCallbackModule
 
 # AWX Display Callback
-from .events import event_context
+from .events import ItemAggregator, event_context
 from .minimal import CallbackModule as MinimalCallbackModule
 
 CENSORED = "the output has been hidden due to the fact that 'no_log: true' was specified for this result"  # noqa
@@ -74,6 +74,11 @@ class BaseCallbackModule(CallbackBase):
         self.play_uuids = set()
         self.duplicate_play_counts = collections.defaultdict(lambda: 1)
 
+        # loop items are counted and reported in summaries instead of one event each
+        self._item_aggregator = None
+        if event_context.item_aggregation:
+            self._item_aggregator = ItemAggregator(event_context.item_batch, event_context.item_interval)
+
     @contextlib.contextmanager
     def capture_event_data(self, event, **event_data):
         event_data.setdefault('uuid', str(uuid.uuid4()))
@@ -92,7 +97,9 @@ class BaseCallbackModule(CallbackBase):
                 if isinstance(item, dict) and item.get('_ansible_no_log', False):
                     event_data['res']['results'][i] = {'censored': CENSORED}
 
-        with event_context.display_lock:
+        # the event and its output are collected by this thread and only
+        # written, holding the display lock, once complete
+        with event_context.buffered():
             try:
                 event_context.add_local(event=event, **event_data)
                 if task:
@@ -340,6 +347,10 @@ class BaseCallbackModule(CallbackBase):
             artifact_data=stats.custom.get('_run', {}) if hasattr(stats, 'custom') else {}
         )
 
+        if self._item_aggregator:
+            for host, task, totals in self._item_aggregator.finish_all():
+                self._emit_item_summary(host, task, totals, final=True)
+
         with self.capture_event_data('playbook_on_stats', **event_data):
             super(BaseCallbackModule, self).v2_playbook_on_stats(stats)
 
@@ -377,6 +388,7 @@ class BaseCallbackModule(CallbackBase):
             duration=duration,
             event_loop=self._get_event_loop(result._task),
         )
+        self._finish_items(result)
         with self.capture_event_data('runner_on_ok', **event_data):
             super(BaseCallbackModule, self).v2_runner_on_ok(result)
 
@@ -394,6 +406,7 @@ class BaseCallbackModule(CallbackBase):
             ignore_errors=ignore_errors,
             event_loop=self._get_event_loop(result._task),
         )
+        self._finish_items(result)
         with self.capture_event_data('runner_on_failed', **event_data):
             super(BaseCallbackModule, self).v2_runner_on_failed(result, ignore_errors)
 
@@ -408,6 +421,7 @@ class BaseCallbackModule(CallbackBase):
             duration=duration,
             event_loop=self._get_event_loop(result._task),
         )
+        self._finish_items(result)
         with self.capture_event_data('runner_on_skipped', **event_data):
             super(BaseCallbackModule, self).v2_runner_on_skipped(result)
 
@@ -422,6 +436,7 @@ class BaseCallbackModule(CallbackBase):
             duration=duration,
             res=result._result,
         )
+        self._finish_items(result)
         with self.capture_event_data('runner_on_unreachable', **event_data):
             super(BaseCallbackModule, self).v2_runner_on_unreachable(result)
 
@@ -486,7 +501,40 @@ class BaseCallbackModule(CallbackBase):
         with self.capture_event_data('runner_on_file_diff', **event_data):
             super(BaseCallbackModule, self).v2_on_file_diff(result)
 
+    def _count_item(self, result, status):
+        '''
+        Counts a loop item in aggregation mode and reports the summary of the
+        items so far when it is due. Returns whether the item was counted.
+        '''
+        if not self._item_aggregator:
+            return False
+        host = result._host.get_name()
+        counts = self._item_aggregator.add(host, result._task._uuid, status,
+                                           changed=result._result.get('changed', False), task=result._task)
+        if counts:
+            self._emit_item_summary(host, result._task, counts)
+        return True
+
+    def _finish_items(self, result):
+        if self._item_aggregator:
+            totals = self._item_aggregator.finish(result._host.get_name(), result._task._uuid)
+            if totals:
+                self._emit_item_summary(result._host.get_name(), result._task, totals, final=True)
+
+    def _emit_item_summary(self, host, task, counts, final=False):
+        event_data = dict(
+            host=host,
+            task=task,
+            items=counts,
+            final=final,
+        )
+        with self.capture_event_data('runner_item_summary', **event_data):
+            self._display.display('{}: [{}] => {items} items, {ok} ok ({changed} changed), {skipped} skipped, {failed} failed'.format(
+                'total' if final else 'items', host, **counts))
+
     def v2_runner_item_on_ok(self, result):
+        if self._count_item(result, 'ok'):
+            return
         event_data = dict(
             host=result._host.get_name(),
             task=result._task,
@@ -496,6 +544,8 @@ class BaseCallbackModule(CallbackBase):
             super(BaseCallbackModule, self).v2_runner_item_on_ok(result)
 
     def v2_runner_item_on_failed(self, result):
+        # failed items are reported in full either way
+        self._count_item(result, 'failed')
         event_data = dict(
             host=result._host.get_name(),
             task=result._task,
@@ -505,6 +555,8 @@ class BaseCallbackModule(CallbackBase):
             super(BaseCallbackModule, self).v2_runner_item_on_failed(result)
 
     def v2_runner_item_on_skipped(self, result):
+        if self._count_item(result, 'skipped'):
+            return
         event_data = dict(
             host=result._host.get_name(),
             task=result._task,
@@ -176,6 +176,12 @@ def run(**kwargs):
                     (based on ``runner_mode`` selected) while executing command. It the timeout is triggered it will force cancel the
                     execution.
     :param streamer: Optionally invoke ansible-runner as one of the steps in the streaming pipeline
+    :param zipstream: With the ``transmit`` streamer, send the private data dir as a zip archive which is compressed while it is
+                      written, instead of building it in a temporary file first. Workers before this option can't read it.
+    :param binary_payload: With the ``transmit`` streamer, send the private data dir as raw bytes instead of base64 encoded.
+                           Workers before this option can't read it.
+    :param text_only: With the ``transmit`` streamer, the transports of the job can only carry text, so neither the private
+                      data dir nor the artifacts the worker sends back are sent as raw bytes.
     :param _input: An optional file or file-like object for use as input in a streaming pipeline
     :param _output: An optional file or file-like object for use as output in a streaming pipeline
     :param event_handler: An optional callback that will be invoked any time an event is received by Runner itself, return True to keep the event
@@ -205,6 +211,8 @@ def run(**kwargs):
     :param fact_cache_type: A string of the type of fact cache to use.  Defaults to 'jsonfile'.
     :param omit_event_data: Omits extra ansible event data from event payload (stdout and event still included)
     :param only_failed_event_data: Omits extra ansible event data unless it's a failed event (stdout and event still included)
+    :param event_data_fields: Event data keys or dotted paths (``res.rc``) to keep, the rest of the event data is dropped by the callback
+                              plugin before it is encoded (the keys Runner indexes events by and ``res.changed`` are always kept)
     :param check_job_event_data: Check if job events data is completely generated. If event data is not completely generated and if
                                  value is set to 'True' it will raise 'AnsibleRunnerException' exception,
                                  if set to 'False' it log a debug message and continue execution. Default value is 'False'
@@ -230,6 +238,9 @@ def run(**kwargs):
     :type quiet: bool
     :type verbosity: int
     :type streamer: str
+    :type zipstream: bool
+    :type binary_payload: bool
+    :type text_only: bool
     :type _input: file
     :type _output: file
     :type event_handler: function
@@ -257,6 +268,7 @@ def run(**kwargs):
     :type fact_cache_type: str
     :type omit_event_data: bool
     :type only_failed_event_data: bool
+    :type event_data_fields: list
     :type check_job_event_data: bool
 
     :returns: A :py:class:`ansible_runner.runner.Runner` object, or a simple object containing `rc` if run remotely
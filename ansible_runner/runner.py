@@ -1,4 +1,5 @@
 import os
+import re
 import stat
 import time
 import json
@@ -8,21 +9,60 @@ from subprocess import Popen, PIPE, CalledProcessError, TimeoutExpired, run as r
 import shutil
 import codecs
 import collections
+import contextlib
 import datetime
+import itertools
 import logging
 
 import six
 import pexpect
+import ptyprocess
 
 import ansible_runner.plugins
 
-from .utils import OutputEventFilter, cleanup_artifact_dir, ensure_str, collect_new_events
+from .utils import (
+    OutputEventFilter,
+    EventHighWaterMark,
+    cleanup_artifact_dir,
+    ensure_str,
+    collect_new_events,
+    DEFAULT_COALESCE_LINES,
+    DEFAULT_COALESCE_BYTES,
+    DEFAULT_COALESCE_INTERVAL,
+)
+from .utils import json_codec
+from .utils.blob_store import BlobStore, BLOB_DIRNAME
+from .utils.durability import DurabilityPolicy, DURABILITY_PER_EVENT, DEFAULT_COMMIT_INTERVAL, DEFAULT_COMMIT_BATCH
+from .utils.event_writer import EventWriter, DEFAULT_QUEUE_SIZE, BACKPRESSURE_BLOCK
+from .utils.event_channel import EventChannel, EVENT_FRAMING_BINARY
+from .utils.event_contexts import ContextReader, ContextWriter
+from .utils.event_index import EventIndex, EVENT_INDEX_FILENAME
+from .utils.event_watch import event_watcher
+from .utils.live_stats import LiveStats
+from .utils.timing_profile import TimingProfile, TIMING_PROFILE_FILENAME, DEFAULT_SLOWEST
+from .utils.journal import EventJournal, collect_journal_events, journal_segments, DEFAULT_SEGMENT_SIZE, DEFAULT_FLUSH_INTERVAL
 from .exceptions import CallbackError, AnsibleRunnerException
 from ansible_runner.output import debug
 
 logger = logging.getLogger('ansible-runner')
 
 
+class PassFdsSpawn(pexpect.spawn):
+    '''
+    pexpect.spawn that keeps the file descriptors listed in ``pass_fds`` open
+    in the child process, which needs ptyprocess 0.7 or later
+    '''
+
+    def __init__(self, *args, **kwargs):
+        self.pass_fds = kwargs.pop('pass_fds', ())
+        super(PassFdsSpawn, self).__init__(*args, **kwargs)
+
+    def _spawnpty(self, args, **kwargs):
+        if not self.pass_fds:
+            return super(PassFdsSpawn, self)._spawnpty(args, **kwargs)
+        return ptyprocess.PtyProcess.spawn(args, pass_fds=self.pass_fds, **kwargs)
+
+
 class Runner(object):
 
     def __init__(self, config, cancel_callback=None, remove_partials=True, event_handler=None,
@@ -49,6 +89,101 @@ class Runner(object):
         self.process_isolation = self.config.process_isolation if hasattr(self.config, 'process_isolation') else None
         self.process_isolation_path_actual = self.config.process_isolation_path_actual if hasattr(self.config, 'process_isolation_path_actual') else None
 
+        self.event_journal = self.config.event_journal if hasattr(self.config, 'event_journal') else False
+        self.event_journal_segment_size = self.config.event_journal_segment_size \
+            if hasattr(self.config, 'event_journal_segment_size') else DEFAULT_SEGMENT_SIZE
+        self.event_journal_flush_interval = self.config.event_journal_flush_interval \
+            if hasattr(self.config, 'event_journal_flush_interval') else DEFAULT_FLUSH_INTERVAL
+        self._journal = None
+
+        self.event_pipe = self.config.event_pipe if hasattr(self.config, 'event_pipe') else True
+        self.event_framing = self.config.event_framing if hasattr(self.config, 'event_framing') else EVENT_FRAMING_BINARY
+        self.event_passthrough = self.config.event_passthrough if hasattr(self.config, 'event_passthrough') else False
+        self._event_channel = None
+
+        self.event_writer = self.config.event_writer if hasattr(self.config, 'event_writer') else False
+        self.event_writer_queue_size = self.config.event_writer_queue_size \
+            if hasattr(self.config, 'event_writer_queue_size') else DEFAULT_QUEUE_SIZE
+        self.event_writer_backpressure = self.config.event_writer_backpressure \
+            if hasattr(self.config, 'event_writer_backpressure') else BACKPRESSURE_BLOCK
+        self._event_writer = None
+
+        self.event_durability = self.config.event_durability if hasattr(self.config, 'event_durability') else None
+        self.event_durability_interval = self.config.event_durability_interval \
+            if hasattr(self.config, 'event_durability_interval') else DEFAULT_COMMIT_INTERVAL
+        self.event_durability_batch = self.config.event_durability_batch \
+            if hasattr(self.config, 'event_durability_batch') else DEFAULT_COMMIT_BATCH
+        self.event_fsync = self.config.event_fsync if hasattr(self.config, 'event_fsync') else False
+
+        self.event_coalesce_verbose = self.config.event_coalesce_verbose if hasattr(self.config, 'event_coalesce_verbose') else False
+        self.event_coalesce_lines = self.config.event_coalesce_lines \
+            if hasattr(self.config, 'event_coalesce_lines') else DEFAULT_COALESCE_LINES
+        self.event_coalesce_bytes = self.config.event_coalesce_bytes \
+            if hasattr(self.config, 'event_coalesce_bytes') else DEFAULT_COALESCE_BYTES
+        self.event_coalesce_interval = self.config.event_coalesce_interval \
+            if hasattr(self.config, 'event_coalesce_interval') else DEFAULT_COALESCE_INTERVAL
+
+        self.event_compact_context = self.config.event_compact_context if hasattr(self.config, 'event_compact_context') else False
+        self._contexts = None
+
+        self._event_index = None
+        self._live_stats = LiveStats()
+        self.timing_profile_slowest = self.config.timing_profile_slowest \
+            if hasattr(self.config, 'timing_profile_slowest') else DEFAULT_SLOWEST
+        self._timing_profile = TimingProfile(self.timing_profile_slowest)
+        self._blobs = None
+
+    def _durability_policy(self):
+        '''
+        Returns a new commit policy for an artifact file handle, or None to keep
+        the default of flushing stdout per line and the event journal periodically
+        '''
+        if self.event_durability is None:
+            return None
+        return DurabilityPolicy(self.event_durability,
+                                interval=self.event_durability_interval,
+                                batch=self.event_durability_batch,
+                                fsync=self.event_fsync)
+
+    def _can_pass_through(self):
+        '''
+        Events are only passed through still encoded when nothing but Runner
+        itself needs them decoded
+        '''
+        if not self.event_passthrough or self.event_compact_context or ansible_runner.plugins:
+            return False
+        return self.event_handler is None or getattr(self.event_handler, 'encoded_events', False)
+
+    @staticmethod
+    def _bytes_pattern(pattern):
+        '''
+        Returns an ``expect_passwords`` pattern that matches the bytes read from the pexpect child
+        '''
+        if isinstance(pattern, six.text_type):
+            return pattern.encode('utf-8')
+        if isinstance(getattr(pattern, 'pattern', None), six.text_type):
+            return re.compile(pattern.pattern.encode('utf-8'), pattern.flags & ~re.UNICODE)
+        return pattern
+
+    def queue_event(self, event_data):
+        '''
+        Invoked by the output filters instead of ``event_callback`` when the
+        background event writer is enabled
+        '''
+        self.last_stdout_update = time.time()
+        # the filter keeps changing its dict, e.g. for the next stdout chunk of the same event
+        self._event_writer.put(dict(event_data))
+
+    @property
+    def event_writer_metrics(self):
+        '''
+        Returns queue depth and backpressure counters of the background event writer,
+        or None if it is not in use
+        '''
+        if self._event_writer is None:
+            return None
+        return self._event_writer.metrics
+
     def event_callback(self, event_data):
         '''
         Invoked for every Ansible event to collect stdout with the event data and store it for
@@ -66,43 +201,94 @@ class Runner(object):
                                                              event_data['uuid']))
             try:
                 event_data.update(dict(runner_ident=str(self.config.ident)))
-                try:
-                    with codecs.open(partial_filename, 'r', encoding='utf-8') as read_file:
-                        partial_event_data = json.load(read_file)
+                partial_event_data = None
+                encoded_event = None
+                # events parsed from callback tokens carry nothing but the uuid and
+                # stdout details, verbose events are generated without any partial data
+                if self._event_channel is not None and 'event' not in event_data:
+                    partial_event_data = self._event_channel.pop(event_data['uuid'], partial_filename)
+                if isinstance(partial_event_data, tuple):
+                    # passed through: only a summary of the event is decoded, the
+                    # stdout details are spliced into the encoded event
+                    partial_event_data, encoded_partial = partial_event_data
+                    encoded_event = json_codec.merge_encoded(
+                        dict((key, value) for key, value in event_data.items() if key != 'uuid'), encoded_partial)
+                if partial_event_data is not None:
                     event_data.update(partial_event_data)
-                    if self.remove_partials:
-                        os.remove(partial_filename)
-                except IOError as e:
-                    msg = "Failed to open ansible stdout callback plugin partial data" \
-                          " file {} with error {}".format(partial_filename, str(e))
-                    debug(msg)
-                    if self.config.check_job_event_data:
-                        raise AnsibleRunnerException(msg)
+                else:
+                    try:
+                        with codecs.open(partial_filename, 'r', encoding='utf-8') as read_file:
+                            partial_event_data = json_codec.loads(read_file.read())
+                        event_data.update(partial_event_data)
+                        if self.remove_partials:
+                            os.remove(partial_filename)
+                    except IOError as e:
+                        msg = "Failed to open ansible stdout callback plugin partial data" \
+                              " file {} with error {}".format(partial_filename, str(e))
+                        debug(msg)
+                        if self.config.check_job_event_data:
+                            raise AnsibleRunnerException(msg)
 
                 # prefer 'created' from partial data, but verbose events set time here
                 if 'created' not in event_data:
                     event_data['created'] = datetime.datetime.utcnow().isoformat()
 
                 if self.event_handler is not None:
-                    should_write = self.event_handler(event_data)
+                    should_write = self.event_handler(encoded_event if encoded_event is not None else event_data)
                 else:
                     should_write = True
                 for plugin in ansible_runner.plugins:
                     ansible_runner.plugins[plugin].event_handler(self.config, event_data)
-                if should_write:
+                self._live_stats.update(event_data)
+                self._timing_profile.update(event_data)
+                stored_event_data = event_data
+                if should_write and self._contexts is not None:
+                    stored_event_data = self._contexts.compact(event_data)
+                if should_write and self._journal is not None:
+                    locator = self._journal.write(stored_event_data, encoded=encoded_event)
+                    if self._event_index is not None:
+                        self._event_index.add(event_data, locator)
+                elif should_write:
                     temporary_filename = full_filename + '.tmp'
                     with codecs.open(temporary_filename, 'w', encoding='utf-8') as write_file:
                         os.chmod(temporary_filename, stat.S_IRUSR | stat.S_IWUSR)
-                        json.dump(event_data, write_file)
+                        write_file.write(json_codec.dumps(stored_event_data) if encoded_event is None else encoded_event.decode('utf-8'))
+                        if self.event_fsync and self.event_durability == DURABILITY_PER_EVENT:
+                            write_file.flush()
+                            os.fsync(write_file.fileno())
                     os.rename(temporary_filename, full_filename)
+                    if self._event_index is not None:
+                        self._event_index.add(event_data, os.path.basename(full_filename))
             except IOError as e:
                 debug("Failed writing event data: {}".format(e))
 
+    def _close_event_stores(self):
+        '''
+        Closes the event writer and what events are stored with. An error of
+        the event handler the writer re-raises is only raised once the rest
+        is closed, so the events buffered until then are kept.
+        '''
+        with contextlib.ExitStack() as stack:
+            for attribute in ('_contexts', '_journal', '_event_channel'):
+                if getattr(self, attribute) is not None:
+                    stack.callback(self._close_attribute, attribute)
+            if self._event_writer is not None:
+                try:
+                    self._event_writer.close()
+                finally:
+                    debug('event writer: {}'.format(self._event_writer.metrics))
+
+    def _close_attribute(self, attribute):
+        getattr(self, attribute).close()
+        setattr(self, attribute, None)
+
     def status_callback(self, status):
         self.status = status
         status_data = {'status': status, 'runner_ident': str(self.config.ident)}
         if status == 'starting':
             status_data.update({'command': self.config.command, 'env': self.config.env, 'cwd': self.config.cwd})
+        if self._live_stats.events:
+            status_data['stats'] = self.live_stats
         for plugin in ansible_runner.plugins:
             ansible_runner.plugins[plugin].status_handler(self.config, status_data)
         if self.status_handler is not None:
@@ -133,6 +319,14 @@ class Runner(object):
         job_events_path = os.path.join(self.config.artifact_dir, 'job_events')
         if not os.path.exists(job_events_path):
             os.mkdir(job_events_path, 0o700)
+        self._event_index = EventIndex()
+        if self.event_compact_context:
+            self._contexts = ContextWriter(job_events_path)
+        if self.event_journal:
+            self._journal = EventJournal(job_events_path,
+                                         segment_size=self.event_journal_segment_size,
+                                         flush_interval=self.event_journal_flush_interval,
+                                         durability=self._durability_policy())
 
         command = self.config.command
         with codecs.open(command_filename, 'w', encoding='utf-8') as f:
@@ -151,10 +345,35 @@ class Runner(object):
         else:
             suppress_ansible_output = False
 
-        stdout_handle = codecs.open(stdout_filename, 'w', encoding='utf-8')
-        stdout_handle = OutputEventFilter(stdout_handle, self.event_callback, suppress_ansible_output, output_json=self.config.json_mode)
+        if self.runner_mode == 'pexpect':
+            # pexpect hands over bytes which are only decoded where an event needs them
+            stdout_handle = open(stdout_filename, 'wb')
+        else:
+            stdout_handle = codecs.open(stdout_filename, 'w', encoding='utf-8')
+        # json output prints each event once it was handled, which has to happen
+        # before the next output is read
+        if self.event_writer and not self.config.json_mode:
+            self._event_writer = EventWriter(self.event_callback,
+                                             queue_size=self.event_writer_queue_size,
+                                             backpressure=self.event_writer_backpressure,
+                                             spill_dir=self.config.artifact_dir)
+            event_callback = self.queue_event
+        else:
+            event_callback = self.event_callback
+
+        filter_kwargs = dict(
+            output_json=self.config.json_mode,
+            counter=itertools.count(1),
+            coalesce_verbose=self.event_coalesce_verbose,
+            coalesce_lines=self.event_coalesce_lines,
+            coalesce_bytes=self.event_coalesce_bytes,
+            coalesce_interval=self.event_coalesce_interval,
+        )
+        stdout_handle = OutputEventFilter(stdout_handle, event_callback, suppress_ansible_output,
+                                          durability=self._durability_policy(), **filter_kwargs)
         stderr_handle = codecs.open(stderr_filename, 'w', encoding='utf-8')
-        stderr_handle = OutputEventFilter(stderr_handle, self.event_callback, suppress_ansible_output, output_json=self.config.json_mode)
+        stderr_handle = OutputEventFilter(stderr_handle, event_callback, suppress_ansible_output,
+                                          durability=self._durability_policy(), **filter_kwargs)
 
         if self.runner_mode == 'pexpect' and not isinstance(self.config.expect_passwords, collections.OrderedDict):
             # We iterate over `expect_passwords.keys()` and
@@ -163,7 +382,7 @@ class Runner(object):
             # enforce usage of an OrderedDict so that the ordering of elements in
             # `keys()` matches `values()`.
             expect_passwords = collections.OrderedDict(self.config.expect_passwords)
-            password_patterns = list(expect_passwords.keys())
+            password_patterns = [self._bytes_pattern(pattern) for pattern in expect_passwords.keys()]
             password_values = list(expect_passwords.values())
 
         # pexpect needs all env vars to be utf-8 encoded bytes
@@ -195,6 +414,14 @@ class Runner(object):
             for k, v in pexpect_env.items()
         }
 
+        # Hand the display callback a pipe for partial event data, containers
+        # can't inherit it and keep using the partial files in the artifact dir
+        pass_fds = ()
+        if self.event_pipe and not self.config.containerized:
+            self._event_channel = EventChannel(framing=self.event_framing, passthrough=self._can_pass_through())
+            pass_fds = (self._event_channel.write_fd,)
+            env.update(self._event_channel.env)
+
         # Prepare to collect performance data
         if self.resource_profiling:
             cgroup_path = '{0}/{1}'.format(self.config.resource_profiling_base_cgroup, self.config.ident)
@@ -256,6 +483,8 @@ class Runner(object):
                 }
                 if subprocess_timeout is not None:
                     kwargs.update({'timeout': subprocess_timeout})
+                if pass_fds:
+                    kwargs.update({'pass_fds': pass_fds})
 
                 proc_out = run_subprocess(command, **kwargs)
 
@@ -295,17 +524,20 @@ class Runner(object):
                     stderr_response = stderr_response.decode()
                 stderr_handle.write(stderr_response)
         else:
+            spawn_kwargs = {}
+            if pass_fds:
+                spawn_kwargs['pass_fds'] = pass_fds
             try:
-                child = pexpect.spawn(
+                child = (PassFdsSpawn if pass_fds else pexpect.spawn)(
                     command[0],
                     command[1:],
                     cwd=cwd,
                     env=env,
                     ignore_sighup=True,
-                    encoding='utf-8',
-                    codec_errors='replace',
+                    encoding=None,
                     echo=False,
                     use_poll=self.config.pexpect_use_poll,
+                    **spawn_kwargs
                 )
                 child.logfile_read = stdout_handle
             except pexpect.exceptions.ExceptionPexpect as e:
@@ -317,20 +549,29 @@ class Runner(object):
                     close=lambda: None,
                 )
 
-                def _decode(x):
-                    return x.decode('utf-8') if six.PY2 else x
-
                 # create the events directory (the callback plugin won't run, so it
                 # won't get created)
                 events_directory = os.path.join(self.config.artifact_dir, 'job_events')
                 if not os.path.exists(events_directory):
                     os.mkdir(events_directory, 0o700)
-                stdout_handle.write(_decode(str(e)))
-                stdout_handle.write(_decode('\n'))
+                stdout_handle.write(str(e).encode('utf-8'))
+                stdout_handle.write(b'\n')
+
+            if self._event_channel is not None:
+                self._event_channel.close_write_end()
+
+            # wake up in time to commit what was buffered while the child is quiet
+            expect_timeout = self.config.pexpect_timeout
+            tickers = [writer for writer in (self._journal, stdout_handle, stderr_handle)
+                       if writer is not None and writer.tick_interval is not None]
+            for ticker in tickers:
+                expect_timeout = min(expect_timeout, ticker.tick_interval)
 
             job_start = time.time()
             while child.isalive():
-                result_id = child.expect(password_patterns, timeout=self.config.pexpect_timeout, searchwindowsize=100)
+                result_id = child.expect(password_patterns, timeout=expect_timeout, searchwindowsize=100)
+                for ticker in tickers:
+                    ticker.tick()
                 password = password_values[result_id]
                 if password is not None:
                     child.sendline(password)
@@ -360,6 +601,14 @@ class Runner(object):
             child.close()
             self.rc = child.exitstatus if not (self.timed_out or self.canceled) else 254
 
+        self._close_event_stores()
+
+        if self._event_index:
+            self._event_index.dump(os.path.join(self.config.artifact_dir, EVENT_INDEX_FILENAME))
+
+        if self._timing_profile.results:
+            self._timing_profile.dump(os.path.join(self.config.artifact_dir, TIMING_PROFILE_FILENAME))
+
         if self.canceled:
             self.status_callback('canceled')
         elif self.rc == 0 and not self.timed_out:
@@ -476,9 +725,10 @@ class Runner(object):
                }
            }
         '''
-        # collection of all the events that were yielded
-        old_events = {}
+        # how far into the job_events directory the yielded events go
+        high_water_mark = EventHighWaterMark()
         event_path = os.path.join(self.config.artifact_dir, 'job_events')
+        contexts = ContextReader(event_path)
 
         # Wait for events dir to be created
         now = datetime.datetime.now()
@@ -488,15 +738,41 @@ class Runner(object):
             if wait_time.total_seconds() > 60:
                 raise AnsibleRunnerException("events directory is missing: %s" % event_path)
 
-        while self.status == "running":
-            for event, old_evnts in collect_new_events(event_path, old_events):
-                old_events = old_evnts
-                yield event
+        # sleep until new events land instead of re-listing the directory in a busy loop
+        watcher = event_watcher(event_path)
+        try:
+            if self.event_journal or journal_segments(event_path):
+                position = None
+                while self.status == "running":
+                    found = False
+                    for event, position in collect_journal_events(event_path, position):
+                        found = True
+                        yield contexts.expand(event)
+                    if found:
+                        watcher.reset()
+                    else:
+                        watcher.wait()
+
+                # collect new events that were written after the playbook has finished
+                for event, position in collect_journal_events(event_path, position):
+                    yield contexts.expand(event)
+                return
+
+            while self.status == "running":
+                found = False
+                for event, high_water_mark in collect_new_events(event_path, high_water_mark):
+                    found = True
+                    yield contexts.expand(event)
+                if found:
+                    watcher.reset()
+                else:
+                    watcher.wait()
 
-        # collect new events that were written after the playbook has finished
-        for event, old_evnts in collect_new_events(event_path, old_events):
-            old_events = old_evnts
-            yield event
+            # collect new events that were written after the playbook has finished
+            for event, high_water_mark in collect_new_events(event_path, high_water_mark):
+                yield contexts.expand(event)
+        finally:
+            watcher.close()
 
     @property
     def stats(self):
@@ -506,8 +782,13 @@ class Runner(object):
         Example:
             {'dark': {}, 'failures': {}, 'skipped': {}, 'ok': {u'localhost': 2}, 'processed': {u'localhost': 1}}
         '''
-        last_event = list(filter(lambda x: 'event' in x and x['event'] == 'playbook_on_stats',
-                                 self.events))
+        event_index = self.event_index
+        if event_index is not None:
+            event_path = os.path.join(self.config.artifact_dir, 'job_events')
+            last_event = list(event_index.events(event_path, event='playbook_on_stats'))
+        else:
+            last_event = list(filter(lambda x: 'event' in x and x['event'] == 'playbook_on_stats',
+                                     self.events))
         if not last_event:
             return None
         last_event = last_event[0]['event_data']
@@ -520,14 +801,60 @@ class Runner(object):
                     processed=last_event.get('processed', {}),
                     changed=last_event.get('changed', {}))
 
+    @property
+    def live_stats(self):
+        '''
+        Returns per-host counters kept up to date while the run is in progress, in the same
+        shape as ``stats``, without reading the artifact directory. Once the play recap was
+        received they hold its totals.
+        '''
+        return self._live_stats.snapshot()
+
+    @property
+    def timing_profile(self):
+        '''
+        Returns the durations of the task results received so far: per task and per host the number of
+        results, their total, minimum, maximum and p50/p95/p99 durations in seconds, the hosts every task
+        took the longest on and the hosts with the most time spent in tasks. Once the run finished the same
+        is in the ``timing_profile.json`` artifact.
+        '''
+        return self._timing_profile.snapshot()
+
     def host_events(self, host):
         '''
         Given a host name, this will return all task events executed on that host
         '''
+        event_index = self.event_index
+        if event_index is not None:
+            return event_index.events(os.path.join(self.config.artifact_dir, 'job_events'), host=host)
         all_host_events = filter(lambda x: 'event_data' in x and 'host' in x['event_data'] and x['event_data']['host'] == host,
                                  self.events)
         return all_host_events
 
+    @property
+    def event_index(self):
+        '''
+        Returns the :py:class:`ansible_runner.utils.event_index.EventIndex` of the stored job events
+        once the run has finished (or the one persisted in the artifact directory by an earlier run),
+        None while the run is in progress or when no index is available
+        '''
+        if self.status in ('starting', 'running'):
+            return None
+        if self._event_index is None:
+            self._event_index = EventIndex.load(os.path.join(self.config.artifact_dir, EVENT_INDEX_FILENAME))
+        return self._event_index
+
+    @property
+    def blobs(self):
+        '''
+        Returns the :py:class:`ansible_runner.utils.blob_store.BlobStore` of the payloads events refer to
+        when the ``event_blob_threshold`` setting moved them out of the events. Payloads are only read
+        when a reference is resolved, ``runner.blobs.resolve(event)`` returns the event with all of them.
+        '''
+        if self._blobs is None:
+            self._blobs = BlobStore(os.path.join(self.config.artifact_dir, BLOB_DIRNAME))
+        return self._blobs
+
     def kill_container(self):
         '''
         Internal method to terminate a container being used for job isolation
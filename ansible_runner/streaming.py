@@ -1,4 +1,3 @@
-import codecs
 import json
 import os
 import stat
@@ -16,7 +15,12 @@ from ansible_runner.exceptions import ConfigurationError
 from ansible_runner.loader import ArtifactLoader
 import ansible_runner.plugins
 from ansible_runner.utils import register_for_cleanup
-from ansible_runner.utils.streaming import stream_dir, unstream_dir
+from ansible_runner.utils import json_codec
+from ansible_runner.utils.durability import DurabilityPolicy, DURABILITY_PER_EVENT, DEFAULT_COMMIT_INTERVAL, DEFAULT_COMMIT_BATCH
+from ansible_runner.utils.event_contexts import ContextWriter
+from ansible_runner.utils.event_index import EventIndex, EVENT_INDEX_FILENAME
+from ansible_runner.utils.journal import EventJournal, JournalTicker, DEFAULT_SEGMENT_SIZE, DEFAULT_FLUSH_INTERVAL
+from ansible_runner.utils.streaming import stream_dir, unstream_dir, BINARY, ZIPSTREAM
 
 
 class UUIDEncoder(json.JSONEncoder):
@@ -38,20 +42,27 @@ class Transmitter(object):
         self._output = _output
         self.private_data_dir = os.path.abspath(kwargs.pop('private_data_dir'))
         self.only_transmit_kwargs = kwargs.pop('only_transmit_kwargs', False)
+        self.zipstream = kwargs.pop('zipstream', False)
+        self.binary_payload = kwargs.pop('binary_payload', False)
+        self.text_only = kwargs.pop('text_only', False)
         self.kwargs = kwargs
 
         self.status = "unstarted"
         self.rc = None
 
     def run(self):
+        # the stream formats the process side of this installation reads,
+        # ignored by workers that don't know them
+        accept = [ZIPSTREAM] if self.text_only else [ZIPSTREAM, BINARY]
         self._output.write(
-            json.dumps({'kwargs': self.kwargs}, cls=UUIDEncoder).encode('utf-8')
+            json.dumps({'kwargs': self.kwargs, 'accept': accept}, cls=UUIDEncoder).encode('utf-8')
         )
         self._output.write(b'\n')
         self._output.flush()
 
         if not self.only_transmit_kwargs:
-            stream_dir(self.private_data_dir, self._output)
+            stream_dir(self.private_data_dir, self._output, streaming=self.zipstream,
+                       binary=self.binary_payload and not self.text_only)
 
         self._output.write(json.dumps({'eof': True}).encode('utf-8'))
         self._output.write(b'\n')
@@ -71,6 +82,7 @@ class Worker(object):
 
         self.kwargs = kwargs
         self.job_kwargs = None
+        self.accept = []
 
         private_data_dir = kwargs.get('private_data_dir')
         if private_data_dir is None:
@@ -104,9 +116,10 @@ class Worker(object):
 
             if 'kwargs' in data:
                 self.job_kwargs = self.update_paths(data['kwargs'])
-            elif 'zipfile' in data:
+                self.accept = data.get('accept', [])
+            elif 'zipfile' in data or ZIPSTREAM in data:
                 try:
-                    unstream_dir(self._input, data['zipfile'], self.private_data_dir)
+                    unstream_dir(self._input, data.get('zipfile'), self.private_data_dir, binary=data.get(BINARY, False))
                 except Exception:
                     self.status_handler({
                         'status': 'error',
@@ -141,12 +154,16 @@ class Worker(object):
         self._output.flush()
 
     def event_handler(self, event_data):
-        self._output.write(json.dumps(event_data).encode('utf-8'))
-        self._output.write(b'\n')
+        if not isinstance(event_data, bytes):
+            event_data = json_codec.dumpb(event_data)
+        self._output.write(event_data + b'\n')
         self._output.flush()
 
+    # with event_passthrough Runner hands over events it didn't decode as JSON bytes
+    event_handler.encoded_events = True
+
     def artifacts_handler(self, artifact_dir):
-        stream_dir(artifact_dir, self._output)
+        stream_dir(artifact_dir, self._output, streaming=ZIPSTREAM in self.accept, binary=BINARY in self.accept)
         self._output.flush()
 
     def finished_callback(self, runner_obj):
@@ -191,6 +208,9 @@ class Processor(object):
 
         self.status = "unstarted"
         self.rc = None
+        self._journal = None
+        self._contexts = None
+        self._event_index = EventIndex()
 
     def status_callback(self, status_data):
         self.status = status_data['status']
@@ -218,14 +238,32 @@ class Processor(object):
             should_write = True
         for plugin in ansible_runner.plugins:
             ansible_runner.plugins[plugin].event_handler(self.config, event_data)
-        if should_write:
-            with codecs.open(full_filename, 'w', encoding='utf-8') as write_file:
+        stored_event_data = event_data
+        if should_write and self._contexts is not None:
+            stored_event_data = self._contexts.compact(event_data)
+        if should_write and self._journal is not None:
+            self._event_index.add(event_data, self._journal.write(stored_event_data))
+        elif should_write:
+            with open(full_filename, 'wb') as write_file:
                 os.chmod(full_filename, stat.S_IRUSR | stat.S_IWUSR)
-                json.dump(event_data, write_file)
+                write_file.write(json_codec.dumpb(stored_event_data))
+                if self.config.settings.get('event_fsync', False) and self.config.settings.get('event_durability') == DURABILITY_PER_EVENT:
+                    write_file.flush()
+                    os.fsync(write_file.fileno())
+            self._event_index.add(event_data, os.path.basename(full_filename))
+
+    def _durability_policy(self):
+        settings = self.config.settings
+        if settings.get('event_durability') is None:
+            return None
+        return DurabilityPolicy(settings['event_durability'],
+                                interval=settings.get('event_durability_interval', DEFAULT_COMMIT_INTERVAL),
+                                batch=settings.get('event_durability_batch', DEFAULT_COMMIT_BATCH),
+                                fsync=settings.get('event_fsync', False))
 
     def artifacts_callback(self, artifacts_data):
-        length = artifacts_data['zipfile']
-        unstream_dir(self._input, length, self.artifact_dir)
+        length = artifacts_data.get('zipfile')
+        unstream_dir(self._input, length, self.artifact_dir, binary=artifacts_data.get(BINARY, False))
 
         if self.artifacts_handler is not None:
             self.artifacts_handler(self.artifact_dir)
@@ -234,24 +272,49 @@ class Processor(object):
         job_events_path = os.path.join(self.artifact_dir, 'job_events')
         if not os.path.exists(job_events_path):
             os.makedirs(job_events_path, 0o700, exist_ok=True)
+        if self.config.settings.get('event_journal', False):
+            self._journal = EventJournal(
+                job_events_path,
+                segment_size=self.config.settings.get('event_journal_segment_size', DEFAULT_SEGMENT_SIZE),
+                flush_interval=self.config.settings.get('event_journal_flush_interval', DEFAULT_FLUSH_INTERVAL),
+                durability=self._durability_policy())
+        # reading the worker stream blocks, flush in time from another thread
+        ticker = JournalTicker(self._journal) if self._journal is not None else None
+        if ticker is not None:
+            ticker.start()
+        if self.config.settings.get('event_compact_context', False):
+            self._contexts = ContextWriter(job_events_path)
 
         while True:
             try:
                 line = self._input.readline()
-                data = json.loads(line)
+                data = json_codec.loads(line)
             except (json.decoder.JSONDecodeError, IOError):
                 self.status_callback({'status': 'error', 'job_explanation': 'Failed to JSON parse a line from worker stream.'})
                 break
 
             if 'status' in data:
                 self.status_callback(data)
-            elif 'zipfile' in data:
+            elif 'zipfile' in data or ZIPSTREAM in data:
                 self.artifacts_callback(data)
             elif 'eof' in data:
                 break
             else:
                 self.event_callback(data)
 
+        if ticker is not None:
+            ticker.stop()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+        if self._contexts is not None:
+            self._contexts.close()
+            self._contexts = None
+
+        if self._event_index:
+            self._event_index.dump(os.path.join(self.artifact_dir, EVENT_INDEX_FILENAME))
+
         if self.finished_callback is not None:
             self.finished_callback(self)
 
@@ -13,19 +13,20 @@ import base64
 import threading
 import pipes
 import uuid
-import codecs
 import atexit
+import itertools
 import signal
+import time
 
 from distutils.spawn import find_executable
 
 from ansible_runner.exceptions import ConfigurationError
+from ansible_runner.utils import json_codec
 
 try:
     from collections.abc import Iterable, MutableMapping
 except ImportError:
     from collections import Iterable, MutableMapping
-from io import StringIO
 from six import string_types, PY2, PY3, text_type, binary_type
 
 
@@ -237,123 +238,337 @@ def dump_artifacts(kwargs):
             kwargs.pop(key)
 
 
-def collect_new_events(event_path, old_events):
+EVENT_FILENAME_RE = re.compile(r'^([0-9]+)-.+json$')
+
+
+class EventHighWaterMark(object):
+    '''
+    Progress of the 'events' generator through a ``job_events`` directory.
+
+    Events are stored in counter order, so only the next expected counter is
+    tracked. Counters skipped because an event was not written (e.g. filtered
+    by an ``event_handler``) are kept in a small pending set for one more
+    collection pass, in case they were still being written, and then given up.
+    '''
+
+    def __init__(self):
+        self.next_counter = 1
+        self.pending = set()
+        self._gaps = set()
+
+    def is_new(self, counter):
+        return counter >= self.next_counter and counter not in self.pending
+
+    def mark(self, counter):
+        self.pending.add(counter)
+        self._advance()
+
+    def _advance(self):
+        while self.next_counter in self.pending:
+            self.pending.remove(self.next_counter)
+            self.next_counter += 1
+
+    def end_pass(self):
+        # gaps that were already there on the previous pass were never written
+        while self.next_counter in self._gaps:
+            self.next_counter += 1
+            self._advance()
+        if self.pending:
+            self._gaps = set(range(self.next_counter, max(self.pending))) - self.pending
+        else:
+            self._gaps = set()
+
+
+def collect_new_events(event_path, high_water_mark):
     '''
     Collect new events for the 'events' generator property
+
+    ``high_water_mark`` is an :py:class:`EventHighWaterMark` that is updated
+    as events are yielded, pass the same one to every call
     '''
-    dir_events = os.listdir(event_path)
     dir_events_actual = []
-    for each_file in dir_events:
-        if re.match("^[0-9]+-.+json$", each_file):
-            if '-partial' not in each_file and each_file not in old_events.keys():
-                dir_events_actual.append(each_file)
-    dir_events_actual.sort(key=lambda filenm: int(filenm.split("-", 1)[0]))
-    for event_file in dir_events_actual:
-        with codecs.open(os.path.join(event_path, event_file), 'r', encoding='utf-8') as event_file_actual:
+    for each_file in os.listdir(event_path):
+        match = EVENT_FILENAME_RE.match(each_file)
+        if match and '-partial' not in each_file:
+            counter = int(match.group(1))
+            if high_water_mark.is_new(counter):
+                dir_events_actual.append((counter, each_file))
+    dir_events_actual.sort()
+    for counter, event_file in dir_events_actual:
+        with open(os.path.join(event_path, event_file), 'rb') as event_file_actual:
             try:
-                event = json.load(event_file_actual)
+                event = json_codec.loads(event_file_actual.read())
             except ValueError:
                 break
 
-        old_events[event_file] = True
-        yield event, old_events
+        high_water_mark.mark(counter)
+        yield event, high_water_mark
+    else:
+        high_water_mark.end_pass()
+
+
+class EventTokenSyntax(object):
+    '''
+    Delimiters of the job event tokens embedded in stdout, for either str or bytes data
+    '''
+
+    def __init__(self, empty):
+        def convert(value):
+            return value.encode('ascii') if isinstance(empty, bytes) else value
+
+        self.empty = empty
+        self.newline = convert('\n')
+        self.token = convert('\x1b[K')
+        self.chunk_re = re.compile(convert(r'[A-Za-z0-9+/=]+\x1b\[\d+D'))
+        self.chunk_end_re = re.compile(convert(r'\x1b\[\d+D'))
+        # what may still become an event data chunk or the closing token with more data
+        self.chunk_prefix_re = re.compile(convert(r'[A-Za-z0-9+/=]*(?:\x1b(?:\[\d*)?)?\Z'))
+
+
+DEFAULT_COALESCE_LINES = 1000
+DEFAULT_COALESCE_BYTES = 64 * 1024
+DEFAULT_COALESCE_INTERVAL = 1.0
 
 
 class OutputEventFilter(object):
     '''
     File-like object that looks for encoded job events in stdout data.
+
+    Data can be written as str, or as bytes when the handle is a binary file.
+    Bytes are only decoded where the stdout of an event is needed as str.
+
+    With ``coalesce_verbose`` consecutive lines of output outside of event
+    context are emitted as a single ``verbose`` event once ``coalesce_lines``
+    lines or ``coalesce_bytes`` characters were collected, output arrives
+    ``coalesce_interval`` seconds after the first of them or another event
+    starts.
     '''
 
-    EVENT_DATA_RE = re.compile(r'\x1b\[K((?:[A-Za-z0-9+/=]+\x1b\[\d+D)+)\x1b\[K')
+    TEXT_SYNTAX = EventTokenSyntax('')
+    BYTES_SYNTAX = EventTokenSyntax(b'')
 
     def __init__(self, handle, event_callback,
-                 suppress_ansible_output=False, output_json=False):
+                 suppress_ansible_output=False, output_json=False, durability=None, counter=None,
+                 coalesce_verbose=False, coalesce_lines=DEFAULT_COALESCE_LINES, coalesce_bytes=DEFAULT_COALESCE_BYTES,
+                 coalesce_interval=DEFAULT_COALESCE_INTERVAL):
         self._event_callback = event_callback
+        self._durability = durability
         self._counter = 0
+        # filters for the stdout and stderr of the same run share their counter
+        self._counters = counter if counter is not None else itertools.count(1)
         self._start_line = 0
         self._handle = handle
-        self._buffer = StringIO()
-        self._last_chunk = ''
+        # stdout received outside of event tokens that was not emitted yet
+        self._text = []
+        # escaped chunks of the event token being received, None outside of a token
+        self._token = None
+        # trailing data that can only be told apart once more data arrives
+        self._tail = ''
+        self._syntax = self.TEXT_SYNTAX
         self._current_event_data = None
         self.output_json = output_json
         self.suppress_ansible_output = suppress_ansible_output
+        self.coalesce_verbose = coalesce_verbose
+        self.coalesce_lines = coalesce_lines
+        self.coalesce_bytes = coalesce_bytes
+        self.coalesce_interval = coalesce_interval
+        # verbose lines waiting to be emitted as one event
+        self._verbose_lines = []
+        self._verbose_size = 0
+        self._verbose_since = None
 
     def flush(self):
-        self._handle.flush()
+        # pexpect flushes its logfile after every read, what is committed
+        # is up to the durability policy
+        if self._durability is not None:
+            self._durability.tick(self._handle)
+        else:
+            self._handle.flush()
+
+    def _commit(self):
+        if self._durability is not None:
+            self._durability.commit(self._handle)
+        else:
+            self._handle.flush()
+
+    @property
+    def tick_interval(self):
+        intervals = []
+        if self._durability is not None and self._durability.tick_interval is not None:
+            intervals.append(self._durability.tick_interval)
+        if self.coalesce_verbose and self.coalesce_interval > 0:
+            intervals.append(self.coalesce_interval)
+        return min(intervals) if intervals else None
+
+    def tick(self):
+        '''
+        Emit the coalesced verbose lines and commit the pending output once
+        they are due, called from the thread writing to the filter
+        '''
+        if self._verbose_since is not None and time.time() - self._verbose_since >= self.coalesce_interval:
+            self._flush_verbose_lines()
+        if self._durability is not None:
+            self._durability.tick(self._handle)
 
     def write(self, data):
-        self._buffer.write(data)
-
-        # keep a sliding window of the last chunk written so we can detect
-        # event tokens and determine if we need to perform a search of the full
-        # buffer
-        should_search = '\x1b[K' in (self._last_chunk + data)
-        self._last_chunk = data
-
-        # Only bother searching the buffer if we recently saw a start/end
-        # token (\x1b[K)
-        while should_search:
-            value = self._buffer.getvalue()
-            match = self.EVENT_DATA_RE.search(value)
-            if not match:
+        # Every chunk is scanned once: stdout and event token chunks are kept
+        # in lists and only joined once they are complete, a token split
+        # across writes is resumed where the previous write left off
+        if isinstance(data, bytes):
+            self._syntax = syntax = self.BYTES_SYNTAX
+        else:
+            self._syntax = syntax = self.TEXT_SYNTAX
+        if self._verbose_since is not None and time.time() - self._verbose_since >= self.coalesce_interval:
+            self._flush_verbose_lines()
+        has_newline = syntax.newline in data
+        if self._tail:
+            data = self._tail + data
+        self._tail = syntax.empty
+        pos = 0
+        while pos < len(data):
+            if self._token is None:
+                start = data.find(syntax.token, pos)
+                if start == -1:
+                    end = len(data)
+                    # keep a partial start token for the next write
+                    for n in (2, 1):
+                        if data.endswith(syntax.token[:n], pos):
+                            end -= n
+                            break
+                    self._text.append(data[pos:end])
+                    self._tail = data[end:]
+                    break
+                self._text.append(data[pos:start])
+                self._token = []
+                pos = start + len(syntax.token)
+                continue
+
+            match = syntax.chunk_re.match(data, pos)
+            if match:
+                self._token.append(match.group())
+                pos = match.end()
+            elif self._token and data.startswith(syntax.token, pos):
+                pos += len(syntax.token)
+                self._handle_event_token()
+            elif syntax.chunk_prefix_re.match(data, pos):
+                self._tail = data[pos:]
                 break
-            try:
-                base64_data = re.sub(r'\x1b\[\d+D', '', match.group(1))
-                event_data = json.loads(base64.b64decode(base64_data).decode('utf-8'))
-            except ValueError:
-                event_data = {}
-            event_data = self._emit_event(value[:match.start()], event_data)
-            if not self.output_json:
-                stdout_actual = event_data['stdout'] if 'stdout' in event_data else None
             else:
-                stdout_actual = json.dumps(event_data)
-            remainder = value[match.end():]
-            self._buffer = StringIO()
-            self._buffer.write(remainder)
-
-            if stdout_actual and stdout_actual != "{}":
-                if not self.suppress_ansible_output:
-                    sys.stdout.write(
-                        stdout_actual.encode('utf-8') if PY2 else stdout_actual
-                    )
-                    sys.stdout.write("\n")
-                    sys.stdout.flush()
-                self._handle.write(stdout_actual + "\n")
-                self._handle.flush()
-
-            self._last_chunk = remainder
+                # not an event token after all, the chunks can't contain the start of another one
+                self._text.append(syntax.token + syntax.empty.join(self._token))
+                self._token = None
+
+        # Verbose stdout outside of event data context
+        if has_newline and self._current_event_data is None:
+            self._emit_verbose_lines()
+
+    def _handle_event_token(self):
+        syntax = self._syntax
+        try:
+            base64_data = syntax.chunk_end_re.sub(syntax.empty, syntax.empty.join(self._token))
+            event_data = json_codec.loads(base64.b64decode(base64_data))
+        except ValueError:
+            event_data = {}
+        self._token = None
+        if self._current_event_data is None:
+            self._emit_verbose_lines()
+        event_data = self._emit_event(syntax.empty.join(self._text), event_data)
+        self._text = []
+        if not self.output_json:
+            stdout_actual = event_data['stdout'] if 'stdout' in event_data else None
         else:
-            # Verbose stdout outside of event data context
-            if data and '\n' in data and self._current_event_data is None:
-                # emit events for all complete lines we know about
-                lines = self._buffer.getvalue().splitlines(True)  # keep ends
-                remainder = None
-                # if last line is not a complete line, then exclude it
-                if '\n' not in lines[-1]:
-                    remainder = lines.pop()
-                # emit all complete lines
-                for line in lines:
-                    self._emit_event(line)
-                    if not self.suppress_ansible_output:
-                        sys.stdout.write(
-                            line.encode('utf-8') if PY2 else line
-                        )
-                    self._handle.write(line)
-                    self._handle.flush()
-                self._buffer = StringIO()
-                # put final partial line back on buffer
-                if remainder:
-                    self._buffer.write(remainder)
+            stdout_actual = json_codec.dumps(event_data)
+
+        if stdout_actual and stdout_actual != "{}":
+            if not self.suppress_ansible_output:
+                sys.stdout.write(
+                    stdout_actual.encode('utf-8') if PY2 else stdout_actual
+                )
+                sys.stdout.write("\n")
+                sys.stdout.flush()
+            stdout_actual += "\n"
+            self._handle.write(stdout_actual.encode('utf-8') if self._syntax is self.BYTES_SYNTAX else stdout_actual)
+            self._commit()
+
+    def _emit_verbose_lines(self):
+        # emit events for all complete lines we know about
+        syntax = self._syntax
+        value = syntax.empty.join(self._text)
+        if syntax is self.BYTES_SYNTAX:
+            # a newline never is part of a multibyte character, so everything
+            # up to the last one can be decoded on its own
+            end = value.rfind(syntax.newline) + 1
+            written = value[:end]
+            try:
+                text = written.decode('utf-8')
+            except UnicodeDecodeError:
+                # the stdout artifact stays valid UTF-8, like the events
+                text = written.decode('utf-8', 'replace')
+                written = text.encode('utf-8')
+            lines = text.splitlines(True)  # keep ends
+            remainder = value[end:]
+        else:
+            lines = value.splitlines(True)  # keep ends
+            remainder = None
+            # if last line is not a complete line, then exclude it
+            if lines and '\n' not in lines[-1]:
+                remainder = lines.pop()
+            written = ''.join(lines)
+        # emit all complete lines
+        for line in lines:
+            if self.coalesce_verbose:
+                self._coalesce_verbose_line(line)
+            else:
+                self._emit_event(line)
+            if not self.suppress_ansible_output:
+                sys.stdout.write(
+                    line.encode('utf-8') if PY2 else line
+                )
+        if written:
+            self._handle.write(written)
+            self._commit()
+        # put final partial line back
+        self._text = [remainder] if remainder else []
+
+    def _coalesce_verbose_line(self, line):
+        if self._verbose_since is None:
+            self._verbose_since = time.time()
+        self._verbose_lines.append(line)
+        self._verbose_size += len(line)
+        if len(self._verbose_lines) >= self.coalesce_lines or self._verbose_size >= self.coalesce_bytes \
+                or time.time() - self._verbose_since >= self.coalesce_interval:
+            self._flush_verbose_lines()
+
+    def _flush_verbose_lines(self):
+        if self._verbose_lines:
+            stdout_chunk = ''.join(self._verbose_lines)
+            self._verbose_lines = []
+            self._verbose_size = 0
+            self._verbose_since = None
+            self._emit_chunk(dict(event='verbose'), stdout_chunk)
 
     def close(self):
-        value = self._buffer.getvalue()
+        syntax = self._syntax
+        value = syntax.empty.join(self._text)
+        if self._token is not None:
+            value += syntax.token + syntax.empty.join(self._token)
+        value += self._tail
         if value:
             self._emit_event(value)
-            self._buffer = StringIO()
+            self._text = []
+            self._token = None
+            self._tail = syntax.empty
+        self._flush_verbose_lines()
         self._event_callback(dict(event='EOF'))
+        if self._durability is not None:
+            self._durability.sync(self._handle)
         self._handle.close()
 
     def _emit_event(self, buffered_stdout, next_event_data=None):
+        if isinstance(buffered_stdout, bytes):
+            buffered_stdout = buffered_stdout.decode('utf-8', 'replace')
+        # coalesced lines come first, any other output or event ends them
+        self._flush_verbose_lines()
         next_event_data = next_event_data or {}
         if self._current_event_data:
             event_data = self._current_event_data
@@ -366,23 +581,26 @@ class OutputEventFilter(object):
             stdout_chunks = []
 
         for stdout_chunk in stdout_chunks:
-            if event_data.get('event') == 'verbose':
-                event_data['uuid'] = str(uuid.uuid4())
-            self._counter += 1
-            event_data['counter'] = self._counter
-            event_data['stdout'] = stdout_chunk[:-2] if len(stdout_chunk) > 2 else ""
-            n_lines = stdout_chunk.count('\n')
-            event_data['start_line'] = self._start_line
-            event_data['end_line'] = self._start_line + n_lines
-            self._start_line += n_lines
-            if self._event_callback:
-                self._event_callback(event_data)
+            self._emit_chunk(event_data, stdout_chunk)
         if next_event_data.get('uuid', None):
             self._current_event_data = next_event_data
         else:
             self._current_event_data = None
         return event_data
 
+    def _emit_chunk(self, event_data, stdout_chunk):
+        if event_data.get('event') == 'verbose':
+            event_data['uuid'] = str(uuid.uuid4())
+        self._counter = next(self._counters)
+        event_data['counter'] = self._counter
+        event_data['stdout'] = stdout_chunk[:-2] if len(stdout_chunk) > 2 else ""
+        n_lines = stdout_chunk.count('\n')
+        event_data['start_line'] = self._start_line
+        event_data['end_line'] = self._start_line + n_lines
+        self._start_line += n_lines
+        if self._event_callback:
+            self._event_callback(event_data)
+
 
 def open_fifo_write(path, data):
     '''open_fifo_write opens the fifo named pipe in a new thread.
@@ -0,0 +1,64 @@
+'''
+Content addressed store of large event payloads.
+
+With the ``event_blob_threshold`` setting the display callback writes the
+file diffs and module result fields whose JSON encoding is larger than the
+threshold once to ``blobs`` in the artifact directory, named after the
+SHA-256 of their encoding, and the event holds a reference in their place::
+
+    {"__runner_blob": "<sha256>", "size": <bytes>}
+
+The callback plugin can't import this module, it writes the blobs itself.
+'''
+import os
+import re
+
+from . import json_codec
+
+BLOB_DIRNAME = 'blobs'
+BLOB_KEY = '__runner_blob'
+
+_DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_reference(value):
+    '''
+    Returns whether ``value`` is a reference to a payload in the blob store
+    '''
+    return isinstance(value, dict) and BLOB_KEY in value and len(value) <= 2
+
+
+class BlobStore(object):
+    '''
+    Reads the payloads in the blob store under ``root``. Nothing is read
+    before a reference is resolved.
+    '''
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, digest):
+        if not _DIGEST.match(digest or ''):
+            raise ValueError('Invalid blob digest: {!r}'.format(digest))
+        return os.path.join(self.root, digest[:2], digest)
+
+    def get(self, reference):
+        '''
+        Returns the payload a reference (or the digest of one) points to
+        '''
+        digest = reference[BLOB_KEY] if is_reference(reference) else reference
+        with open(self.path(digest), 'rb') as f:
+            return json_codec.loads(f.read())
+
+    def resolve(self, value):
+        '''
+        Returns ``value`` (an event, its event data or a part of it) with the
+        references in it replaced by their payloads. ``value`` is left alone.
+        '''
+        if is_reference(value):
+            return self.get(value)
+        if isinstance(value, dict):
+            return dict((key, self.resolve(item)) for key, item in value.items())
+        if isinstance(value, list):
+            return [self.resolve(item) for item in value]
+        return value
@@ -0,0 +1,73 @@
+import os
+import time
+
+DURABILITY_NONE = 'none'
+DURABILITY_INTERVAL = 'interval'
+DURABILITY_PER_EVENT = 'per_event'
+DURABILITY_MODES = (DURABILITY_NONE, DURABILITY_INTERVAL, DURABILITY_PER_EVENT)
+
+DEFAULT_COMMIT_INTERVAL = 1.0
+DEFAULT_COMMIT_BATCH = 100
+
+
+class DurabilityPolicy(object):
+    '''
+    Decides when writes to an artifact file handle are committed, that is
+    flushed and, with ``fsync`` enabled, synced to disk.
+
+    - ``none``: only commit when the handle is explicitly flushed or closed
+    - ``interval``: group commit every ``interval`` seconds or ``batch`` writes,
+      whichever comes first, bounding what can be lost on a crash. Writers
+      whose caller waits between writes call :py:meth:`tick` meanwhile, so
+      the last writes are not held until the next one.
+    - ``per_event``: commit after every write
+
+    Every handle needs its own policy instance since it tracks pending writes.
+    '''
+
+    def __init__(self, mode=DURABILITY_PER_EVENT, interval=DEFAULT_COMMIT_INTERVAL, batch=DEFAULT_COMMIT_BATCH, fsync=False):
+        if mode not in DURABILITY_MODES:
+            raise ValueError('durability mode must be one of {}, not {}'.format(', '.join(DURABILITY_MODES), mode))
+        self.mode = mode
+        self.interval = interval
+        self.batch = batch
+        self.fsync = fsync
+        self.commits = 0
+        self._pending = 0
+        self._last_commit = time.time()
+
+    def commit(self, handle):
+        '''
+        Record a write to ``handle`` and commit it if the policy says so
+        '''
+        self._pending += 1
+        if self.mode == DURABILITY_PER_EVENT:
+            self.sync(handle)
+        elif self.mode == DURABILITY_INTERVAL:
+            if (self.batch and self._pending >= self.batch) or time.time() - self._last_commit >= self.interval:
+                self.sync(handle)
+
+    @property
+    def tick_interval(self):
+        '''
+        Seconds between the calls to :py:meth:`tick` that keep commits in
+        time, None when they are not needed
+        '''
+        if self.mode == DURABILITY_INTERVAL and self.interval > 0:
+            return self.interval
+        return None
+
+    def tick(self, handle):
+        '''
+        Commit the pending writes to ``handle`` once ``interval`` passed since the last commit
+        '''
+        if self.mode == DURABILITY_INTERVAL and self._pending and time.time() - self._last_commit >= self.interval:
+            self.sync(handle)
+
+    def sync(self, handle):
+        handle.flush()
+        if self.fsync:
+            os.fsync(handle.fileno())
+        self.commits += 1
+        self._pending = 0
+        self._last_commit = time.time()
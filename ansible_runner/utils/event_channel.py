@@ -0,0 +1,164 @@
+import os
+import selectors
+import struct
+import threading
+import time
+
+from ansible_runner.utils import json_codec
+
+EVENT_FD_ENV = 'RUNNER_EVENT_FD'
+EVENT_FRAMING_ENV = 'RUNNER_EVENT_FRAMING'
+EVENT_PASSTHROUGH_ENV = 'RUNNER_EVENT_PASSTHROUGH'
+
+EVENT_FRAMING_LINES = 'lines'
+EVENT_FRAMING_BINARY = 'binary'
+EVENT_FRAMINGS = (EVENT_FRAMING_LINES, EVENT_FRAMING_BINARY)
+
+# binary frames start with the length of their payload as a 4 byte big-endian integer
+FRAME_HEADER = struct.Struct('!I')
+
+DEFAULT_WAIT_TIMEOUT = 2.0
+
+
+class EventChannel(object):
+    '''
+    Pipe that carries the partial event data written by the display callback
+    plugin to Runner, replacing the ``{uuid}-partial.json`` file handshake.
+
+    The write end is inherited by the Ansible process (its number is exported
+    in the ``RUNNER_EVENT_FD`` environment variable). Every record is a single
+    JSON document, either terminated by a newline or, with ``binary`` framing,
+    preceded by its length so the reader never has to scan the payload. The
+    framing is announced to the callback in ``RUNNER_EVENT_FRAMING``. A
+    background thread drains the pipe so the callback never blocks on a full
+    pipe buffer while Runner is busy reading stdout.
+
+    With ``passthrough`` the callback is asked (in ``RUNNER_EVENT_PASSTHROUGH``)
+    to precede the data of events with a module result by a small summary and
+    a NUL byte. Only the summary is decoded, such records are returned by
+    ``pop`` as a ``(summary, encoded)`` tuple.
+    '''
+
+    def __init__(self, framing=EVENT_FRAMING_LINES, passthrough=False):
+        if framing not in EVENT_FRAMINGS:
+            raise ValueError('event framing must be one of {}, not {}'.format(', '.join(EVENT_FRAMINGS), framing))
+        self.framing = framing
+        self.passthrough = passthrough
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_inheritable(self.write_fd, True)
+        self._partials = {}
+        self._closed = False
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._read_loop, daemon=True)
+        self._thread.start()
+
+    def close_write_end(self):
+        '''
+        Called once the Ansible process has been spawned, so that the reader sees
+        EOF as soon as the last process holding the write end exits
+        '''
+        if self.write_fd is not None:
+            os.close(self.write_fd)
+            self.write_fd = None
+
+    @property
+    def env(self):
+        '''
+        Environment variables that hand the write end to the callback plugin
+        '''
+        env = {EVENT_FD_ENV: str(self.write_fd), EVENT_FRAMING_ENV: self.framing}
+        if self.passthrough:
+            env[EVENT_PASSTHROUGH_ENV] = '1'
+        return env
+
+    def _read_loop(self):
+        buffer = bytearray()
+        split_records = self._split_frames if self.framing == EVENT_FRAMING_BINARY else self._split_lines
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.read_fd, selectors.EVENT_READ)
+            while not self._stopped:
+                if not selector.select(timeout=0.1):
+                    continue
+                data = os.read(self.read_fd, 65536)
+                if not data:
+                    break
+                scan_start = len(buffer)
+                buffer += data
+                records, start = split_records(buffer, scan_start)
+                del buffer[:start]
+                if records:
+                    self._store(records)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    @staticmethod
+    def _split_lines(buffer, scan_start):
+        end = buffer.find(b'\n', scan_start)
+        start = 0
+        records = []
+        while end != -1:
+            records.append(bytes(buffer[start:end]))
+            start = end + 1
+            end = buffer.find(b'\n', start)
+        return records, start
+
+    @staticmethod
+    def _split_frames(buffer, scan_start):
+        view = memoryview(buffer)
+        start = 0
+        records = []
+        try:
+            while len(buffer) - start >= FRAME_HEADER.size:
+                length, = FRAME_HEADER.unpack_from(buffer, start)
+                end = start + FRAME_HEADER.size + length
+                if end > len(buffer):
+                    break
+                records.append(bytes(view[start + FRAME_HEADER.size:end]))
+                start = end
+        finally:
+            # the buffer can't be resized while it is exported
+            view.release()
+        return records, start
+
+    def _store(self, records):
+        with self._condition:
+            for record in records:
+                summary, separator, encoded = record.partition(b'\x00') if self.passthrough else (record, None, None)
+                try:
+                    partial_event_data = json_codec.loads(summary)
+                except ValueError:
+                    continue
+                event_uuid = partial_event_data.get('uuid')
+                if separator:
+                    partial_event_data = (partial_event_data, encoded)
+                self._partials[event_uuid] = partial_event_data
+            self._condition.notify_all()
+
+    def pop(self, event_uuid, fallback_filename=None, timeout=DEFAULT_WAIT_TIMEOUT):
+        '''
+        Return the partial event data sent for ``event_uuid``, or None when it did
+        not arrive through the pipe (for example because the callback wrote
+        ``fallback_filename`` instead)
+        '''
+        with self._condition:
+            if event_uuid in self._partials:
+                return self._partials.pop(event_uuid)
+            # the callback writes to the pipe before the event token reaches
+            # stdout, so the record is normally only waiting on the reader thread
+            if fallback_filename is not None and os.path.exists(fallback_filename):
+                return None
+            deadline = time.time() + timeout
+            while event_uuid not in self._partials and not self._closed:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return self._partials.pop(event_uuid, None)
+
+    def close(self):
+        self.close_write_end()
+        self._stopped = True
+        self._thread.join()
+        os.close(self.read_fd)
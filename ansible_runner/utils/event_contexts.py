@@ -0,0 +1,108 @@
+'''
+Compact storage of the playbook, play and task context of job events.
+
+Every event repeats the context it belongs to. With the
+``event_compact_context`` setting each distinct context is written once to
+``job_events/contexts.jsonl`` and the stored events refer to it, their
+``event_data`` holds ``"__context": <id>`` instead of the context fields.
+Readers of the ``job_events`` directory put the fields back.
+'''
+import os
+import stat
+
+from ansible_runner.utils import json_codec
+
+CONTEXTS_FILENAME = 'contexts.jsonl'
+CONTEXT_KEY = '__context'
+CONTEXT_FIELDS = (
+    'playbook', 'playbook_uuid', 'play', 'play_uuid', 'play_pattern',
+    'task', 'task_uuid', 'task_path', 'task_args', 'task_action', 'role',
+)
+
+
+class ContextWriter(object):
+    '''
+    Writes the context of events to the contexts file of ``event_path`` the
+    first time it is seen, and returns the events referring to it
+    '''
+
+    def __init__(self, event_path):
+        self.filename = os.path.join(event_path, CONTEXTS_FILENAME)
+        self._ids = {}
+        self._next_id = 0
+        # ids of an earlier run with the same artifact directory stay valid
+        if os.path.exists(self.filename):
+            with open(self.filename, 'rb') as contexts_file:
+                self._next_id = sum(1 for line in contexts_file)
+        self._handle = None
+
+    def compact(self, event_data):
+        '''
+        Returns a copy of ``event_data`` without its context fields, but the
+        id of the context instead. Events without a context are returned as
+        they are.
+        '''
+        event_data_dict = event_data.get('event_data')
+        if not event_data_dict:
+            return event_data
+        context = dict((key, event_data_dict[key]) for key in CONTEXT_FIELDS if key in event_data_dict)
+        if not context:
+            return event_data
+        encoded = json_codec.dumpb(context)
+        context_id = self._ids.get(encoded)
+        if context_id is None:
+            context_id = self._ids[encoded] = self._next_id
+            self._next_id += 1
+            if self._handle is None:
+                fd = os.open(self.filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, stat.S_IRUSR | stat.S_IWUSR)
+                self._handle = os.fdopen(fd, 'ab')
+            # on disk before any event refers to it
+            self._handle.write(b'{"id":' + str(context_id).encode('ascii') + b',"context":' + encoded + b'}\n')
+            self._handle.flush()
+        compacted = dict((key, value) for key, value in event_data_dict.items() if key not in context)
+        compacted[CONTEXT_KEY] = context_id
+        return dict(event_data, event_data=compacted)
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+class ContextReader(object):
+    '''
+    Puts the context back into the events read from ``event_path``. The
+    contexts file is only read once an event refers to a context, and only
+    as far as it was written.
+    '''
+
+    def __init__(self, event_path):
+        self.filename = os.path.join(event_path, CONTEXTS_FILENAME)
+        self._contexts = {}
+        self._offset = 0
+
+    def _read(self):
+        try:
+            with open(self.filename, 'rb') as contexts_file:
+                contexts_file.seek(self._offset)
+                for line in contexts_file:
+                    if not line.endswith(b'\n'):
+                        break
+                    record = json_codec.loads(line)
+                    self._contexts[record['id']] = record['context']
+                    self._offset += len(line)
+        except FileNotFoundError:
+            pass
+
+    def expand(self, event):
+        '''
+        Returns ``event`` with the context fields its event data refers to
+        '''
+        event_data = event.get('event_data')
+        if not isinstance(event_data, dict) or CONTEXT_KEY not in event_data:
+            return event
+        context_id = event_data.pop(CONTEXT_KEY)
+        if context_id not in self._contexts:
+            self._read()
+        event['event_data'] = dict(self._contexts.get(context_id, {}), **event_data)
+        return event
@@ -0,0 +1,117 @@
+import json
+import os
+import stat
+
+from ansible_runner.utils import json_codec
+from ansible_runner.utils.event_contexts import ContextReader
+from ansible_runner.utils.journal import journal_segment_name
+
+EVENT_INDEX_FILENAME = 'event_index.json'
+EVENT_INDEX_VERSION = 1
+
+
+class EventIndex(object):
+    '''
+    Compact index of the job events stored in a ``job_events`` directory,
+    keyed by counter, uuid, host, task_uuid and event type.
+
+    Every record is a ``[counter, uuid, event, host, task_uuid, locator]``
+    list where ``locator`` is the event file name, or a ``[segment, offset,
+    length]`` list for events stored in the event journal.
+    '''
+
+    def __init__(self, records=None):
+        self.records = []
+        self._by_counter = {}
+        self._by_uuid = {}
+        self._by_host = {}
+        self._by_task_uuid = {}
+        self._by_event = {}
+        for record in records or []:
+            self._add_record(record)
+
+    def __len__(self):
+        return len(self.records)
+
+    def _add_record(self, record):
+        position = len(self.records)
+        self.records.append(record)
+        counter, event_uuid, event, host, task_uuid, locator = record
+        self._by_counter[counter] = position
+        self._by_uuid.setdefault(event_uuid, []).append(position)
+        if host is not None:
+            self._by_host.setdefault(host, []).append(position)
+        if task_uuid is not None:
+            self._by_task_uuid.setdefault(task_uuid, []).append(position)
+        self._by_event.setdefault(event, []).append(position)
+
+    def add(self, event_data, locator):
+        event_data_dict = event_data.get('event_data') or {}
+        self._add_record([
+            event_data.get('counter'),
+            event_data.get('uuid'),
+            event_data.get('event'),
+            event_data_dict.get('host'),
+            event_data_dict.get('task_uuid'),
+            locator,
+        ])
+
+    def find(self, counter=None, uuid=None, host=None, task_uuid=None, event=None):
+        '''
+        Return the records matching all of the given keys, ordered by counter
+        '''
+        candidates = []
+        if counter is not None:
+            candidates.append([self._by_counter[counter]] if counter in self._by_counter else [])
+        if uuid is not None:
+            candidates.append(self._by_uuid.get(uuid, []))
+        if host is not None:
+            candidates.append(self._by_host.get(host, []))
+        if task_uuid is not None:
+            candidates.append(self._by_task_uuid.get(task_uuid, []))
+        if event is not None:
+            candidates.append(self._by_event.get(event, []))
+        if not candidates:
+            positions = range(len(self.records))
+        else:
+            candidates.sort(key=len)
+            positions = set(candidates[0]).intersection(*candidates[1:])
+        return sorted((self.records[position] for position in positions), key=lambda record: record[0])
+
+    def events(self, event_path, **keys):
+        '''
+        Load the events matching ``keys`` (see ``find``) from ``event_path``
+        '''
+        contexts = ContextReader(event_path)
+        for record in self.find(**keys):
+            yield contexts.expand(load_indexed_event(event_path, record[5]))
+
+    def dump(self, filename):
+        temporary_filename = filename + '.tmp'
+        with os.fdopen(os.open(temporary_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, stat.S_IRUSR | stat.S_IWUSR), 'w') as f:
+            json.dump({'version': EVENT_INDEX_VERSION, 'records': self.records}, f)
+        os.rename(temporary_filename, filename)
+
+    @classmethod
+    def load(cls, filename):
+        '''
+        Load a persisted index, returns None if there is no usable one
+        '''
+        try:
+            with open(filename, 'r') as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if data.get('version') != EVENT_INDEX_VERSION:
+            return None
+        return cls(data.get('records'))
+
+
+def load_indexed_event(event_path, locator):
+    if isinstance(locator, list):
+        segment, offset, length = locator
+        with open(os.path.join(event_path, journal_segment_name(segment)), 'rb') as journal_file:
+            journal_file.seek(offset)
+            return json_codec.loads(journal_file.read(length))
+    with open(os.path.join(event_path, locator), 'rb') as event_file:
+        return json_codec.loads(event_file.read())
@@ -0,0 +1,100 @@
+import ctypes
+import ctypes.util
+import os
+import selectors
+import sys
+import time
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+EVENT_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# upper bound for a single wait, so callers get to re-check the run status
+MAX_WAIT = 0.1
+
+POLL_MIN_INTERVAL = 0.005
+POLL_MAX_INTERVAL = 0.5
+
+
+class PollWatcher(object):
+    '''
+    Waits for changes in a directory by sleeping with an exponential back-off
+    that resets whenever the caller found something new
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._interval = POLL_MIN_INTERVAL
+
+    def wait(self, timeout=MAX_WAIT):
+        time.sleep(min(self._interval, timeout))
+        self._interval = min(self._interval * 2, POLL_MAX_INTERVAL)
+
+    def reset(self):
+        self._interval = POLL_MIN_INTERVAL
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    '''
+    Waits for files to be created, renamed into or written in a directory using
+    Linux inotify
+    '''
+
+    def __init__(self, path, libc):
+        self.path = path
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self._fd, os.fsencode(path), EVENT_WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, 'inotify_add_watch failed for {}'.format(path))
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._fd, selectors.EVENT_READ)
+
+    def wait(self, timeout=MAX_WAIT):
+        if self._selector.select(timeout=timeout):
+            # the notifications only serve as a wake up, drain them
+            try:
+                while os.read(self._fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def reset(self):
+        pass
+
+    def close(self):
+        self._selector.close()
+        os.close(self._fd)
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def event_watcher(path):
+    '''
+    Return a watcher for ``path`` whose ``wait()`` blocks until something changed
+    in it: inotify based on Linux, a back-off poll everywhere else
+    '''
+    if sys.platform.startswith('linux'):
+        libc = _load_libc()
+        if libc is not None:
+            try:
+                return InotifyWatcher(path, libc)
+            except OSError:
+                pass
+    return PollWatcher(path)
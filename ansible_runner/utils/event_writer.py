@@ -0,0 +1,156 @@
+import queue
+import tempfile
+import threading
+
+from ansible_runner.utils import json_codec
+
+BACKPRESSURE_BLOCK = 'block'
+BACKPRESSURE_DROP_VERBOSE = 'drop_verbose'
+BACKPRESSURE_SPILL = 'spill'
+BACKPRESSURE_POLICIES = (BACKPRESSURE_BLOCK, BACKPRESSURE_DROP_VERBOSE, BACKPRESSURE_SPILL)
+
+DEFAULT_QUEUE_SIZE = 1000
+
+_STOP = object()
+
+
+class EventWriter(object):
+    '''
+    Background stage that hands events to ``event_callback`` on its own thread,
+    so that reading the Ansible output never waits on event persistence,
+    ``event_handler`` or plugins.
+
+    Events are queued in a bounded queue; ``backpressure`` decides what happens
+    once it is full:
+
+    - ``block``: wait for the writer thread to make room
+    - ``drop_verbose``: discard ``verbose`` events, wait for everything else
+    - ``spill``: append events to a temporary file next to ``spill_dir`` which
+      is drained, in order, once the queue is empty
+    '''
+
+    def __init__(self, event_callback, queue_size=DEFAULT_QUEUE_SIZE, backpressure=BACKPRESSURE_BLOCK, spill_dir=None):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError('backpressure must be one of {}, not {}'.format(', '.join(BACKPRESSURE_POLICIES), backpressure))
+        self._event_callback = event_callback
+        self.queue_size = queue_size
+        self.backpressure = backpressure
+        self.spill_dir = spill_dir
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._spill_lock = threading.Lock()
+        self._spill_file = None
+        self._spill_pending = 0
+        self._spill_read_offset = 0
+        self._error = None
+
+        self.max_queue_depth = 0
+        self.queued = 0
+        self.dropped = 0
+        self.spilled = 0
+
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() + self._spill_pending
+
+    @property
+    def metrics(self):
+        return dict(
+            queue_size=self.queue_size,
+            queue_depth=self.queue_depth,
+            max_queue_depth=self.max_queue_depth,
+            queued=self.queued,
+            dropped=self.dropped,
+            spilled=self.spilled,
+        )
+
+    def put(self, event_data):
+        self.queued += 1
+        if self.backpressure == BACKPRESSURE_SPILL:
+            with self._spill_lock:
+                # once spilling, keep spilling until the writer caught up so
+                # that events are still handled in order
+                if self._spill_pending:
+                    self._spill(event_data)
+                    return
+                try:
+                    self._queue.put_nowait(event_data)
+                except queue.Full:
+                    self._spill(event_data)
+                    return
+        elif self.backpressure == BACKPRESSURE_DROP_VERBOSE and event_data.get('event') == 'verbose':
+            try:
+                self._queue.put_nowait(event_data)
+            except queue.Full:
+                self.dropped += 1
+                return
+        else:
+            self._queue.put(event_data)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def _spill(self, event_data):
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(dir=self.spill_dir)
+        self._spill_file.seek(0, 2)
+        self._spill_file.write(json_codec.dumpb(event_data) + b'\n')
+        self._spill_pending += 1
+        self.spilled += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def _unspill(self):
+        with self._spill_lock:
+            if not self._spill_pending:
+                return None
+            self._spill_file.seek(self._spill_read_offset)
+            line = self._spill_file.readline()
+            self._spill_read_offset += len(line)
+            self._spill_pending -= 1
+            if not self._spill_pending:
+                self._spill_file.seek(0)
+                self._spill_file.truncate()
+                self._spill_read_offset = 0
+        return json_codec.loads(line)
+
+    def _handle(self, event_data):
+        if self._error is not None:
+            return
+        try:
+            self._event_callback(event_data)
+        except Exception as e:
+            self._error = e
+
+    def _write_loop(self):
+        while True:
+            if self._spill_pending:
+                # queued events are older than spilled ones
+                try:
+                    event_data = self._queue.get_nowait()
+                except queue.Empty:
+                    event_data = self._unspill()
+                    if event_data is not None:
+                        self._handle(event_data)
+                    continue
+            else:
+                event_data = self._queue.get()
+            if event_data is _STOP:
+                event_data = self._unspill()
+                while event_data is not None:
+                    self._handle(event_data)
+                    event_data = self._unspill()
+                return
+            self._handle(event_data)
+
+    def close(self):
+        '''
+        Wait until every queued event was handled, re-raising the first error
+        ``event_callback`` raised on the writer thread
+        '''
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,203 @@
+import os
+import re
+import stat
+import threading
+import time
+
+from ansible_runner.utils import json_codec
+
+JOURNAL_SEGMENT_RE = re.compile(r'^journal-([0-9]+)\.jsonl$')
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024  # 64 MB
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+def journal_segment_name(index):
+    return 'journal-{:06d}.jsonl'.format(index)
+
+
+def journal_segments(event_path):
+    '''
+    Return the sorted segment indexes of the event journal stored in ``event_path``
+    '''
+    try:
+        dir_entries = os.listdir(event_path)
+    except FileNotFoundError:
+        return []
+    segments = []
+    for entry in dir_entries:
+        match = JOURNAL_SEGMENT_RE.match(entry)
+        if match:
+            segments.append(int(match.group(1)))
+    return sorted(segments)
+
+
+class EventJournal(object):
+    '''
+    Append-only writer that stores job events as JSON lines in a series of
+    segment files under the ``job_events`` artifact directory.
+
+    Events are written through a buffered file handle and flushed at least every
+    ``flush_interval`` seconds, on segment rotation and on close. Callers that
+    wait between events call :py:meth:`tick` meanwhile, so the last event is
+    not held until the next one. A
+    :py:class:`ansible_runner.utils.durability.DurabilityPolicy` passed as
+    ``durability`` decides about flushing instead. A segment is only created
+    once the first event is written to it.
+    '''
+
+    def __init__(self, event_path, segment_size=DEFAULT_SEGMENT_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL, durability=None):
+        self.event_path = event_path
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        segments = journal_segments(event_path)
+        self._segment = segments[-1] + 1 if segments else 0
+        self._handle = None
+        self._segment_bytes = 0
+        self._last_flush = time.time()
+        # events are written by the event writer thread while ticks come from the caller
+        self._lock = threading.RLock()
+
+    @property
+    def tick_interval(self):
+        '''
+        Seconds between the calls to :py:meth:`tick` that keep writes in time,
+        None when they are not needed
+        '''
+        if self.durability is not None:
+            return self.durability.tick_interval
+        if self.flush_interval > 0:
+            return self.flush_interval
+        return None
+
+    def _open_segment(self):
+        filename = os.path.join(self.event_path, journal_segment_name(self._segment))
+        fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, stat.S_IRUSR | stat.S_IWUSR)
+        self._handle = os.fdopen(fd, 'ab')
+        self._segment_bytes = self._handle.tell()
+
+    def write(self, event_data, encoded=None):
+        '''
+        Append ``event_data`` to the journal, returns its ``[segment, offset, length]`` locator.
+        ``encoded`` is written instead when the event is already encoded.
+        '''
+        line = (encoded if encoded is not None else json_codec.dumpb(event_data)) + b'\n'
+        with self._lock:
+            return self._write(line)
+
+    def _write(self, line):
+        if self._handle is None:
+            self._open_segment()
+        locator = [self._segment, self._segment_bytes, len(line)]
+        self._handle.write(line)
+        self._segment_bytes += len(line)
+
+        if self.segment_size and self._segment_bytes >= self.segment_size:
+            # readers only move on to the next segment once it exists, so the
+            # current one has to be complete on disk before it is created
+            self.close()
+            self._segment += 1
+            self._last_flush = time.time()
+        elif self.durability is not None:
+            self.durability.commit(self._handle)
+        elif time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+        return locator
+
+    def tick(self):
+        '''
+        Flush the buffered events once ``flush_interval`` passed since the
+        last flush, or commit them when the durability policy says so
+        '''
+        with self._lock:
+            if self.durability is not None:
+                if self._handle is not None:
+                    self.durability.tick(self._handle)
+            elif time.time() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._handle is not None:
+                if self.durability is not None:
+                    self.durability.sync(self._handle)
+                else:
+                    self._handle.flush()
+            self._last_flush = time.time()
+
+    def close(self):
+        with self._lock:
+            if self._handle is not None:
+                if self.durability is not None:
+                    self.durability.sync(self._handle)
+                self._handle.close()
+                self._handle = None
+
+
+class JournalTicker(object):
+    '''
+    Ticks ``journal`` from a daemon thread, for callers that block while
+    waiting for the next event
+    '''
+
+    def __init__(self, journal):
+        self.journal = journal
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.journal.tick_interval is None:
+            return
+        self._thread = threading.Thread(target=self._run, name='journal-ticker')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.journal.tick_interval):
+            self.journal.tick()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def collect_journal_events(event_path, position=None):
+    '''
+    Collect new events from the event journal for the 'events' generator property
+
+    ``position`` is a ``(segment, offset)`` tuple as yielded alongside every
+    event; passing the last one seen resumes reading right after that event.
+    Incomplete trailing lines are left for the next call.
+    '''
+    segment, offset = position or (None, 0)
+    segments = journal_segments(event_path)
+    if not segments:
+        return
+    if segment is None:
+        segment = segments[0]
+
+    while True:
+        later_segments = [s for s in segments if s > segment]
+        filename = os.path.join(event_path, journal_segment_name(segment))
+        try:
+            with open(filename, 'rb') as journal_file:
+                journal_file.seek(offset)
+                for line in journal_file:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        event = json_codec.loads(line)
+                    except ValueError:
+                        return
+                    offset += len(line)
+                    yield event, (segment, offset)
+        except FileNotFoundError:
+            pass
+
+        if not later_segments:
+            return
+        segment, offset = later_segments[0], 0
+        segments = journal_segments(event_path)
@@ -0,0 +1,88 @@
+'''
+JSON encoding and decoding of job events.
+
+Uses orjson when it is importable and falls back to the json module of the
+standard library otherwise, or for documents orjson refuses (integers
+beyond 64 bits, NaN on decoding). Either way Ansible vault values and dates
+are encoded the way Ansible does.
+'''
+import datetime
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CODEC = 'orjson' if orjson is not None else 'json'
+
+
+def _default(o):
+    if getattr(o, 'yaml_tag', None) == '!vault':
+        encrypted_form = o._ciphertext
+        if isinstance(encrypted_form, bytes):
+            encrypted_form = encrypted_form.decode('utf-8')
+        return {'__ansible_vault': encrypted_form}
+    elif isinstance(o, (datetime.date, datetime.datetime)):
+        return o.isoformat()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(o).__name__))
+
+
+class JSONEncoder(json.JSONEncoder):
+
+    def default(self, o):
+        return _default(o)
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def dumpb(obj):
+    '''
+    Returns ``obj`` encoded as UTF-8 JSON bytes
+    '''
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            pass
+    return json.dumps(obj, cls=JSONEncoder).encode('utf-8')
+
+
+def dumps(obj):
+    '''
+    Returns ``obj`` encoded as a JSON string
+    '''
+    if orjson is not None:
+        return dumpb(obj).decode('utf-8')
+    return json.dumps(obj, cls=JSONEncoder)
+
+
+def loads(data):
+    '''
+    Decodes a JSON document from a string or UTF-8 bytes
+    '''
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            pass
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def merge_encoded(fields, encoded):
+    '''
+    Adds ``fields`` to the encoded JSON object ``encoded`` without decoding
+    it. Where both have a key the one of ``encoded`` comes last and wins
+    when decoding, the way ``dict(fields, **decoded)`` would.
+    '''
+    head = dumpb(fields)
+    if head == b'{}':
+        return encoded
+    body = encoded.strip()[1:]
+    if body.lstrip() == b'}':
+        return head
+    return head[:-1] + b',' + body
@@ -0,0 +1,59 @@
+import copy
+import threading
+
+STATS_KEYS = ('skipped', 'ok', 'dark', 'failures', 'ignored', 'rescued', 'processed', 'changed')
+
+
+class LiveStats(object):
+    '''
+    Per-host counters updated from job events as they are handled, in the same
+    shape as :py:attr:`ansible_runner.runner.Runner.stats`.
+
+    Task results are counted the way Ansible counts them for the play recap,
+    loop items are not counted separately. ``rescued`` is only known once the
+    ``playbook_on_stats`` event arrives, whose totals then replace the counters.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = dict((key, {}) for key in STATS_KEYS)
+        self.events = 0
+        self.final = False
+
+    def _increment(self, key, host):
+        self._stats[key][host] = self._stats[key].get(host, 0) + 1
+
+    def update(self, event_data):
+        event = event_data.get('event')
+        event_data_dict = event_data.get('event_data') or {}
+        host = event_data_dict.get('host')
+        with self._lock:
+            self.events += 1
+            if event == 'playbook_on_stats':
+                for key in STATS_KEYS:
+                    self._stats[key] = dict(event_data_dict.get(key) or {})
+                self.final = True
+                return
+            if host is None or self.final:
+                return
+            if event == 'runner_on_ok':
+                self._increment('ok', host)
+                if (event_data_dict.get('res') or {}).get('changed'):
+                    self._increment('changed', host)
+            elif event == 'runner_on_failed':
+                if event_data_dict.get('ignore_errors'):
+                    self._increment('ok', host)
+                    self._increment('ignored', host)
+                else:
+                    self._increment('failures', host)
+            elif event == 'runner_on_unreachable':
+                self._increment('dark', host)
+            elif event == 'runner_on_skipped':
+                self._increment('skipped', host)
+            else:
+                return
+            self._stats['processed'][host] = 1
+
+    def snapshot(self):
+        with self._lock:
+            return copy.deepcopy(self._stats)
@@ -1,15 +1,221 @@
+import base64
+import shutil
 import tempfile
+import time
 import zipfile
+import zlib
 import os
 import json
+import struct
 import sys
 import stat
 
 from .base64io import Base64IO
 from pathlib import Path
 
+# header of an archive streamed as it is compressed, see ZipStreamWriter
+ZIPSTREAM = 'zipstream'
+# header of an archive sent as raw bytes instead of base64
+BINARY = 'binary'
+
+CHUNK_SIZE = 1024 * 1000  # 1 MB
+
+_LOCAL_HEADER = struct.Struct('<4sHHHHHLLLHH')
+_CENTRAL_HEADER = struct.Struct('<4sBBBBHHHHLLLHHHHHLL')
+_ZIP64_END = struct.Struct('<4sQHHLLQQQQ')
+_ZIP64_LOCATOR = struct.Struct('<4sLQL')
+_END = struct.Struct('<4sHHHHLLH')
+_LOCAL_SIGNATURE = b'PK\x03\x04'
+_CENTRAL_SIGNATURE = b'PK\x01\x02'
+_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+_ZIP64_EXTRA = 0x0001
+_ZIP64_LIMIT = 0xFFFFFFFF
+_FLAG_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_UNIX = 3
+_ZIP64_VERSION = 45
+_SYMLINK_ATTR = (0o777 | 0xA000) << 16
+_FRAME = struct.Struct('>L')
+
+
+def _dos_time(mtime):
+    year, month, day, hour, minute, second = time.localtime(mtime)[:6]
+    if year < 1980:
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+class ZipStreamWriter(object):
+    '''
+    Writes a zip archive to a stream that can't seek, compressing every file
+    as it is read. The sizes and checksum of an entry follow its data in a
+    data descriptor, so each compressed piece is written as soon as it is
+    produced. ``size`` is the number of bytes written.
+    '''
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._buffer = bytearray()
+        self._entries = []
+        self.size = 0
+
+    def _write(self, data):
+        self._buffer += data
+        self.size += len(data)
+        if len(self._buffer) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._fileobj.write(bytes(self._buffer))
+            self._buffer = bytearray()
+
+    def add_file(self, arcname, source, external_attr, mtime):
+        '''
+        Adds the content read from the file object ``source`` as ``arcname``
+        '''
+        name = arcname.encode('utf-8')
+        dos_time, dos_date = _dos_time(mtime)
+        offset = self.size
+        # zip64 sizes follow in the data descriptor, whatever the size turns out to be
+        extra = struct.pack('<HHQQ', _ZIP64_EXTRA, 16, 0, 0)
+        self._write(_LOCAL_HEADER.pack(_LOCAL_SIGNATURE, _ZIP64_VERSION, _FLAG_DESCRIPTOR | _FLAG_UTF8, zipfile.ZIP_DEFLATED,
+                                       dos_time, dos_date, 0, _ZIP64_LIMIT, _ZIP64_LIMIT, len(name), len(extra)) + name + extra)
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        crc = file_size = compress_size = 0
+        while True:
+            data = source.read(CHUNK_SIZE)
+            if not data:
+                break
+            crc = zlib.crc32(data, crc)
+            file_size += len(data)
+            compressed = compressor.compress(data)
+            compress_size += len(compressed)
+            self._write(compressed)
+        compressed = compressor.flush()
+        compress_size += len(compressed)
+        self._write(compressed)
+        self._write(_DESCRIPTOR_SIGNATURE + struct.pack('<LQQ', crc, compress_size, file_size))
+        self._entries.append((name, _FLAG_DESCRIPTOR | _FLAG_UTF8, zipfile.ZIP_DEFLATED, dos_time, dos_date,
+                              crc, compress_size, file_size, external_attr, offset))
+
+    def add_directory(self, arcname, external_attr, mtime):
+        name = arcname.rstrip('/').encode('utf-8') + b'/'
+        dos_time, dos_date = _dos_time(mtime)
+        offset = self.size
+        self._write(_LOCAL_HEADER.pack(_LOCAL_SIGNATURE, 20, _FLAG_UTF8, zipfile.ZIP_STORED,
+                                       dos_time, dos_date, 0, 0, 0, len(name), 0) + name)
+        self._entries.append((name, _FLAG_UTF8, zipfile.ZIP_STORED, dos_time, dos_date, 0, 0, 0, external_attr | 0x10, offset))
+
+    def close(self):
+        '''
+        Writes the central directory
+        '''
+        start = self.size
+        for name, flags, compress_type, dos_time, dos_date, crc, compress_size, file_size, external_attr, offset in self._entries:
+            zip64 = [value for value in (file_size, compress_size, offset) if value >= _ZIP64_LIMIT]
+            extra = struct.pack('<HH{}Q'.format(len(zip64)), _ZIP64_EXTRA, 8 * len(zip64), *zip64) if zip64 else b''
+            self._write(_CENTRAL_HEADER.pack(
+                _CENTRAL_SIGNATURE, _ZIP64_VERSION, _UNIX, _ZIP64_VERSION, 0, flags, compress_type, dos_time, dos_date, crc,
+                min(compress_size, _ZIP64_LIMIT), min(file_size, _ZIP64_LIMIT), len(name), len(extra), 0, 0, 0,
+                external_attr, min(offset, _ZIP64_LIMIT)) + name + extra)
+        count, directory_size = len(self._entries), self.size - start
+        if count >= 0xFFFF or directory_size >= _ZIP64_LIMIT or start >= _ZIP64_LIMIT:
+            zip64_end = self.size
+            self._write(_ZIP64_END.pack(b'PK\x06\x06', _ZIP64_END.size - 12, _ZIP64_VERSION, _ZIP64_VERSION, 0, 0,
+                                        count, count, directory_size, start))
+            self._write(_ZIP64_LOCATOR.pack(b'PK\x06\x07', 0, zip64_end, 1))
+        self._write(_END.pack(b'PK\x05\x06', 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                              min(directory_size, _ZIP64_LIMIT), min(start, _ZIP64_LIMIT), 0))
+        self.flush()
+
+
+def _walk(source_directory):
+    '''
+    Yields (full path, archive name) of everything in ``source_directory``
+    '''
+    for dirpath, dirs, files in os.walk(source_directory):
+        relpath = os.path.relpath(dirpath, source_directory)
+        if relpath == ".":
+            relpath = ""
+        for fname in files + dirs:
+            yield os.path.join(dirpath, fname), os.path.join(relpath, fname)
+
+
+class _FrameWriter(object):
+    '''
+    Writes the data of a streamed archive as raw frames, each prefixed with
+    its length. An empty frame ends the archive.
+    '''
+
+    def __init__(self, target):
+        self._target = target
+
+    def write(self, data):
+        if data:
+            self._target.write(_FRAME.pack(len(data)))
+            self._target.write(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._target.write(_FRAME.pack(0))
+
+
+def _stream_zip(source_directory, target, binary):
+    header = {ZIPSTREAM: True}
+    if binary:
+        header[BINARY] = True
+    target.write(json.dumps(header).encode("utf-8") + b"\n")
+    with _FrameWriter(target) if binary else Base64IO(target) as encoded_target:
+        archive = ZipStreamWriter(encoded_target)
+        if source_directory:
+            for full_path, arcname in _walk(source_directory):
+                # Magic to preserve symlinks
+                if os.path.islink(full_path):
+                    link = os.readlink(full_path).encode('utf-8')
+                    archive.add_file(arcname, _BytesSource(link), _SYMLINK_ATTR, os.lstat(full_path).st_mtime)
+                    continue
+                st = os.stat(full_path)
+                if stat.S_ISDIR(st.st_mode):
+                    archive.add_directory(arcname, (st.st_mode & 0xFFFF) << 16, st.st_mtime)
+                else:
+                    with open(full_path, 'rb') as source:
+                        archive.add_file(arcname, source, (st.st_mode & 0xFFFF) << 16, st.st_mtime)
+        archive.close()
+    if not binary:
+        target.write(b"\n")
+    target.write(json.dumps({"zipstream_size": archive.size}).encode("utf-8") + b"\n")
+
+
+class _BytesSource(object):
+
+    def __init__(self, data):
+        self._data = data
+
+    def read(self, size):
+        data, self._data = self._data[:size], self._data[size:]
+        return data
+
+
+def stream_dir(source_directory, stream, streaming=False, binary=False):
+    '''
+    Writes the contents of ``source_directory`` to ``stream`` as a base64
+    encoded zip archive. The archive is announced with its size and built
+    in a temporary file first, unless ``streaming`` is set: then every file
+    is compressed and written as it is read, and the size follows the
+    archive. With ``binary`` the archive is written as raw bytes, in
+    length prefixed frames when streamed. All are read by ``unstream_dir``.
+    '''
+    if stream.name == "<stdout>":
+        target = sys.stdout.buffer
+    else:
+        target = stream
+    if streaming:
+        _stream_zip(source_directory, target, binary)
+        return
 
-def stream_dir(source_directory, stream):
     with tempfile.NamedTemporaryFile() as tmp:
         with zipfile.ZipFile(
             tmp.name, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True
@@ -40,31 +246,51 @@ def stream_dir(source_directory, stream):
         zip_size = Path(tmp.name).stat().st_size
 
         with open(tmp.name, "rb") as source:
-            if stream.name == "<stdout>":
-                target = sys.stdout.buffer
-            else:
-                target = stream
-            target.write(json.dumps({"zipfile": zip_size}).encode("utf-8") + b"\n")
+            header = {"zipfile": zip_size}
+            if binary:
+                header[BINARY] = True
+            target.write(json.dumps(header).encode("utf-8") + b"\n")
+            if binary:
+                shutil.copyfileobj(source, target, CHUNK_SIZE)
+                return
             with Base64IO(target) as encoded_target:
                 for line in source:
                     encoded_target.write(line)
 
 
-def unstream_dir(stream, length, target_directory):
+def _copy_exactly(source, target, length):
+    remaining = length
+    chunk_size = 1024 * 1000  # 1 MB
+    while remaining != 0:
+        if chunk_size >= remaining:
+            chunk_size = remaining
+
+        data = source.read(chunk_size)
+        if not data:
+            raise ValueError('Zip file is truncated: {} of {} bytes missing'.format(remaining, length))
+        target.write(data)
+
+        remaining -= len(data)
+
+
+def unstream_dir(stream, length, target_directory, binary=False):
+    '''
+    Extracts an archive written by ``stream_dir`` to ``target_directory``.
+    ``length`` is the size announced ahead of the archive, None for a
+    streamed archive which is extracted as it is read. ``binary`` is set
+    when the header says the archive is sent as raw bytes.
+    '''
     # NOTE: caller needs to process exceptions
+    if length is None:
+        _unstream_zip(stream, target_directory, binary)
+        return
     with tempfile.NamedTemporaryFile() as tmp:
         with open(tmp.name, "wb") as target:
-            with Base64IO(stream) as source:
-                remaining = length
-                chunk_size = 1024 * 1000  # 1 MB
-                while remaining != 0:
-                    if chunk_size >= remaining:
-                        chunk_size = remaining
-
-                    data = source.read(chunk_size)
-                    target.write(data)
-
-                    remaining -= chunk_size
+            if binary:
+                _copy_exactly(stream, target, length)
+            else:
+                with Base64IO(stream) as source:
+                    _copy_exactly(source, target, length)
 
         with zipfile.ZipFile(tmp.name, "r") as archive:
             # Fancy extraction in order to preserve permissions
@@ -91,3 +317,245 @@ def unstream_dir(stream, length, target_directory):
                     os.symlink(link, out_path)
                 else:
                     os.chmod(out_path, perms)
+
+
+class _Base64Line(object):
+    '''
+    Decodes the base64 data ``stream`` holds up to the end of the line
+    '''
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._pending = b''
+        self._done = False
+        self.size = 0
+
+    def read(self):
+        '''
+        Returns the next decoded piece, empty once the line ended
+        '''
+        while not self._done:
+            line = self._stream.readline(CHUNK_SIZE)
+            if not line:
+                raise ValueError('Zip stream ended unexpectedly')
+            if line.endswith(b'\n'):
+                self._done = True
+                line = line[:-1]
+            data = self._pending + line
+            cut = len(data) if self._done else len(data) - len(data) % 4
+            self._pending = data[cut:]
+            decoded = base64.b64decode(data[:cut])
+            if decoded:
+                self.size += len(decoded)
+                return decoded
+        return b''
+
+
+class _FrameReader(object):
+    '''
+    Reads the frames written by ``_FrameWriter`` from ``stream``
+    '''
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._done = False
+        self.size = 0
+
+    def _read_exactly(self, size):
+        data = self._stream.read(size)
+        while len(data) < size:
+            more = self._stream.read(size - len(data))
+            if not more:
+                raise ValueError('Zip stream ended unexpectedly')
+            data += more
+        return data
+
+    def read(self):
+        '''
+        Returns the data of the next frame, empty once the archive ended
+        '''
+        if self._done:
+            return b''
+        length, = _FRAME.unpack(self._read_exactly(_FRAME.size))
+        if not length:
+            self._done = True
+            return b''
+        self.size += length
+        return self._read_exactly(length)
+
+
+class _ZipStreamReader(object):
+    '''
+    Extracts the entries of a zip archive as their local headers and data
+    are read. Permissions and symlinks are only known from the central
+    directory at the end of the archive and applied then.
+    '''
+
+    def __init__(self, source, target_directory):
+        self._source = source
+        self._buffer = bytearray()
+        self.target_directory = target_directory
+        # (name, path, kept) of every entry in the order extracted
+        self._extracted = []
+
+    def _fill(self, size):
+        while len(self._buffer) < size:
+            data = self._source.read()
+            if not data:
+                raise ValueError('Zip stream is truncated')
+            self._buffer += data
+
+    def _read(self, size):
+        self._fill(size)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def _chunks(self, size=None):
+        '''
+        Yields the next ``size`` bytes, or everything left without one
+        '''
+        while size is None or size > 0:
+            if not self._buffer:
+                data = self._source.read()
+                if not data:
+                    if size is None:
+                        return
+                    raise ValueError('Zip stream is truncated')
+                self._buffer += data
+            take = len(self._buffer) if size is None else min(size, len(self._buffer))
+            data = bytes(self._buffer[:take])
+            del self._buffer[:take]
+            if size is not None:
+                size -= take
+            yield data
+
+    def _output_path(self, name):
+        # the same sanitizing ZipFile.extract does
+        arcname = name.replace('/', os.path.sep)
+        if os.path.altsep:
+            arcname = arcname.replace(os.path.altsep, os.path.sep)
+        arcname = os.path.splitdrive(arcname)[1]
+        invalid_path_parts = ('', os.path.curdir, os.path.pardir)
+        arcname = os.path.sep.join(x for x in arcname.split(os.path.sep) if x not in invalid_path_parts)
+        return os.path.join(self.target_directory, arcname)
+
+    def _decompress(self, compress_type, compress_size, descriptor, write):
+        if compress_type == zipfile.ZIP_STORED and not descriptor:
+            for data in self._chunks(compress_size):
+                write(data)
+            return
+        if compress_type != zipfile.ZIP_DEFLATED:
+            raise ValueError('Unsupported zip compression: {}'.format(compress_type))
+        decompressor = zlib.decompressobj(-15)
+        chunks = self._chunks(None if descriptor else compress_size)
+        for data in chunks:
+            while data:
+                write(decompressor.decompress(data, CHUNK_SIZE))
+                data = decompressor.unconsumed_tail
+            if decompressor.eof:
+                break
+        if not decompressor.eof:
+            raise ValueError('Zip stream is truncated')
+        # what followed the compressed data belongs to the next record
+        self._buffer[:0] = decompressor.unused_data
+
+    def _extract_entry(self):
+        (_, _, flags, compress_type, _, _, crc, compress_size, file_size,
+         name_length, extra_length) = _LOCAL_HEADER.unpack(_LOCAL_SIGNATURE + self._read(_LOCAL_HEADER.size - 4))
+        name = self._read(name_length).decode('utf-8' if flags & _FLAG_UTF8 else 'cp437')
+        extra = self._read(extra_length)
+        zip64 = False
+        while len(extra) >= 4:
+            header_id, size = struct.unpack('<HH', extra[:4])
+            if header_id == _ZIP64_EXTRA:
+                zip64 = True
+                values = list(struct.unpack('<{}Q'.format(size // 8), extra[4:4 + size]))
+                if file_size == _ZIP64_LIMIT and values:
+                    file_size = values.pop(0)
+                if compress_size == _ZIP64_LIMIT and values:
+                    compress_size = values.pop(0)
+            extra = extra[4 + size:]
+        descriptor = bool(flags & _FLAG_DESCRIPTOR)
+
+        out_path = self._output_path(name)
+        # Special case, the important dirs were pre-created so leave them alone
+        kept = os.path.isdir(out_path) and not os.path.islink(out_path)
+        checksum = [0]
+        if name.endswith('/') or kept:
+            def write(data):
+                checksum[0] = zlib.crc32(data, checksum[0])
+            if not kept:
+                os.makedirs(out_path, exist_ok=True)
+            self._decompress(compress_type, compress_size, descriptor, write)
+        else:
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            # written next to the target and renamed, replacing rather than following a symlink there
+            temporary_path = '{}.{}.tmp'.format(out_path, os.getpid())
+            with open(temporary_path, 'wb') as out_file:
+                def write(data):
+                    checksum[0] = zlib.crc32(data, checksum[0])
+                    out_file.write(data)
+                self._decompress(compress_type, compress_size, descriptor, write)
+            os.replace(temporary_path, out_path)
+
+        if descriptor:
+            self._fill(4)
+            if bytes(self._buffer[:4]) == _DESCRIPTOR_SIGNATURE:
+                self._read(4)
+            crc = struct.unpack('<LQQ' if zip64 else '<LLL', self._read(20 if zip64 else 12))[0]
+        if checksum[0] != crc:
+            raise ValueError('Bad CRC-32 for {}'.format(name))
+        self._extracted.append((name, out_path, kept))
+
+    def _external_attrs(self):
+        '''
+        Reads the central directory, returns the external attributes by name
+        '''
+        directory = _CENTRAL_SIGNATURE + b''.join(self._chunks())
+        attrs = {}
+        offset = 0
+        while directory[offset:offset + 4] == _CENTRAL_SIGNATURE:
+            header = _CENTRAL_HEADER.unpack_from(directory, offset)
+            flags, name_length, extra_length, comment_length, external_attr = header[5], header[12], header[13], header[14], header[17]
+            start = offset + _CENTRAL_HEADER.size
+            name = directory[start:start + name_length].decode('utf-8' if flags & _FLAG_UTF8 else 'cp437')
+            attrs[name] = external_attr
+            offset = start + name_length + extra_length + comment_length
+        return attrs
+
+    def extract(self):
+        while True:
+            signature = self._read(4)
+            if signature == _LOCAL_SIGNATURE:
+                self._extract_entry()
+            elif signature == _CENTRAL_SIGNATURE:
+                attrs = self._external_attrs()
+                break
+            else:
+                # an empty archive only has its end record
+                attrs = {}
+                for _ in self._chunks():
+                    pass
+                break
+
+        # entries in a directory come after it, so that is changed last
+        for name, out_path, kept in reversed(self._extracted):
+            if kept:
+                continue
+            perms = attrs.get(name, 0) >> 16
+            if stat.filemode(perms)[:1] == 'l':
+                with open(out_path) as link_file:
+                    link = link_file.read()
+                os.remove(out_path)
+                os.symlink(link, out_path)
+            else:
+                os.chmod(out_path, perms)
+
+
+def _unstream_zip(stream, target_directory, binary):
+    source = _FrameReader(stream) if binary else _Base64Line(stream)
+    _ZipStreamReader(source, target_directory).extract()
+    trailer = json.loads(stream.readline())
+    if trailer.get('zipstream_size') != source.size:
+        raise ValueError('Zip stream size mismatch: read {} of {} bytes'.format(source.size, trailer.get('zipstream_size')))
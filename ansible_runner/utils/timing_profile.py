@@ -0,0 +1,124 @@
+import heapq
+import json
+import math
+import os
+import stat
+import threading
+
+TIMING_PROFILE_FILENAME = 'timing_profile.json'
+DEFAULT_SLOWEST = 10
+
+# the events with the duration of a task on a host
+RESULT_EVENTS = ('runner_on_ok', 'runner_on_failed', 'runner_on_skipped', 'runner_on_unreachable')
+
+# histogram buckets grow by 5%, which bounds the error of the percentiles;
+# shorter durations share the first bucket
+BUCKET_GROWTH = 1.05
+MIN_DURATION = 0.001
+_LOG_GROWTH = math.log(BUCKET_GROWTH)
+
+
+class DurationHistogram(object):
+    '''
+    Counts durations in logarithmic buckets, so percentiles are known within
+    the bucket width without keeping every duration
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = {}
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.min = duration if self.min is None else min(self.min, duration)
+        self.max = duration if self.max is None else max(self.max, duration)
+        bucket = int(math.log(max(duration, MIN_DURATION) / MIN_DURATION) / _LOG_GROWTH)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(q * self.count)))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                break
+        upper = MIN_DURATION * BUCKET_GROWTH ** (bucket + 1)
+        return min(max(upper, self.min), self.max)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+        }
+
+
+class TimingProfile(object):
+    '''
+    Folds the durations of task results into per-task and per-host
+    histograms as job events are handled, and keeps the hosts a task took
+    the longest on. The ``slowest`` hosts of the whole run are those with
+    the most time spent in tasks.
+    '''
+
+    def __init__(self, slowest=DEFAULT_SLOWEST):
+        self.slowest = slowest
+        self._lock = threading.Lock()
+        # task uuid -> [task name, histogram, heap of the (duration, host) the task took longest on]
+        self._tasks = {}
+        self._hosts = {}
+        self.results = 0
+
+    def update(self, event_data):
+        if event_data.get('event') not in RESULT_EVENTS:
+            return
+        event_data_dict = event_data.get('event_data') or {}
+        duration = event_data_dict.get('duration')
+        host = event_data_dict.get('host')
+        if duration is None or host is None:
+            return
+        task_uuid = event_data_dict.get('task_uuid')
+        with self._lock:
+            self.results += 1
+            task = self._tasks.get(task_uuid)
+            if task is None:
+                task = self._tasks[task_uuid] = [event_data_dict.get('task'), DurationHistogram(), []]
+            task[1].add(duration)
+            if len(task[2]) < self.slowest:
+                heapq.heappush(task[2], (duration, host))
+            elif duration > task[2][0][0]:
+                heapq.heapreplace(task[2], (duration, host))
+            if host not in self._hosts:
+                self._hosts[host] = DurationHistogram()
+            self._hosts[host].add(duration)
+
+    def snapshot(self):
+        with self._lock:
+            tasks = []
+            for task_uuid, (name, histogram, slowest) in self._tasks.items():
+                summary = dict(task_uuid=task_uuid, task=name, **histogram.summary())
+                summary['slowest_hosts'] = [{'host': host, 'duration': duration} for duration, host in sorted(slowest, reverse=True)]
+                tasks.append(summary)
+            hosts = dict((host, histogram.summary()) for host, histogram in self._hosts.items())
+        slowest = heapq.nlargest(self.slowest, hosts.items(), key=lambda item: item[1]['total'])
+        return {
+            'tasks': tasks,
+            'hosts': hosts,
+            'slowest_hosts': [{'host': host, 'total': summary['total']} for host, summary in slowest],
+        }
+
+    def dump(self, filename):
+        temporary_filename = filename + '.tmp'
+        with os.fdopen(os.open(temporary_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, stat.S_IRUSR | stat.S_IWUSR), 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.rename(temporary_filename, filename)
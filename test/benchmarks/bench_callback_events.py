@@ -0,0 +1,97 @@
+'''
+Measures the per-event overhead the display callback adds to a playbook run:
+building the begin dict of an event and writing its begin and end tokens
+around a line of stdout, with the partial event data going to an in-memory
+cache instead of the event pipe. Results with different sizes show how much
+of the cost is per event and how much per byte of result.
+
+With ``--threads`` every thread emits events the way the callback module
+does, collecting each event with its output before writing it, and the time
+the display lock was waited for and held is reported. ``--hold-lock`` holds
+the lock for the whole event instead, as the callback used to.
+
+    python -m test.benchmarks.bench_callback_events
+    python -m test.benchmarks.bench_callback_events --sizes 0 --events 200000
+    python -m test.benchmarks.bench_callback_events --threads 8 [--hold-lock]
+'''
+import argparse
+import io
+import threading
+import time
+
+from test.benchmarks.bench_event_pipeline import RecordingCache, load_callback_events
+
+DEFAULT_SIZES = (0, 1024, 65536)
+DEFAULT_EVENTS = 20000
+# lines of output written for every event, like a task result displayed by the default callback
+OUTPUT_LINES = 5
+
+
+def run(event_context, size, count):
+    res = {'changed': False, 'stdout': u'y' * size}
+    stdout = io.StringIO()
+    start = time.perf_counter()
+    for n in range(count):
+        with event_context.set_local(event='runner_on_ok', host='host{}'.format(n % 50), task='task', res=res):
+            event_context.dump_begin(stdout)
+            stdout.write(u'ok: [host]\r\n')
+            event_context.dump_end(stdout)
+    return time.perf_counter() - start
+
+
+def run_threads(events, size, count, threads, hold_lock):
+    event_context = events.event_context
+    stdout = events.BufferedOutput(io.StringIO(), event_context)
+    res = {'changed': False, 'stdout': u'y' * size}
+
+    def emit(thread):
+        for n in range(count // threads):
+            with event_context.display_lock if hold_lock else event_context.buffered():
+                with event_context.set_local(event='runner_on_ok', host='host{}'.format(thread), task='task', res=res):
+                    event_context.dump_begin(stdout)
+                    for line in range(OUTPUT_LINES):
+                        stdout.write(u'ok: [host{}] => line {}\r\n'.format(thread, line))
+                    event_context.dump_end(stdout)
+
+    workers = [threading.Thread(target=emit, args=(thread,)) for thread in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='bytes of result per event')
+    parser.add_argument('--events', type=int, default=DEFAULT_EVENTS)
+    parser.add_argument('--threads', type=int, default=0, help='emit events from this many threads')
+    parser.add_argument('--hold-lock', action='store_true', help='hold the display lock for the whole event')
+    args = parser.parse_args()
+
+    events = load_callback_events()
+    event_context = events.event_context
+    event_context.cache = RecordingCache()
+    event_context.add_global(playbook='bench.yml', playbook_uuid='6a8b4c8e-3f0c-4c0e-9b7d-0d1c2e3f4a5b')
+    if args.threads:
+        print('{:>8} {:>8} {:>10} {:>10} {:>10} {:>10}'.format('size', 'events', 'us/event', 'wait us', 'hold us', 'max hold'))
+    else:
+        print('{:>8} {:>8} {:>10} {:>10}'.format('size', 'events', 'us/event', 'events/s'))
+    for size in args.sizes:
+        event_context.cache.values = []
+        if not args.threads:
+            elapsed = run(event_context, size, args.events)
+            print('{:>8} {:>8} {:>10.2f} {:>10.0f}'.format(size, args.events, elapsed / args.events * 1e6, args.events / elapsed))
+            continue
+        event_context.display_lock = events.InstrumentedLock(event_context.display_lock._lock)
+        elapsed = run_threads(events, size, args.events, args.threads, args.hold_lock)
+        stats = event_context.display_lock.stats
+        acquisitions = stats['acquisitions'] or 1
+        print('{:>8} {:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+            size, args.events, elapsed / args.events * 1e6, stats['wait_time'] / acquisitions * 1e6,
+            stats['hold_time'] / acquisitions * 1e6, stats['max_hold_time'] * 1e6))
+
+
+if __name__ == '__main__':
+    main()
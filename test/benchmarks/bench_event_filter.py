@@ -0,0 +1,76 @@
+'''
+Measures how OutputEventFilter scales with the size of a single job event
+that arrives split across many small writes, the way pexpect hands it over.
+The event either carries a large encoded payload in its token or a large
+stdout; a third shape packs many small events into every write, raise
+``--read-size`` to see how it copes with large reads. Time per MB should stay
+flat as the stream grows.
+
+    python -m test.benchmarks.bench_event_filter
+    python -m test.benchmarks.bench_event_filter --read-size 4194304
+'''
+import argparse
+import base64
+import io
+import json
+import time
+
+from ansible_runner.utils import OutputEventFilter
+
+MAX_WIDTH = 78
+
+
+def encode_event(data):
+    b64data = base64.b64encode(json.dumps(data).encode('utf-8')).decode()
+    chunks = []
+    for offset in range(0, len(b64data), MAX_WIDTH):
+        chunk = b64data[offset:offset + MAX_WIDTH]
+        chunks.append(u'{}\x1b[{}D'.format(chunk, len(chunk)))
+    return u'\x1b[K' + u''.join(chunks) + u'\x1b[K'
+
+
+def build_stream(shape, size):
+    uuid = '890773f5-fe6d-4091-8faf-bdc8021d65dd'
+    if shape == 'token':
+        return encode_event({'uuid': uuid, 'res': 'x' * size}) + u'ok: [localhost]\r\n' + encode_event({})
+    line = u'x' * 78 + u'\r\n'
+    if shape == 'many':
+        event = encode_event({'uuid': uuid}) + line + encode_event({})
+        return event * (size // len(event))
+    return encode_event({'uuid': uuid}) + line * (size // len(line)) + encode_event({})
+
+
+def run(shape, size, read_size, as_bytes=False):
+    stream = build_stream(shape, size)
+    expected_events = 1 if shape != 'many' else stream.count(u'\r\n')
+    events = []
+    if as_bytes:
+        stream = stream.encode('utf-8')
+        event_filter = OutputEventFilter(io.BytesIO(), events.append, suppress_ansible_output=True)
+    else:
+        event_filter = OutputEventFilter(io.StringIO(), events.append, suppress_ansible_output=True)
+    start = time.perf_counter()
+    for offset in range(0, len(stream), read_size):
+        event_filter.write(stream[offset:offset + read_size])
+    elapsed = time.perf_counter() - start
+    assert len(events) == expected_events
+    return len(stream), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--read-size', type=int, default=4096, help='size of every write (default: 4096)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='event payload sizes in MB')
+    parser.add_argument('--bytes', action='store_true', help='write bytes, the way Runner feeds pexpect output')
+    args = parser.parse_args()
+
+    print('{:>6} {:>10} {:>12} {:>10} {:>10}'.format('shape', 'payload', 'stream bytes', 'seconds', 's/MB'))
+    for shape in ('token', 'stdout', 'many'):
+        for size in args.sizes:
+            stream_size, elapsed = run(shape, size * 1024 * 1024, args.read_size, as_bytes=args.bytes)
+            print('{:>6} {:>8}MB {:>12} {:>10.3f} {:>10.4f}'.format(
+                shape, size, stream_size, elapsed, elapsed / (stream_size / 1024.0 / 1024.0)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+'''
+Throughput benchmarks for the job event pipeline, runnable without Ansible.
+
+Synthetic display callback output, encoded by ``EventContext`` from
+``display_callback/events.py``, goes through one of these stages:
+
+- ``filter``: OutputEventFilter parsing the callback stdout into events
+- ``runner``: Runner running a process that plays the display callback, so
+  the stdout goes through pexpect and OutputEventFilter while the partial
+  event data arrives over the event pipe, then Runner.event_callback
+  merges and stores every event
+- ``streaming``: Worker.event_handler writing the events of a run to a
+  stream that Processor.run reads back and stores
+
+Scenarios vary the size of every event (its result and stdout) and the share
+of verbose lines between events. Every scenario runs in a fresh interpreter
+and reports events/s, MB/s of stage input (callback stdout and partial event
+data, or the worker stream), peak RSS and the read/write calls per event made
+by the benchmark process (from /proc/self/io, Linux only). Those miss the
+open, chmod, rename, fsync and close calls of storing events; ``--strace``
+counts every syscall of the scenario and the processes it starts with
+``strace -c -f`` instead, less those of a run that only sets the scenario up.
+
+    python -m test.benchmarks.bench_event_pipeline
+    python -m test.benchmarks.bench_event_pipeline --stages filter --sizes 1024 --events 20000
+    python -m test.benchmarks.bench_event_pipeline --stages runner --strace
+'''
+import argparse
+import importlib.util
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pexpect
+
+import ansible_runner
+from ansible_runner import Runner
+from ansible_runner.config.runner import RunnerConfig
+from ansible_runner.streaming import Processor, Worker
+from ansible_runner.utils import OutputEventFilter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STAGES = ('filter', 'runner', 'streaming')
+DEFAULT_SIZES = (256, 4096, 65536)
+DEFAULT_VERBOSE_RATIOS = (0.0, 0.5, 0.9)
+DEFAULT_EVENTS = 1000
+READ_SIZE = 4096
+LINE_WIDTH = 100
+
+# set by --setup-only: scenarios stop before their measured part, for the
+# syscalls of the setup that --strace takes off
+SETUP_ONLY = False
+
+
+def load_callback_events():
+    path = os.path.join(os.path.dirname(ansible_runner.__file__), 'display_callback', 'events.py')
+    spec = importlib.util.spec_from_file_location('callback_events', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class RecordingCache(object):
+    '''
+    Stands in for the partial event data destinations of the display callback
+    '''
+
+    def __init__(self):
+        self.values = []
+
+    def set(self, key, value):
+        self.values.append(value)
+
+
+def generate(event_context, fileobj, size, verbose_ratio, count, seed=0, newline=u'\r\n'):
+    '''
+    Write ``count`` outputs of the display callback to ``fileobj``, each a
+    verbose line with a chance of ``verbose_ratio``, otherwise a
+    ``runner_on_ok`` event with about ``size`` bytes of result and stdout.
+    Lines end in ``newline``, which a pty turns into ``\\r\\n``.
+    '''
+    rng = random.Random(seed)
+    line = u'x' * (LINE_WIDTH - 2) + newline
+    stdout = line * max(size // LINE_WIDTH, 1)
+    for n in range(count):
+        if rng.random() < verbose_ratio:
+            fileobj.write(u'<host{}> ESTABLISH SSH CONNECTION FOR USER: None{}'.format(n % 50, newline))
+            continue
+        res = {'changed': False, 'stdout': u'y' * size}
+        with event_context.set_local(event='runner_on_ok', host='host{}'.format(n % 50), task='task{}'.format(n // 50), res=res):
+            event_context.dump_begin(fileobj)
+            fileobj.write(stdout)
+            event_context.dump_end(fileobj)
+
+
+def synthetic_stream(size, verbose_ratio, count):
+    '''
+    Returns the callback stdout as bytes and the partial event data sent along with it
+    '''
+    events = load_callback_events()
+    cache = RecordingCache()
+    events.event_context.cache = cache
+    stdout = io.StringIO()
+    generate(events.event_context, stdout, size, verbose_ratio, count)
+    return stdout.getvalue().encode('utf-8'), cache.values
+
+
+def read_write_calls():
+    '''
+    Returns the number of read and write calls of this process, from
+    /proc/self/io, which doesn't count any other syscalls
+    '''
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+    except (IOError, ValueError):
+        return None
+    return int(counters['syscr']) + int(counters['syscw'])
+
+
+def parse_strace_summary(summary):
+    '''
+    Returns the number of calls of every syscall in the table of ``strace -c``
+    '''
+    counts = {}
+    for line in summary.splitlines():
+        fields = line.split()
+        # % time, seconds, usecs/call, calls, [errors,] syscall
+        if len(fields) >= 5 and fields[0][:1].isdigit() and fields[-1] != 'total':
+            counts[fields[-1]] = int(fields[3])
+    return counts
+
+
+def strace_syscalls(command):
+    '''
+    Runs ``command`` under ``strace -c -f``, returns its output and the
+    number of calls of every syscall it and the processes it started made
+    '''
+    with tempfile.NamedTemporaryFile(prefix='bench-event-pipeline-strace-') as summary:
+        output = subprocess.check_output(['strace', '-c', '-f', '-o', summary.name] + command, cwd=ROOT)
+        counts = parse_strace_summary(summary.read().decode('utf-8'))
+    return output, counts
+
+
+def measure(target):
+    if SETUP_ONLY:
+        return {}
+    calls = read_write_calls()
+    start = time.perf_counter()
+    events, input_bytes = target()
+    elapsed = time.perf_counter() - start
+    if calls is not None:
+        calls = read_write_calls() - calls
+    return {
+        'events': events,
+        'seconds': elapsed,
+        'events_per_second': events / elapsed,
+        'mb_per_second': input_bytes / elapsed / 1024.0 / 1024.0,
+        # kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        'read_write_calls_per_event': float(calls) / events if calls is not None else None,
+        # all syscalls, only counted with --strace
+        'syscalls_per_event': None,
+    }
+
+
+def bench_filter(tmp_dir, size, verbose_ratio, count, passthrough=False):
+    stream, partials = synthetic_stream(size, verbose_ratio, count)
+    events = []
+
+    def target():
+        with open(os.path.join(tmp_dir, 'stdout'), 'wb') as handle:
+            event_filter = OutputEventFilter(handle, events.append, suppress_ansible_output=True)
+            for offset in range(0, len(stream), READ_SIZE):
+                event_filter.write(stream[offset:offset + READ_SIZE])
+            event_filter.close()
+        return len(events) - 1, len(stream)
+
+    return measure(target)
+
+
+def bench_runner(tmp_dir, size, verbose_ratio, count, passthrough=False):
+    stream, partials = synthetic_stream(size, verbose_ratio, count)
+    input_bytes = len(stream) + sum(len(json.dumps(partial)) for partial in partials)
+
+    rc = RunnerConfig(tmp_dir)
+    rc.command = [sys.executable, '-m', 'test.benchmarks.bench_event_pipeline', '--emit',
+                  '--sizes', str(size), '--verbose-ratios', str(verbose_ratio), '--events', str(count)]
+    rc.cwd = ROOT
+    rc.env = {'PYTHONPATH': ROOT}
+    rc.suppress_ansible_output = True
+    rc.expect_passwords = {pexpect.TIMEOUT: None, pexpect.EOF: None}
+    rc.job_timeout = 0
+    rc.idle_timeout = 0
+    rc.pexpect_timeout = .1
+    rc.pexpect_use_poll = True
+    rc.event_passthrough = passthrough
+    runner = Runner(config=rc)
+
+    def target():
+        status, rc = runner.run()
+        if status != 'successful':
+            raise RuntimeError('synthetic callback process {}'.format(status))
+        return len(runner.event_index), input_bytes
+
+    return measure(target)
+
+
+def bench_streaming(tmp_dir, size, verbose_ratio, count, passthrough=False):
+    stream, partials = synthetic_stream(size, verbose_ratio, count)
+    # the events Runner hands to the worker's event handler
+    events = []
+    event_filter = OutputEventFilter(io.BytesIO(), events.append, suppress_ansible_output=True)
+    event_filter.write(stream)
+    event_filter.close()
+    partials = dict((partial['uuid'], partial) for partial in partials)
+    for event_data in events[:-1]:
+        event_data.update(partials.get(event_data['uuid'], {}))
+    events = events[:-1]
+    stream_filename = os.path.join(tmp_dir, 'worker_stream')
+
+    def target():
+        with open(stream_filename, 'wb') as output:
+            worker = Worker(_input=io.BytesIO(), _output=output, private_data_dir=os.path.join(tmp_dir, 'worker'))
+            worker.status_handler({'status': 'running', 'runner_ident': 'bench'}, None)
+            for event_data in events:
+                worker.event_handler(event_data)
+            worker.finished_callback(None)
+        with open(stream_filename, 'rb') as worker_stream:
+            processor = Processor(_input=worker_stream, private_data_dir=os.path.join(tmp_dir, 'processor'), quiet=True, settings={})
+            processor.run()
+        return len(processor._event_index), os.path.getsize(stream_filename)
+
+    return measure(target)
+
+
+BENCHMARKS = {
+    'filter': bench_filter,
+    'runner': bench_runner,
+    'streaming': bench_streaming,
+}
+
+
+def run_scenario(stage, size, verbose_ratio, count, passthrough=False):
+    tmp_dir = tempfile.mkdtemp(prefix='bench-event-pipeline-')
+    try:
+        result = BENCHMARKS[stage](tmp_dir, size, verbose_ratio, count, passthrough)
+    finally:
+        shutil.rmtree(tmp_dir)
+    result.update(stage=stage, size=size, verbose_ratio=verbose_ratio)
+    return result
+
+
+def run_isolated(stage, size, verbose_ratio, count, passthrough=False, strace=False):
+    command = [
+        sys.executable, '-m', 'test.benchmarks.bench_event_pipeline', '--scenario',
+        '--stages', stage, '--sizes', str(size), '--verbose-ratios', str(verbose_ratio), '--events', str(count),
+    ] + (['--passthrough'] if passthrough else [])
+    if not strace:
+        return json.loads(subprocess.check_output(command, cwd=ROOT).decode('utf-8'))
+
+    output, counts = strace_syscalls(command)
+    result = json.loads(output.decode('utf-8'))
+    # the interpreter start and the synthetic input are no part of the stage
+    setup_output, setup_counts = strace_syscalls(command + ['--setup-only'])
+    per_event = dict((name, float(calls - setup_counts.get(name, 0)) / result['events']) for name, calls in counts.items())
+    result['syscalls_per_event'] = sum(per_event.values())
+    result['syscalls'] = dict((name, round(calls, 2)) for name, calls in sorted(per_event.items()) if calls >= 0.01)
+    return result
+
+
+def format_calls(calls):
+    return '{:.2f}'.format(calls) if calls is not None else '-'
+
+
+def format_result(result):
+    return '{:>9} {:>7} {:>7.0%} {:>7} {:>10.0f} {:>8.1f} {:>8.1f} {:>9} {:>9}'.format(
+        result['stage'], result['size'], result['verbose_ratio'], result['events'], result['events_per_second'],
+        result['mb_per_second'], result['peak_rss_mb'], format_calls(result['read_write_calls_per_event']),
+        format_calls(result['syscalls_per_event']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='bytes of result and stdout per event')
+    parser.add_argument('--verbose-ratios', type=float, nargs='+', default=list(DEFAULT_VERBOSE_RATIOS),
+                        help='share of verbose lines among the callback outputs')
+    parser.add_argument('--events', type=int, default=DEFAULT_EVENTS, help='callback outputs per scenario')
+    parser.add_argument('--json', action='store_true', help='print one JSON result per line')
+    parser.add_argument('--passthrough', action='store_true', help='store events with event_passthrough in the runner stage')
+    parser.add_argument('--strace', action='store_true', help='count all syscalls per event with strace -c -f')
+    # internal: run a single scenario in this process / play the display callback
+    parser.add_argument('--scenario', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--emit', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--setup-only', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.strace and shutil.which('strace') is None:
+        parser.error('--strace needs strace on the PATH')
+
+    if args.emit:
+        events = load_callback_events()
+        generate(events.event_context, sys.stdout, args.sizes[0], args.verbose_ratios[0], args.events, newline=u'\n')
+        sys.stdout.flush()
+        return
+    if args.scenario:
+        global SETUP_ONLY
+        SETUP_ONLY = args.setup_only
+        print(json.dumps(run_scenario(args.stages[0], args.sizes[0], args.verbose_ratios[0], args.events, args.passthrough)))
+        return
+
+    if not args.json:
+        print('{:>9} {:>7} {:>8} {:>7} {:>10} {:>8} {:>8} {:>9} {:>9}'.format(
+            'stage', 'size', 'verbose', 'events', 'events/s', 'MB/s', 'RSS MB', 'rw/event', 'sys/event'))
+    for stage in args.stages:
+        for size in args.sizes:
+            for verbose_ratio in args.verbose_ratios:
+                result = run_isolated(stage, size, verbose_ratio, args.events, args.passthrough, args.strace)
+                print(json.dumps(result) if args.json else format_result(result))
+                sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
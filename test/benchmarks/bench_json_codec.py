@@ -0,0 +1,69 @@
+'''
+Compares the JSON codec of ansible_runner.utils.json_codec with the json
+module of the standard library at every place a job event is encoded or
+decoded on its way from the display callback to the artifacts, for events
+of different result sizes. Without orjson installed both columns measure
+the standard library.
+
+    python -m test.benchmarks.bench_json_codec
+    python -m test.benchmarks.bench_json_codec --sizes 100000 --calls 200
+'''
+import argparse
+import json
+import timeit
+
+from ansible_runner.utils import json_codec
+from test.benchmarks.bench_event_pipeline import load_callback_events
+
+DEFAULT_SIZES = (256, 4096, 65536)
+DEFAULT_CALLS = 2000
+
+
+def build_event(events, size):
+    event_context = events.event_context
+    res = {'changed': False, 'rc': 0, 'stdout': u'y' * size, 'stdout_lines': [u'y' * 78] * (size // 80)}
+    with event_context.set_local(event='runner_on_ok', host='host1', task='task1', playbook='site.yml', res=res):
+        partial = event_context.get_begin_dict()
+    event_data = dict(partial, counter=1, stdout=u'ok: [host1]', start_line=0, end_line=1, runner_ident='bench')
+    return partial, event_data
+
+
+def call_sites(events, partial, event_data):
+    '''
+    Returns (site, stdlib call, codec call) for every place an event goes through JSON
+    '''
+    encoder = events.AnsibleJSONEncoderLocal
+    token = {'uuid': partial['uuid']}
+    partial_bytes = json.dumps(partial).encode('utf-8')
+    event_bytes = json.dumps(event_data).encode('utf-8')
+    return [
+        ('callback token', lambda: json.dumps(token).encode('utf-8'), lambda: events.json_dumpb(token)),
+        ('callback partial', lambda: json.dumps(partial, cls=encoder).encode('utf-8'), lambda: events.json_dumpb(partial)),
+        ('filter token', lambda: json.loads(b'{"uuid": "0"}'), lambda: json_codec.loads(b'{"uuid": "0"}')),
+        ('runner partial', lambda: json.loads(partial_bytes), lambda: json_codec.loads(partial_bytes)),
+        ('runner event file', lambda: json.dumps(event_data), lambda: json_codec.dumps(event_data)),
+        ('worker stream', lambda: json.dumps(event_data).encode('utf-8'), lambda: json_codec.dumpb(event_data)),
+        ('processor stream', lambda: json.loads(event_bytes), lambda: json_codec.loads(event_bytes)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='bytes of stdout per result')
+    parser.add_argument('--calls', type=int, default=DEFAULT_CALLS)
+    args = parser.parse_args()
+
+    events = load_callback_events()
+    print('codec: {}'.format(json_codec.CODEC))
+    print('{:>18} {:>7} {:>11} {:>11} {:>8}'.format('site', 'size', 'json us', 'codec us', 'speedup'))
+    for size in args.sizes:
+        partial, event_data = build_event(events, size)
+        for site, stdlib, codec in call_sites(events, partial, event_data):
+            stdlib_time = min(timeit.repeat(stdlib, number=args.calls, repeat=3)) / args.calls
+            codec_time = min(timeit.repeat(codec, number=args.calls, repeat=3)) / args.calls
+            print('{:>18} {:>7} {:>11.2f} {:>11.2f} {:>7.1f}x'.format(
+                site, size, stdlib_time * 1e6, codec_time * 1e6, stdlib_time / codec_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -294,6 +294,35 @@ def test_callback_plugin_records_notify_events(executor, playbook, skipif_pre_an
     assert notify_events[0]['event_data']['task'] == 'debug'
 
 
+@pytest.mark.parametrize('playbook', [
+{'loop_items.yml': '''
+- name: aggregate loop items
+  connection: local
+  hosts: all
+  gather_facts: no
+  tasks:
+    - debug: msg="{{ item }}"
+      loop: "{{ range(25) | list }}"
+      failed_when: item == 7
+      ignore_errors: true
+'''},  # noqa
+])
+@pytest.mark.parametrize('envvars', [
+    {'RUNNER_ITEM_AGGREGATION': 'True', 'RUNNER_ITEM_AGGREGATION_BATCH': '10'},
+])
+def test_callback_plugin_aggregates_loop_items(executor, playbook, envvars, skipif_pre_ansible28):
+    executor.run()
+    events = list(executor.events)
+    assert not [x for x in events if x['event'] in ('runner_item_on_ok', 'runner_item_on_skipped')]
+    failed = [x for x in events if x['event'] == 'runner_item_on_failed']
+    assert len(failed) == 1
+    assert failed[0]['event_data']['res']['item'] == 7
+    summaries = [x['event_data'] for x in events if x['event'] == 'runner_item_summary']
+    assert [(x['items']['items'], x['final']) for x in summaries] == [(10, False), (10, False), (25, True)]
+    assert summaries[-1]['items']['failed'] == 1
+    assert summaries[-1]['task'] == 'debug'
+
+
 @pytest.mark.parametrize('playbook', [
 {'no_log_module_with_var.yml': '''
 - name: ensure that module-level secrets are redacted
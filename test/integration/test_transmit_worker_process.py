@@ -3,12 +3,15 @@ import os
 import socket
 import concurrent.futures
 import time
+import threading
 
 import pytest
 import json
 
 from ansible_runner import run
 from ansible_runner.streaming import Transmitter, Worker, Processor
+from ansible_runner.utils.journal import collect_journal_events
+from ansible_runner.utils.streaming import stream_dir, unstream_dir
 
 import ansible_runner.interface  # AWX import pattern
 
@@ -257,6 +260,95 @@ def test_unparsable_private_dir_worker(tmp_path):
     assert b'"status": "error"' in sent
 
 
+def test_transmit_zipstream(tmp_path, project_fixtures):
+    outgoing_buffer = io.BytesIO()
+    outgoing_buffer.name = 'not_stdout'
+    transmitter = Transmitter(_output=outgoing_buffer, private_data_dir=project_fixtures / 'debug',
+                              playbook='debug.yml', zipstream=True)
+    transmitter.run()
+
+    lines = outgoing_buffer.getvalue().splitlines()
+    assert json.loads(lines[0]) == {'kwargs': {'playbook': 'debug.yml'}, 'accept': ['zipstream', 'binary']}
+    assert json.loads(lines[1]) == {'zipstream': True}
+    assert json.loads(lines[-1]) == {'eof': True}
+
+    worker_dir = tmp_path / 'for_worker'
+    incoming = io.BytesIO(outgoing_buffer.getvalue())
+    incoming.readline()
+    incoming.readline()
+    unstream_dir(incoming, None, worker_dir)
+    assert (worker_dir / 'project' / 'debug.yml').read_bytes() == (project_fixtures / 'debug' / 'project' / 'debug.yml').read_bytes()
+
+
+@pytest.mark.parametrize('text_only', [False, True])
+def test_transmit_binary_payload(tmp_path, project_fixtures, text_only):
+    outgoing_buffer = io.BytesIO()
+    outgoing_buffer.name = 'not_stdout'
+    transmitter = Transmitter(_output=outgoing_buffer, private_data_dir=project_fixtures / 'debug',
+                              playbook='debug.yml', binary_payload=True, text_only=text_only)
+    transmitter.run()
+
+    outgoing_buffer.seek(0)
+    kwargs_line = json.loads(outgoing_buffer.readline())
+    size_data = json.loads(outgoing_buffer.readline())
+    if text_only:
+        assert kwargs_line['accept'] == ['zipstream']
+        assert 'binary' not in size_data
+    else:
+        assert kwargs_line['accept'] == ['zipstream', 'binary']
+        assert size_data['binary'] is True
+
+    worker_dir = tmp_path / 'for_worker'
+    unstream_dir(outgoing_buffer, size_data['zipfile'], worker_dir, binary=size_data.get('binary', False))
+    assert json.loads(outgoing_buffer.readline()) == {'eof': True}
+    assert (worker_dir / 'project' / 'debug.yml').read_bytes() == (project_fixtures / 'debug' / 'project' / 'debug.yml').read_bytes()
+
+
+@pytest.mark.parametrize('streaming, binary', [(True, False), (False, True), (True, True)])
+def test_processor_zipstream_artifacts(tmp_path, streaming, binary):
+    artifacts = tmp_path / 'artifacts'
+    artifacts.mkdir()
+    (artifacts / 'rc').write_text('0')
+    incoming_buffer = io.BytesIO()
+    incoming_buffer.name = 'not_stdout'
+    incoming_buffer.write(b'{"status": "successful", "runner_ident": "1"}\n')
+    stream_dir(artifacts, incoming_buffer, streaming=streaming, binary=binary)
+    incoming_buffer.write(b'{"eof": true}\n')
+    incoming_buffer.seek(0)
+
+    process_dir = tmp_path / 'for_process'
+    process_dir.mkdir()
+    processor = Processor(_input=incoming_buffer, private_data_dir=process_dir)
+    processor.run()
+    assert processor.status == 'successful'
+    assert (process_dir / 'artifacts' / 'rc').read_text() == '0'
+
+
+def test_processor_journal_flushed_while_waiting(tmp_path):
+    read_fd, write_fd = os.pipe()
+    worker_stream = os.fdopen(write_fd, 'wb')
+    process_dir = tmp_path / 'for_process'
+    process_dir.mkdir()
+    processor = Processor(_input=os.fdopen(read_fd, 'rb'), private_data_dir=process_dir, quiet=True,
+                          settings={'event_journal': True, 'event_journal_flush_interval': 0.05})
+    thread = threading.Thread(target=processor.run)
+    thread.start()
+    try:
+        worker_stream.write(b'{"uuid": "1", "counter": 1, "event": "verbose", "stdout": "first"}\n')
+        worker_stream.flush()
+        deadline = time.time() + 2
+        collected = []
+        while not collected and time.time() < deadline:
+            threading.Event().wait(0.02)
+            collected = list(collect_journal_events(str(process_dir / 'artifacts' / 'job_events')))
+        # flushed while the processor waits for the worker
+        assert [event['stdout'] for event, position in collected] == ['first']
+    finally:
+        worker_stream.write(b'{"eof": true}\n')
+        worker_stream.close()
+        thread.join()
+
+
 def test_unparsable_private_dir_processor(tmp_path):
     process_dir = tmp_path / 'for_process'
     process_dir.mkdir()
@@ -268,3 +360,13 @@ def test_unparsable_private_dir_processor(tmp_path):
         private_data_dir=process_dir,
     )
     assert processor.status == 'error'
+
+
+def test_worker_event_handler_encoded(tmp_path):
+    outgoing_buffer = io.BytesIO()
+    worker = Worker(_input=io.BytesIO(), _output=outgoing_buffer, private_data_dir=str(tmp_path))
+    assert worker.event_handler.encoded_events
+    worker.event_handler({'uuid': '1', 'counter': 1})
+    worker.event_handler(b'{"uuid": "2", "counter": 2}')
+    assert [json.loads(line) for line in outgoing_buffer.getvalue().splitlines()] == [
+        {'uuid': '1', 'counter': 1}, {'uuid': '2', 'counter': 2}]
@@ -171,6 +171,49 @@ def test_prepare_env_settings(mocker):
     assert rc.settings == value
 
 
+def test_prepare_env_item_aggregation(mocker):
+    mocker.patch('os.makedirs', return_value=True)
+
+    rc = RunnerConfig('/')
+
+    value = {'event_item_aggregation': True, 'event_item_aggregation_batch': 100}
+    settings_side_effect = partial(load_file_side_effect, 'env/settings', value)
+
+    mocker.patch.object(rc.loader, 'load_file', side_effect=settings_side_effect)
+
+    rc.prepare_env()
+    assert rc.env['RUNNER_ITEM_AGGREGATION'] == 'True'
+    assert rc.env['RUNNER_ITEM_AGGREGATION_BATCH'] == '100'
+    assert 'RUNNER_ITEM_AGGREGATION_INTERVAL' not in rc.env
+    assert 'RUNNER_BLOB_THRESHOLD' not in rc.env
+
+
+def test_prepare_env_event_data_fields(mocker):
+    mocker.patch('os.makedirs', return_value=True)
+
+    rc = RunnerConfig('/', event_data_fields=['host', 'res.rc'])
+    rc.prepare_env()
+    assert rc.env['RUNNER_EVENT_DATA_FIELDS'] == 'host,res.rc'
+
+    rc = RunnerConfig('/')
+    rc.prepare_env()
+    assert 'RUNNER_EVENT_DATA_FIELDS' not in rc.env
+
+
+def test_prepare_env_blob_threshold(mocker):
+    mocker.patch('os.makedirs', return_value=True)
+
+    rc = RunnerConfig('/')
+
+    value = {'event_blob_threshold': 65536}
+    settings_side_effect = partial(load_file_side_effect, 'env/settings', value)
+
+    mocker.patch.object(rc.loader, 'load_file', side_effect=settings_side_effect)
+
+    rc.prepare_env()
+    assert rc.env['RUNNER_BLOB_THRESHOLD'] == '65536'
+
+
 def test_prepare_env_sshkey_defaults(mocker):
     mocker.patch('os.makedirs', return_value=True)
 
@@ -0,0 +1,280 @@
+import datetime
+import importlib.util
+import io
+import json
+import os
+import threading
+from unittest import mock
+
+import pytest
+
+import ansible_runner
+from ansible_runner.utils import OutputEventFilter
+from ansible_runner.utils.blob_store import BlobStore
+
+
+@pytest.fixture
+def load_events(monkeypatch):
+    # events.py imports without Ansible, unlike the display_callback package
+    path = os.path.join(os.path.dirname(ansible_runner.__file__), 'display_callback', 'events.py')
+
+    def load(**env):
+        for key in ('JOB_ID', 'AD_HOC_COMMAND_ID', 'PROJECT_UPDATE_ID', 'MAX_EVENT_RES',
+                    'RUNNER_OMIT_EVENTS', 'RUNNER_ONLY_FAILED_EVENTS', 'RUNNER_EVENT_FD',
+                    'RUNNER_ITEM_AGGREGATION', 'RUNNER_ITEM_AGGREGATION_BATCH', 'RUNNER_ITEM_AGGREGATION_INTERVAL',
+                    'RUNNER_BLOB_THRESHOLD', 'AWX_ISOLATED_DATA_DIR', 'RUNNER_EVENT_DATA_FIELDS'):
+            monkeypatch.delenv(key, raising=False)
+        for key, value in env.items():
+            monkeypatch.setenv(key, value)
+        spec = importlib.util.spec_from_file_location('callback_events', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    return load
+
+
+def test_begin_dict(load_events):
+    event_context = load_events(JOB_ID='4', PROJECT_UPDATE_ID='2').event_context
+    event_context.add_global(playbook_uuid='playbook')
+    with event_context.set_local(event='runner_on_ok', host='localhost', verbosity=3, res={'changed': True}):
+        begin_dict = event_context.get_begin_dict()
+    assert begin_dict['event'] == 'runner_on_ok'
+    assert begin_dict['job_id'] == 4
+    assert begin_dict['project_update_id'] == 2
+    assert 'ad_hoc_command_id' not in begin_dict
+    assert begin_dict['pid'] == os.getpid()
+    assert begin_dict['uuid'] and begin_dict['created']
+    assert begin_dict['parent_uuid'] == 'playbook'
+    assert begin_dict['verbosity'] == 3
+    assert begin_dict['event_data'] == {'host': 'localhost', 'playbook_uuid': 'playbook', 'res': {'changed': True}}
+
+
+def test_begin_dict_keeps_event_fields(load_events):
+    event_context = load_events().event_context
+    with event_context.set_local(uuid='abc', pid=1, created='2020-01-01T00:00:00', verbose=True):
+        begin_dict = event_context.get_begin_dict()
+    assert begin_dict['event'] == 'verbose'
+    assert (begin_dict['uuid'], begin_dict['pid'], begin_dict['created']) == ('abc', 1, '2020-01-01T00:00:00')
+
+
+def test_event_fd_must_be_pipe(load_events, tmp_path):
+    read_fd, write_fd = os.pipe()
+    try:
+        cache = load_events(RUNNER_EVENT_FD=str(write_fd), AWX_ISOLATED_DATA_DIR=str(tmp_path)).event_context.cache
+        assert type(cache).__name__ == 'EventPipeWrite'
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+
+    # a closed descriptor whose number was reused for a file isn't written to
+    with open(tmp_path / 'unrelated', 'wb') as unrelated:
+        cache = load_events(RUNNER_EVENT_FD=str(unrelated.fileno()), AWX_ISOLATED_DATA_DIR=str(tmp_path)).event_context.cache
+        assert type(cache).__name__ == 'IsolatedFileWrite'
+
+
+def test_settings_resolved_at_load(load_events, monkeypatch):
+    event_context = load_events(JOB_ID='4', MAX_EVENT_RES='10', RUNNER_ONLY_FAILED_EVENTS='True').event_context
+    # later changes to the environment don't reach the loaded plugin
+    monkeypatch.setenv('JOB_ID', '5')
+    monkeypatch.setenv('RUNNER_ONLY_FAILED_EVENTS', 'False')
+    with event_context.set_local(event='runner_on_ok', res={'stdout': 'x' * 20}):
+        assert event_context.get_begin_dict()['event_data'] == {}
+    with event_context.set_local(event='runner_on_failed', res={'stdout': 'x' * 20}):
+        begin_dict = event_context.get_begin_dict()
+    assert begin_dict['job_id'] == 4
+    assert begin_dict['event_data'] == {'res': {}}
+
+
+def test_omit_event_data(load_events):
+    event_context = load_events(RUNNER_OMIT_EVENTS='true').event_context
+    with event_context.set_local(event='runner_on_ok', res={'changed': True}):
+        assert event_context.get_begin_dict()['event_data'] == {}
+
+
+def test_truncate_res_within_budget(load_events):
+    events = load_events()
+    res = {'changed': True, 'stdout': 'x' * 100}
+    assert events.truncate_res(res, 1000) is res
+
+
+def test_truncate_res_long_fields(load_events):
+    events = load_events()
+    res = {'changed': True, 'rc': 0, 'stdout': 'x' * 5000, 'stdout_lines': ['line'] * 2000}
+    truncated = events.truncate_res(res, 1000)
+    assert events.encoded_size(truncated, 1000) <= 1000
+    assert truncated['changed'] is True and truncated['rc'] == 0
+    assert truncated['stdout'].startswith('x' * 100)
+    assert truncated['stdout'].endswith('characters]')
+    assert truncated['stdout_lines'][-1].endswith('items]')
+    # the original result is left alone
+    assert len(res['stdout']) == 5000
+
+
+def test_truncate_res_too_many_fields(load_events):
+    events = load_events()
+    res = dict(('key{}'.format(n), n) for n in range(1000))
+    assert events.truncate_res(res, 1000) == {}
+
+
+def test_begin_dict_truncates_res(load_events):
+    event_context = load_events(MAX_EVENT_RES='1000').event_context
+    with event_context.set_local(event='runner_on_ok', res={'changed': True, 'stdout': 'x' * 5000}):
+        res = event_context.get_begin_dict()['event_data']['res']
+    assert res['changed'] is True
+    assert res['stdout'].endswith('characters]')
+
+
+def test_encoded_size(load_events):
+    events = load_events()
+    res = {'changed': False, 'rc': -1, 'delta': 0.25, 1: None, 'msg': u'caf\xe9 "quoted"\n',
+           'results': [{}, [], [True, 'x']], 'skipped': ()}
+    assert events.encoded_size(res, 10000) == len(json.dumps(res))
+    assert events.encoded_size(res, 10) > 10
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_json_dumpb(load_events, use_orjson):
+    events = load_events()
+    if not use_orjson:
+        events.orjson = None
+    elif events.orjson is None:
+        pytest.skip('orjson is not installed')
+
+    class Vault(object):
+        yaml_tag = '!vault'
+        _ciphertext = b'ciphertext'
+
+    data = {'res': {'secret': Vault(), 'big': 2 ** 70}, 'created': datetime.date(2020, 1, 2)}
+    assert json.loads(events.json_dumpb(data)) == {
+        'res': {'secret': {'__ansible_vault': 'ciphertext'}, 'big': 2 ** 70}, 'created': '2020-01-02'}
+
+
+def test_instrumented_lock(load_events):
+    lock = load_events().InstrumentedLock(threading.RLock())
+    with lock:
+        with lock:
+            pass
+    assert lock.stats['acquisitions'] == 2
+    assert 0 <= lock.stats['max_hold_time'] <= lock.stats['hold_time']
+
+
+def test_buffered_event_output(load_events):
+    events = load_events()
+    event_context = events.event_context
+    event_context.cache = mock.Mock()
+    stream = io.StringIO()
+    stdout = events.BufferedOutput(stream, event_context)
+    started = threading.Event()
+    resume = threading.Event()
+
+    def slow_event():
+        with event_context.buffered():
+            with event_context.set_local(event='runner_on_ok', uuid='slow'):
+                event_context.dump_begin(stdout)
+                stdout.write(u'slow start\r\n')
+                started.set()
+                resume.wait(5)
+                stdout.write(u'slow end\r\n')
+                event_context.dump_end(stdout)
+
+    thread = threading.Thread(target=slow_event)
+    thread.start()
+    started.wait(5)
+    # another thread writes a complete event while the first one is still
+    # collecting its output, without waiting for it
+    with event_context.buffered():
+        with event_context.set_local(event='runner_on_ok', uuid='fast'):
+            event_context.dump_begin(stdout)
+            stdout.write(u'fast\r\n')
+            event_context.dump_end(stdout)
+    assert stream.getvalue().count(u'fast\r\n') == 1
+    assert u'slow' not in stream.getvalue()
+    resume.set()
+    thread.join()
+
+    filtered = []
+    event_filter = OutputEventFilter(io.StringIO(), filtered.append)
+    event_filter.write(stream.getvalue())
+    event_filter.close()
+    assert [(event.get('uuid'), event['stdout']) for event in filtered[:-1]] == [('fast', u'fast'), ('slow', u'slow start\r\nslow end')]
+    assert event_context.display_lock.stats['acquisitions'] == 2
+
+
+def test_item_aggregator_batches(load_events):
+    aggregator = load_events().ItemAggregator(batch=3, interval=60)
+    assert aggregator.add('host1', 'task', 'ok', changed=True, task='debug') is None
+    assert aggregator.add('host2', 'task', 'ok') is None
+    assert aggregator.add('host1', 'task', 'skipped') is None
+    assert aggregator.add('host1', 'task', 'failed') == {'items': 3, 'ok': 1, 'changed': 1, 'skipped': 1, 'failed': 1}
+    assert aggregator.add('host1', 'task', 'ok') is None
+    assert aggregator.finish('host1', 'task') == {'items': 4, 'ok': 2, 'changed': 1, 'skipped': 1, 'failed': 1}
+    assert aggregator.finish('host1', 'task') is None
+    assert aggregator.finish_all() == [('host2', None, {'items': 1, 'ok': 1, 'changed': 0, 'skipped': 0, 'failed': 0})]
+    assert aggregator.finish_all() == []
+
+
+def test_item_aggregator_interval(load_events):
+    aggregator = load_events().ItemAggregator(batch=1000, interval=0)
+    assert aggregator.add('host1', 'task', 'ok') == {'items': 1, 'ok': 1, 'changed': 0, 'skipped': 0, 'failed': 0}
+
+
+def test_item_aggregation_settings(load_events):
+    event_context = load_events(RUNNER_ITEM_AGGREGATION='True', RUNNER_ITEM_AGGREGATION_BATCH='10').event_context
+    assert event_context.item_aggregation is True
+    assert (event_context.item_batch, event_context.item_interval) == (10, 5.0)
+
+
+def test_begin_dict_stores_large_payloads(load_events, tmp_path):
+    event_context = load_events(RUNNER_BLOB_THRESHOLD='100', AWX_ISOLATED_DATA_DIR=str(tmp_path)).event_context
+    diff = [{'before': 'x' * 200, 'after': 'y' * 200}]
+    with event_context.set_local(event='runner_on_file_diff', diff=diff):
+        first = event_context.get_begin_dict()['event_data']['diff']
+    res = {'changed': True, 'stdout': 'z' * 200, 'diff': diff}
+    with event_context.set_local(event='runner_on_ok', res=res):
+        event_data = event_context.get_begin_dict()['event_data']
+    assert event_data['res']['changed'] is True
+    assert event_data['res']['diff'] == first
+    assert event_data['res']['stdout']['size'] == 202
+    assert len(res['stdout']) == 200
+
+    blobs = BlobStore(str(tmp_path / 'blobs'))
+    assert blobs.get(first) == diff
+    assert blobs.resolve(event_data) == {'res': res}
+    # the same diff was only stored once
+    assert sum(len(files) for _, _, files in os.walk(str(tmp_path / 'blobs'))) == 2
+
+
+def test_begin_dict_keeps_result_status(load_events, tmp_path):
+    event_context = load_events(RUNNER_BLOB_THRESHOLD='0', AWX_ISOLATED_DATA_DIR=str(tmp_path)).event_context
+    res = {'changed': False, 'failed': False, 'skipped': False, 'unreachable': False, 'rc': 0, 'msg': 'done'}
+    with event_context.set_local(event='runner_on_ok', res=res):
+        event_data = event_context.get_begin_dict()['event_data']
+    # Runner counts changed hosts from these, a reference would always be true
+    assert dict((key, event_data['res'][key]) for key in ('changed', 'failed', 'skipped', 'unreachable', 'rc')) == {
+        'changed': False, 'failed': False, 'skipped': False, 'unreachable': False, 'rc': 0}
+    assert event_data['res']['msg']['size'] == 6
+
+
+def test_project_event_data(load_events):
+    events = load_events()
+    fields = events.parse_fields(['host', 'res.rc', 'res.msg', 'res', 'task.name', 'task'])
+    assert fields == {'host': True, 'res': True, 'task': True}
+    fields = events.parse_fields(['host', 'res.rc', 'res.msg', 'res.results.item'])
+    assert fields == {'host': True, 'res': {'rc': True, 'msg': True, 'results': {'item': True}}}
+    data = {'host': 'localhost', 'play': 'play', 'res': {'rc': 1, 'stdout': 'x', 'results': [{'item': 1, 'rc': 0}, 'item']}}
+    assert events.project(data, fields) == {'host': 'localhost', 'res': {'rc': 1, 'results': [{'item': 1}, 'item']}}
+    assert data['res']['stdout'] == 'x'
+
+
+def test_begin_dict_projects_event_data(load_events):
+    event_context = load_events(RUNNER_EVENT_DATA_FIELDS='task, res.rc,res.msg').event_context
+    event_context.add_global(playbook='site.yml', playbook_uuid='playbook')
+    res = {'changed': True, 'rc': 1, 'msg': 'failed', 'stdout': 'x' * 100}
+    with event_context.set_local(event='runner_on_failed', host='localhost', task='debug', task_uuid='task', res=res):
+        begin_dict = event_context.get_begin_dict()
+    assert begin_dict['parent_uuid'] == 'task'
+    assert begin_dict['event_data'] == {'host': 'localhost', 'task': 'debug', 'task_uuid': 'task',
+                                        'res': {'changed': True, 'rc': 1, 'msg': 'failed'}}
+    with event_context.set_local(event='playbook_on_stats', ok={'localhost': 1}):
+        assert event_context.get_begin_dict()['event_data']['ok'] == {'localhost': 1}
@@ -1,11 +1,13 @@
 import pytest
 import base64
+import itertools
 import json
-from io import StringIO
+from io import BytesIO, StringIO
 
 from six.moves import xrange
 
 from ansible_runner.utils import OutputEventFilter
+from ansible_runner.utils.durability import DurabilityPolicy
 
 MAX_WIDTH = 78
 EXAMPLE_UUID = '890773f5-fe6d-4091-8faf-bdc8021d65dd'
@@ -198,3 +200,153 @@ def test_verbose_line_buffering():
     assert len(events) == 6
 
     assert events[5]['event'] == 'EOF'
+
+
+def test_durability_policy_group_commits(job_event_callback):
+    handle = StringIO()
+    policy = DurabilityPolicy('interval', interval=3600, batch=10)
+    wrapped_handle = OutputEventFilter(handle, job_event_callback, durability=policy)
+    for n in range(25):
+        wrapped_handle.write(u'line {}\n'.format(n))
+    assert policy.commits == 2
+    wrapped_handle.close()
+    assert policy.commits == 3
+
+
+def test_durability_policy_flush_waits_for_interval(job_event_callback, mocker):
+    now = mocker.patch('ansible_runner.utils.durability.time.time', return_value=100.0)
+    handle = StringIO()
+    policy = DurabilityPolicy('interval', interval=1.0, batch=0)
+    wrapped_handle = OutputEventFilter(handle, job_event_callback, durability=policy)
+    wrapped_handle.write(u'line\n')
+    wrapped_handle.flush()
+    assert policy.commits == 0
+    now.return_value = 101.5
+    wrapped_handle.tick()
+    assert policy.commits == 1
+
+
+def test_shared_counter():
+    events = []
+    counter = itertools.count(1)
+    stdout = OutputEventFilter(StringIO(), events.append, counter=counter)
+    stderr = OutputEventFilter(StringIO(), events.append, counter=counter)
+    stdout.write(u'out\n')
+    stderr.write(u'err\n')
+    stdout.write(u'out\n')
+    assert [e['counter'] for e in events] == [1, 2, 3]
+
+
+@pytest.mark.parametrize('read_size', [1, 2, 3, 7, 80, 4096])
+def test_event_split_across_writes(fake_callback, fake_cache, wrapped_handle, read_size):
+    fake_cache[':1:ev-{}'.format(EXAMPLE_UUID)] = {'event': 'foo'}
+    stream = StringIO()
+    stream.write(u'verbose before\r\n')
+    write_encoded_event_data(stream, {'uuid': EXAMPLE_UUID, 'res': 'x' * 500})
+    stream.write(u'event stdout\r\n')
+    write_encoded_event_data(stream, {})
+    stream.write(u'not a token \x1b[K\x1b[Kabc\x1b[3Dnot either\r\n')
+    value = stream.getvalue()
+    for offset in range(0, len(value), read_size):
+        wrapped_handle.write(value[offset:offset + read_size])
+    wrapped_handle.close()
+
+    assert [(e.get('event'), e.get('stdout')) for e in fake_callback] == [
+        ('verbose', 'verbose before'),
+        ('foo', 'event stdout'),
+        ('verbose', 'not a token \x1b[K\x1b[Kabc\x1b[3Dnot either'),
+        ('EOF', None),
+    ]
+    assert fake_callback[1]['res'] == 'x' * 500
+    assert [e['counter'] for e in fake_callback[:-1]] == [1, 2, 3]
+
+
+def test_unterminated_token_flushed_on_close(fake_callback, wrapped_handle):
+    wrapped_handle.write(u'tail\x1b[KeyJ1dWlk\x1b[8D')
+    wrapped_handle.close()
+    assert fake_callback[0]['event'] == 'verbose'
+    # the last two characters are dropped as if they were a line ending
+    assert fake_callback[0]['stdout'] == 'tail\x1b[KeyJ1dWlk\x1b['
+
+
+def test_bytes_writes(fake_callback, fake_cache, job_event_callback):
+    fake_cache[':1:ev-{}'.format(EXAMPLE_UUID)] = {'event': 'foo'}
+    handle = BytesIO()
+    wrapped_handle = OutputEventFilter(handle, job_event_callback)
+    stream = StringIO()
+    stream.write(u'vérbose ☃\r\n')
+    write_encoded_event_data(stream, {'uuid': EXAMPLE_UUID})
+    stream.write(u'ök\r\n')
+    write_encoded_event_data(stream, {})
+    value = stream.getvalue().encode('utf-8')
+    # split in the middle of every multibyte character
+    for offset in range(0, len(value), 3):
+        wrapped_handle.write(value[offset:offset + 3])
+
+    assert [(e['event'], e['stdout']) for e in fake_callback] == [('verbose', u'vérbose ☃'), ('foo', u'ök')]
+    assert handle.getvalue().decode('utf-8') == u'vérbose ☃\r\nök\n'
+
+
+def test_bytes_writes_invalid_utf8(fake_callback, job_event_callback):
+    handle = BytesIO()
+    wrapped_handle = OutputEventFilter(handle, job_event_callback)
+    wrapped_handle.write(b'caf\xe9\r\n')
+    wrapped_handle.write(b'ok\r\n')
+
+    assert [e['stdout'] for e in fake_callback] == [u'caf\ufffd', u'ok']
+    # the stdout artifact agrees with the events
+    assert handle.getvalue().decode('utf-8') == u'caf\ufffd\r\nok\r\n'
+
+
+def test_coalesce_verbose_lines(fake_callback, fake_cache, job_event_callback):
+    fake_cache[':1:ev-{}'.format(EXAMPLE_UUID)] = {'event': 'foo'}
+    handle = StringIO()
+    wrapped_handle = OutputEventFilter(handle, job_event_callback, coalesce_verbose=True, coalesce_lines=3, coalesce_interval=3600)
+    for n in range(5):
+        wrapped_handle.write(u'line {}\r\n'.format(n))
+    write_encoded_event_data(wrapped_handle, {'uuid': EXAMPLE_UUID})
+    wrapped_handle.write(u'ok\r\n')
+    write_encoded_event_data(wrapped_handle, {})
+    wrapped_handle.write(u'line 5\r\n')
+    # lines reach stdout right away, only their events are held back
+    assert handle.getvalue() == u''.join(u'line {}\r\n'.format(n) for n in range(5)) + u'ok\nline 5\r\n'
+    wrapped_handle.close()
+
+    assert [(e['event'], e.get('stdout'), e.get('start_line'), e.get('end_line')) for e in fake_callback] == [
+        ('verbose', u'line 0\r\nline 1\r\nline 2', 0, 3),
+        ('verbose', u'line 3\r\nline 4', 3, 5),
+        ('foo', u'ok', 5, 6),
+        ('verbose', u'line 5', 6, 7),
+        ('EOF', None, None, None),
+    ]
+    assert [e['counter'] for e in fake_callback[:-1]] == [1, 2, 3, 4]
+    assert len(set(e['uuid'] for e in fake_callback[:-1])) == 4
+
+
+def test_coalesce_verbose_bytes_and_interval(fake_callback, job_event_callback, mocker):
+    now = mocker.patch('ansible_runner.utils.time.time', return_value=0)
+    wrapped_handle = OutputEventFilter(StringIO(), job_event_callback, coalesce_verbose=True, coalesce_bytes=10, coalesce_interval=1)
+    wrapped_handle.write(u'0123456789\r\n')
+    assert [e['stdout'] for e in fake_callback] == [u'0123456789']
+    wrapped_handle.write(u'a\r\n')
+    assert len(fake_callback) == 1
+    now.return_value = 2
+    wrapped_handle.write(u'b\r\n')
+    assert [e['stdout'] for e in fake_callback] == [u'0123456789', u'a']
+    wrapped_handle.close()
+    assert [e.get('stdout') for e in fake_callback] == [u'0123456789', u'a', u'b', None]
+
+
+def test_coalesce_verbose_tick(fake_callback, job_event_callback, mocker):
+    now = mocker.patch('ansible_runner.utils.time.time', return_value=0)
+    wrapped_handle = OutputEventFilter(StringIO(), job_event_callback, coalesce_verbose=True, coalesce_interval=1)
+    assert wrapped_handle.tick_interval == 1
+    wrapped_handle.write(u'a\r\n')
+    wrapped_handle.tick()
+    assert fake_callback == []
+    # emitted without waiting for more output
+    now.return_value = 1.5
+    wrapped_handle.tick()
+    assert [e['stdout'] for e in fake_callback] == [u'a']
+    wrapped_handle.tick()
+    assert len(fake_callback) == 1
@@ -2,15 +2,21 @@
 
 import codecs
 import os
+import re
 
 import json
 import pexpect
 import pytest
 import six
 import sys
+import threading
+import time
 
+import ansible_runner
 from ansible_runner import Runner
 from ansible_runner.exceptions import CallbackError, AnsibleRunnerException
+from ansible_runner.utils import json_codec
+from ansible_runner.utils.journal import collect_journal_events
 from ansible_runner.config.runner import RunnerConfig
 
 
@@ -48,6 +54,25 @@ def test_simple_spawn(rc):
     assert exitcode == 0
 
 
+@pytest.mark.parametrize('event_pipe', [True, False])
+def test_spawn_pass_fds(rc, mocker, event_pipe):
+    rc.command = ['ls', '-la']
+    rc.event_pipe = event_pipe
+    spawn = mocker.spy(ansible_runner.runner.ptyprocess.PtyProcess, 'spawn')
+    status, exitcode = Runner(config=rc).run()
+    assert status == 'successful'
+    # runs without a pipe don't depend on pass_fds, which older ptyprocess lacks
+    assert ('pass_fds' in spawn.call_args[1]) is event_pipe
+
+
+def test_stdout_invalid_utf8(rc):
+    rc.command = [sys.executable, '-c', 'import sys; sys.stdout.buffer.write(b"caf\\xe9\\n")']
+    runner = Runner(config=rc)
+    status, exitcode = runner.run()
+    assert status == 'successful'
+    assert runner.stdout.read() == u'caf\ufffd\n'
+
+
 def test_error_code(rc):
     rc.command = ['ls', '--nonsense']
     status, exitcode = Runner(config=rc).run()
@@ -152,3 +177,344 @@ def test_status_callback_interface(rc, mocker):
     assert runner.status_handler.call_count == 1
     runner.status_handler.assert_called_with(dict(status='running', runner_ident=str(rc.ident)), runner_config=runner.config)
     assert runner.status == 'running'
+
+
+def test_event_journal(rc):
+    rc.command = ['echo', 'helloworld']
+    rc.event_journal = True
+    runner = Runner(config=rc)
+    status, exitcode = runner.run()
+    assert status == 'successful'
+
+    event_files = os.listdir(os.path.join(rc.artifact_dir, 'job_events'))
+    assert event_files == ['journal-000000.jsonl']
+    events = list(runner.events)
+    assert len(events) == 1
+    assert events[0]['stdout'] == 'helloworld'
+    assert events[0]['runner_ident'] == str(rc.ident)
+
+
+def test_event_journal_flushed_while_idle(rc):
+    rc.command = [sys.executable, '-c', 'import time; print("first", flush=True); time.sleep(3)']
+    rc.event_journal = True
+    rc.event_journal_flush_interval = 0.2
+    rc.pexpect_timeout = 5
+    rc.job_timeout = 10
+    runner = Runner(config=rc)
+    thread = threading.Thread(target=runner.run)
+    thread.start()
+    try:
+        # time.sleep is mocked, wait on an event instead
+        waiting = threading.Event()
+        deadline = time.time() + 2.5
+        stdout = []
+        while not stdout and time.time() < deadline:
+            waiting.wait(0.05)
+            stdout = [event['stdout'] for event, position in collect_journal_events(os.path.join(rc.artifact_dir, 'job_events'))]
+        # seen while the child is still quiet, not at the end of the run
+        assert stdout == ['first']
+        assert thread.is_alive()
+    finally:
+        thread.join()
+
+
+def test_event_durability_interval_commits_while_idle(rc):
+    # the second line comes before the interval passed again, so only a tick commits it
+    rc.command = [sys.executable, '-c', 'import time; print("first", flush=True); time.sleep(0.05); print("second", flush=True); time.sleep(3)']
+    rc.event_durability = 'interval'
+    rc.event_durability_interval = 0.2
+    rc.pexpect_timeout = 5
+    rc.job_timeout = 10
+    runner = Runner(config=rc)
+    thread = threading.Thread(target=runner.run)
+    thread.start()
+    try:
+        stdout_filename = os.path.join(rc.artifact_dir, 'stdout')
+        waiting = threading.Event()
+        deadline = time.time() + 2.5
+        stdout = []
+        while stdout != ['first', 'second'] and time.time() < deadline:
+            waiting.wait(0.05)
+            if os.path.exists(stdout_filename):
+                with open(stdout_filename, 'rb') as f:
+                    stdout = f.read().decode('utf-8').split()
+        # on disk while the child is still quiet, not at the end of the run
+        assert stdout == ['first', 'second']
+        assert thread.is_alive()
+    finally:
+        thread.join()
+
+
+CALLBACK_EVENTS_SCRIPT = '''
+import importlib.util
+import sys
+import threading
+
+spec = importlib.util.spec_from_file_location('events', {path!r})
+events = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(events)
+
+for n in range(3):
+    with events.event_context.set_local(event='runner_on_ok', host='host%d' % n, task='debug', task_uuid='task',
+                                        duration=n + 1.0, res={{'changed': n == 1}}):
+        events.event_context.dump_begin(sys.stdout)
+        sys.stdout.write('ok: [host%d]\\n' % n)
+        events.event_context.dump_end(sys.stdout)
+'''
+
+
+@pytest.mark.parametrize('event_pipe, event_framing', [(True, 'binary'), (True, 'lines'), (False, 'binary')])
+def test_callback_event_data_handshake(rc, event_pipe, event_framing):
+    events_path = os.path.join(os.path.dirname(ansible_runner.__file__), 'display_callback', 'events.py')
+    rc.command = [sys.executable, '-c', CALLBACK_EVENTS_SCRIPT.format(path=events_path)]
+    rc.env = {'AWX_ISOLATED_DATA_DIR': rc.artifact_dir}
+    rc.event_pipe = event_pipe
+    rc.event_framing = event_framing
+    rc.job_timeout = 10
+    runner = Runner(config=rc)
+    status, exitcode = runner.run()
+    assert status == 'successful'
+
+    events = [event for event in runner.events if event['event'] == 'runner_on_ok']
+    assert [event['event_data']['host'] for event in events] == ['host0', 'host1', 'host2']
+    assert [event['stdout'] for event in events] == ['ok: [host0]', 'ok: [host1]', 'ok: [host2]']
+    assert not [f for f in os.listdir(os.path.join(rc.artifact_dir, 'job_events')) if 'partial' in f]
+
+
+@pytest.mark.parametrize('event_journal', [True, False])
+def test_event_passthrough(rc, mocker, event_journal):
+    events_path = os.path.join(os.path.dirname(ansible_runner.__file__), 'display_callback', 'events.py')
+    rc.command = [sys.executable, '-c', CALLBACK_EVENTS_SCRIPT.format(path=events_path)]
+    rc.event_passthrough = True
+    rc.event_journal = event_journal
+    rc.job_timeout = 10
+    merge_encoded = mocker.spy(json_codec, 'merge_encoded')
+    runner = Runner(config=rc)
+    status, exitcode = runner.run()
+    assert status == 'successful'
+    assert merge_encoded.call_count == 3
+
+    events = [event for event in runner.events if event['event'] == 'runner_on_ok']
+    assert [event['stdout'] for event in events] == ['ok: [host0]', 'ok: [host1]', 'ok: [host2]']
+    assert [event['event_data']['res'] for event in events] == [{'changed': False}, {'changed': True}, {'changed': False}]
+    assert all(event['runner_ident'] == str(rc.ident) and event['created'] for event in events)
+    assert [e['stdout'] for e in runner.host_events('host1')] == ['ok: [host1]']
+    assert runner.live_stats['changed'] == {'host1': 1}
+    assert runner.timing_profile['slowest_hosts'][0] == {'host': 'host2', 'total': 3.0}
+
+
+def test_event_blobs(rc):
+    events_path = os.path.join(os.path.dirname(ansible_runner.__file__), 'display_callback', 'events.py')
+    rc.command = [sys.executable, '-c', CALLBACK_EVENTS_SCRIPT.format(path=events_path)]
+    rc.env = {'AWX_ISOLATED_DATA_DIR': rc.artifact_dir, 'RUNNER_BLOB_THRESHOLD': '1'}
+    rc.job_timeout = 10
+    runner = Runner(config=rc)
+    status, exitcode = runner.run()
+    assert status == 'successful'
+
+    events = [event for event in runner.events if event['event'] == 'runner_on_ok']
+    # the result status stays in the event whatever the threshold, Runner counts changed hosts from it
+    assert [event['event_data']['res'] for event in events] == [{'changed': False}, {'changed': True}, {'changed': False}]
+    assert runner.live_stats['changed'] == {'host1': 1}
+    assert [runner.blobs.resolve(event) for event in events] == events
+
+
+def test_event_passthrough_needs_decoded_events(rc):
+    rc.event_passthrough = True
+    assert Runner(config=rc)._can_pass_through()
+    assert not Runner(config=rc, event_handler=lambda event_data: True)._can_pass_through()
+    rc.event_compact_context = True
+    assert not Runner(config=rc)._can_pass_through()
+
+
+@pytest.mark.parametrize('event_journal', [True, False])
+def test_event_compact_context(rc, event_journal):
+    events_path = os.path.join(os.path.dirname(ansible_runner.__file__), 'display_callback', 'events.py')
+    rc.command = [sys.executable, '-c', CALLBACK_EVENTS_SCRIPT.format(path=events_path)]
+    rc.event_compact_context = True
+    rc.event_journal = event_journal
+    rc.job_timeout = 10
+    runner = Runner(config=rc)
+    status, exitcode = runner.run()
+    assert status == 'successful'
+
+    event_path = os.path.join(rc.artifact_dir, 'job_events')
+    with open(os.path.join(event_path, 'contexts.jsonl')) as f:
+        assert [json.loads(line) for line in f] == [{'id': 0, 'context': {'task': 'debug', 'task_uuid': 'task'}}]
+    stored = []
+    for filename in os.listdir(event_path):
+        if filename != 'contexts.jsonl':
+            with open(os.path.join(event_path, filename)) as f:
+                stored.extend(json.loads(line) for line in f)
+    assert sorted(event['event_data'].get('__context') for event in stored if event['event'] == 'runner_on_ok') == [0, 0, 0]
+    assert not [event for event in stored if 'task' in event['event_data']]
+
+    events = [event for event in runner.events if event['event'] == 'runner_on_ok']
+    assert [(event['event_data']['task'], event['event_data']['host']) for event in events] == [
+        ('debug', 'host0'), ('debug', 'host1'), ('debug', 'host2')]
+    assert [e['event_data']['task_uuid'] for e in runner.host_events('host1')] == ['task']
+
+
+@pytest.mark.parametrize('backpressure', ['block', 'drop_verbose', 'spill'])
+def test_event_writer(rc, backpressure):
+    rc.command = [sys.executable, '-c', 'for n in range(50): print(n)']
+    rc.event_writer = True
+    rc.event_writer_queue_size = 5
+    rc.event_writer_backpressure = backpressure
+    runner = Runner(config=rc)
+    status, exitcode = runner.run()
+    assert status == 'successful'
+
+    metrics = runner.event_writer_metrics
+    assert metrics['queue_depth'] == 0
+    assert metrics['queued'] == 50 + 1  # EOF
+    stdout = [event['stdout'] for event in runner.events]
+    assert len(stdout) == 50 - metrics['dropped']
+    assert stdout == sorted(stdout, key=int)
+
+
+def test_coalesced_verbose_emitted_while_idle(rc):
+    rc.command = [sys.executable, '-c', 'import time; print("first", flush=True); time.sleep(3)']
+    rc.event_coalesce_verbose = True
+    rc.event_coalesce_interval = 0.2
+    rc.pexpect_timeout = 5
+    rc.job_timeout = 10
+    runner = Runner(config=rc)
+    thread = threading.Thread(target=runner.run)
+    thread.start()
+    try:
+        events_path = os.path.join(rc.artifact_dir, 'job_events')
+        waiting = threading.Event()
+        deadline = time.time() + 2.5
+        event_files = []
+        while not event_files and time.time() < deadline:
+            waiting.wait(0.05)
+            if os.path.exists(events_path):
+                event_files = [f for f in os.listdir(events_path) if f.endswith('.json')]
+        # emitted while the child is still quiet, not at the end of the run
+        assert len(event_files) == 1
+        assert thread.is_alive()
+    finally:
+        thread.join()
+
+
+def test_event_writer_queues_copy(rc, mocker):
+    runner = Runner(config=rc)
+    runner._event_writer = mocker.Mock()
+    event_data = {'uuid': '1', 'counter': 1, 'stdout': 'ok'}
+    runner.queue_event(event_data)
+    queued = runner._event_writer.put.call_args[0][0]
+    assert queued == event_data
+    assert queued is not event_data
+
+
+def test_event_writer_json_mode(rc):
+    events_path = os.path.join(os.path.dirname(ansible_runner.__file__), 'display_callback', 'events.py')
+    rc.command = [sys.executable, '-c', CALLBACK_EVENTS_SCRIPT.format(path=events_path)]
+    rc.event_writer = True
+    rc.json_mode = True
+    rc.job_timeout = 10
+    runner = Runner(config=rc)
+    status, exitcode = runner.run()
+    assert status == 'successful'
+
+    # the json output has the whole event, not just what the output filter knows
+    with open(os.path.join(rc.artifact_dir, 'stdout')) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    assert [event['event_data']['host'] for event in events if event.get('event') == 'runner_on_ok'] == ['host0', 'host1', 'host2']
+
+
+def test_event_writer_error_closes_journal(rc):
+    rc.command = [sys.executable, '-c', 'for n in range(5): print(n)']
+    rc.event_writer = True
+    rc.event_journal = True
+    rc.event_journal_flush_interval = 3600
+
+    def event_handler(event_data):
+        if event_data.get('stdout') == '3':
+            raise RuntimeError('handler failed')
+        return True
+
+    runner = Runner(config=rc, event_handler=event_handler)
+    with pytest.raises(RuntimeError):
+        runner.run()
+    assert runner._journal is None and runner._event_channel is None
+    # the events buffered before the error made it to disk
+    stdout = [event['stdout'] for event, position in collect_journal_events(os.path.join(rc.artifact_dir, 'job_events'))]
+    assert stdout[:3] == ['0', '1', '2']
+
+
+@pytest.mark.parametrize('event_journal', [True, False])
+def test_event_index(rc, event_journal):
+    events_path = os.path.join(os.path.dirname(ansible_runner.__file__), 'display_callback', 'events.py')
+    rc.command = [sys.executable, '-c', CALLBACK_EVENTS_SCRIPT.format(path=events_path)]
+    rc.event_journal = event_journal
+    rc.job_timeout = 10
+    runner = Runner(config=rc)
+    status, exitcode = runner.run()
+    assert status == 'successful'
+    assert os.path.exists(os.path.join(rc.artifact_dir, 'event_index.json'))
+
+    assert [e['stdout'] for e in runner.host_events('host1')] == ['ok: [host1]']
+    assert runner.stats is None
+
+    with open(os.path.join(rc.artifact_dir, 'timing_profile.json')) as f:
+        timing_profile = json.load(f)
+    assert timing_profile == runner.timing_profile
+    assert [(task['task'], task['count'], task['total']) for task in timing_profile['tasks']] == [('debug', 3, 6.0)]
+
+    # a new Runner for the same artifacts uses the persisted index
+    reader = Runner(config=rc)
+    assert len(reader.event_index) == len(list(runner.events))
+    assert [e['stdout'] for e in reader.host_events('host2')] == ['ok: [host2]']
+
+
+def test_events_followed_while_running(rc):
+    rc.command = [sys.executable, '-c', 'import time\nfor n in range(3):\n    print(n, flush=True)\n    time.sleep(0.05)']
+    rc.job_timeout = 10
+    runner = Runner(config=rc)
+    thread = threading.Thread(target=runner.run)
+    thread.start()
+    while runner.status in ('unstarted', 'starting'):
+        pass
+    events = [event['stdout'] for event in runner.events]
+    thread.join()
+    assert events == ['0', '1', '2']
+
+
+def test_live_stats(rc):
+    events_path = os.path.join(os.path.dirname(ansible_runner.__file__), 'display_callback', 'events.py')
+    rc.command = [sys.executable, '-c', CALLBACK_EVENTS_SCRIPT.format(path=events_path)]
+    rc.job_timeout = 10
+    status_data = []
+    runner = Runner(config=rc, status_handler=lambda data, runner_config: status_data.append(data))
+    assert runner.live_stats['ok'] == {}
+    status, exitcode = runner.run()
+    assert status == 'successful'
+    assert runner.live_stats['ok'] == {'host0': 1, 'host1': 1, 'host2': 1}
+    assert status_data[-1]['status'] == 'successful'
+    assert status_data[-1]['stats']['processed'] == {'host0': 1, 'host1': 1, 'host2': 1}
+
+
+@pytest.mark.parametrize('pattern', [u'Pässword:', re.compile(u'Pässword:\\s*?$', re.M)])
+def test_password_prompt_bytes(rc, pattern):
+    rc.command = [sys.executable, '-c', u'print(input(u"Pässword: "), u"✓")']
+    rc.expect_passwords[pattern] = '1234'
+    rc.job_timeout = 10
+    status, exitcode = Runner(config=rc).run()
+    assert status == 'successful'
+    with codecs.open(os.path.join(rc.artifact_dir, 'stdout'), 'r', encoding='utf-8') as f:
+        assert u'1234 ✓' in f.read()
+
+
+def test_event_coalesce_verbose(rc):
+    rc.command = [sys.executable, '-c', 'for n in range(50): print(n)']
+    rc.event_coalesce_verbose = True
+    rc.event_coalesce_lines = 20
+    rc.job_timeout = 10
+    runner = Runner(config=rc)
+    status, exitcode = runner.run()
+    assert status == 'successful'
+    events = list(runner.events)
+    assert [(e['start_line'], e['end_line']) for e in events] == [(0, 20), (20, 40), (40, 50)]
+    assert '\r\n'.join(e['stdout'] for e in events).split('\r\n') == [str(n) for n in range(50)]
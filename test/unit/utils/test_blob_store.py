@@ -0,0 +1,43 @@
+import hashlib
+import os
+
+import pytest
+
+from ansible_runner.utils.blob_store import BlobStore, is_reference
+
+
+@pytest.fixture
+def store(tmp_path):
+    data = b'{"before":"a","after":"b"}'
+    digest = hashlib.sha256(data).hexdigest()
+    os.makedirs(str(tmp_path / digest[:2]))
+    (tmp_path / digest[:2] / digest).write_bytes(data)
+    return BlobStore(str(tmp_path)), digest
+
+
+def test_is_reference():
+    assert is_reference({'__runner_blob': 'abc', 'size': 3})
+    assert not is_reference({'__runner_blob': 'abc', 'size': 3, 'other': 1})
+    assert not is_reference(['__runner_blob'])
+
+
+def test_get(store):
+    blobs, digest = store
+    assert blobs.get(digest) == {'before': 'a', 'after': 'b'}
+    assert blobs.get({'__runner_blob': digest, 'size': 26}) == {'before': 'a', 'after': 'b'}
+
+
+def test_get_invalid_digest(store):
+    blobs, digest = store
+    with pytest.raises(ValueError):
+        blobs.get('../' + digest[3:])
+
+
+def test_resolve(store):
+    blobs, digest = store
+    reference = {'__runner_blob': digest, 'size': 26}
+    event = {'event': 'runner_on_ok', 'event_data': {'diff': [reference], 'res': {'changed': True, 'stdout': reference}}}
+    assert blobs.resolve(event) == {'event': 'runner_on_ok', 'event_data': {
+        'diff': [{'before': 'a', 'after': 'b'}],
+        'res': {'changed': True, 'stdout': {'before': 'a', 'after': 'b'}}}}
+    assert event['event_data']['diff'] == [reference]
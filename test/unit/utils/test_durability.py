@@ -0,0 +1,95 @@
+import pytest
+
+from ansible_runner.utils.durability import DurabilityPolicy
+
+
+class FakeHandle(object):
+
+    def __init__(self):
+        self.flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+
+    def fileno(self):
+        raise AssertionError('fsync is disabled')
+
+
+def test_per_event_commits_every_write():
+    handle = FakeHandle()
+    policy = DurabilityPolicy('per_event')
+    for _ in range(5):
+        policy.commit(handle)
+    assert handle.flushes == 5
+
+
+def test_interval_group_commits_by_batch():
+    handle = FakeHandle()
+    policy = DurabilityPolicy('interval', interval=3600, batch=10)
+    for _ in range(25):
+        policy.commit(handle)
+    assert handle.flushes == 2
+
+
+def test_interval_group_commits_by_time(mocker):
+    handle = FakeHandle()
+    now = mocker.patch('ansible_runner.utils.durability.time.time', return_value=100.0)
+    policy = DurabilityPolicy('interval', interval=1.0, batch=0)
+    policy.commit(handle)
+    assert handle.flushes == 0
+    now.return_value = 101.5
+    policy.commit(handle)
+    assert handle.flushes == 1
+
+
+def test_interval_tick_commits_pending_writes_when_due(mocker):
+    handle = FakeHandle()
+    now = mocker.patch('ansible_runner.utils.durability.time.time', return_value=100.0)
+    policy = DurabilityPolicy('interval', interval=1.0, batch=0)
+    assert policy.tick_interval == 1.0
+    policy.tick(handle)
+    policy.commit(handle)
+    policy.tick(handle)
+    assert handle.flushes == 0
+    # no further write is needed to commit once the interval passed
+    now.return_value = 101.5
+    policy.tick(handle)
+    assert handle.flushes == 1
+    now.return_value = 103.0
+    policy.tick(handle)
+    assert handle.flushes == 1
+
+
+@pytest.mark.parametrize('mode', ['none', 'per_event'])
+def test_tick_only_for_interval(mode):
+    handle = FakeHandle()
+    policy = DurabilityPolicy(mode, interval=0.0)
+    policy.commit(handle)
+    flushes = handle.flushes
+    assert policy.tick_interval is None
+    policy.tick(handle)
+    assert handle.flushes == flushes
+
+
+def test_none_only_commits_on_sync():
+    handle = FakeHandle()
+    policy = DurabilityPolicy('none')
+    for _ in range(1000):
+        policy.commit(handle)
+    assert handle.flushes == 0
+    policy.sync(handle)
+    assert handle.flushes == 1
+
+
+def test_fsync(tmp_path, mocker):
+    fsync = mocker.patch('os.fsync')
+    policy = DurabilityPolicy('per_event', fsync=True)
+    with open(str(tmp_path / 'stdout'), 'w') as handle:
+        handle.write('line\n')
+        policy.commit(handle)
+        fsync.assert_called_once_with(handle.fileno())
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError):
+        DurabilityPolicy('sometimes')
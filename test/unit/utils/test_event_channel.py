@@ -0,0 +1,62 @@
+import json
+import os
+import struct
+
+import pytest
+
+from ansible_runner.utils.event_channel import EventChannel
+
+
+def _record(framing, value):
+    payload = json.dumps(value).encode('utf-8')
+    if framing == 'binary':
+        return struct.pack('!I', len(payload)) + payload
+    return payload + b'\n'
+
+
+@pytest.mark.parametrize('framing', ['binary', 'lines'])
+def test_event_channel_records(framing):
+    channel = EventChannel(framing=framing)
+    assert channel.env == {'RUNNER_EVENT_FD': str(channel.write_fd), 'RUNNER_EVENT_FRAMING': framing}
+    try:
+        data = b''.join(_record(framing, {'uuid': str(n), 'stdout': u'ünïcode\n' * n}) for n in range(20))
+        # records split across writes are put back together
+        for offset in range(0, len(data), 7):
+            os.write(channel.write_fd, data[offset:offset + 7])
+        for n in range(20):
+            assert channel.pop(str(n)) == {'uuid': str(n), 'stdout': u'ünïcode\n' * n}
+    finally:
+        channel.close()
+
+
+def test_event_channel_missing_record():
+    channel = EventChannel(framing='binary')
+    channel.close_write_end()
+    try:
+        assert channel.pop('missing', timeout=0.1) is None
+    finally:
+        channel.close()
+
+
+def test_event_channel_invalid_framing():
+    with pytest.raises(ValueError):
+        EventChannel(framing='bogus')
+
+
+@pytest.mark.parametrize('framing', ['binary', 'lines'])
+def test_event_channel_passthrough(framing):
+    channel = EventChannel(framing=framing, passthrough=True)
+    assert channel.env['RUNNER_EVENT_PASSTHROUGH'] == '1'
+    try:
+        encoded = json.dumps({'uuid': '1', 'event_data': {'res': {'stdout': 'x' * 100}}}).encode('utf-8')
+        record = json.dumps({'uuid': '1', 'event': 'runner_on_ok'}).encode('utf-8') + b'\x00' + encoded
+        payload = _record(framing, {'uuid': '2'})
+        if framing == 'binary':
+            os.write(channel.write_fd, struct.pack('!I', len(record)) + record + payload)
+        else:
+            os.write(channel.write_fd, record + b'\n' + payload)
+        assert channel.pop('1') == ({'uuid': '1', 'event': 'runner_on_ok'}, encoded)
+        # records without a summary are decoded as usual
+        assert channel.pop('2') == {'uuid': '2'}
+    finally:
+        channel.close()
@@ -0,0 +1,47 @@
+import json
+import os
+
+from ansible_runner.utils.event_contexts import ContextReader, ContextWriter
+
+
+def make_event(counter, task_uuid, host='host1'):
+    return {'counter': counter, 'event': 'runner_on_ok', 'event_data': {
+        'playbook': 'site.yml', 'play': 'all', 'task': 'debug', 'task_uuid': task_uuid, 'host': host, 'res': {'changed': False}}}
+
+
+def test_compact_and_expand(tmp_path):
+    writer = ContextWriter(str(tmp_path))
+    events = [make_event(1, 't1'), make_event(2, 't1', host='host2'), make_event(3, 't2'), {'counter': 4, 'event': 'verbose'}]
+    stored = [writer.compact(event) for event in events]
+    writer.close()
+
+    assert stored[0]['event_data'] == {'host': 'host1', 'res': {'changed': False}, '__context': 0}
+    assert stored[1]['event_data']['__context'] == 0
+    assert stored[2]['event_data']['__context'] == 1
+    assert stored[3] is events[3]
+    assert events[0]['event_data']['task'] == 'debug'
+    with open(str(tmp_path / 'contexts.jsonl')) as f:
+        assert [json.loads(line)['id'] for line in f] == [0, 1]
+
+    reader = ContextReader(str(tmp_path))
+    assert [reader.expand(json.loads(json.dumps(event))) for event in stored] == events
+
+
+def test_reader_follows_writer(tmp_path):
+    writer = ContextWriter(str(tmp_path))
+    reader = ContextReader(str(tmp_path))
+    assert reader.expand({'event': 'verbose'}) == {'event': 'verbose'}
+    assert not os.path.exists(str(tmp_path / 'contexts.jsonl'))
+    for counter, task_uuid in enumerate(['t1', 't2', 't3']):
+        assert reader.expand(writer.compact(make_event(counter, task_uuid))) == make_event(counter, task_uuid)
+
+
+def test_writer_continues_ids(tmp_path):
+    writer = ContextWriter(str(tmp_path))
+    writer.compact(make_event(1, 't1'))
+    writer.close()
+    writer = ContextWriter(str(tmp_path))
+    assert writer.compact(make_event(1, 't1'))['event_data']['__context'] == 1
+    writer.close()
+    reader = ContextReader(str(tmp_path))
+    assert reader.expand(writer.compact(make_event(1, 't1'))) == make_event(1, 't1')
@@ -0,0 +1,63 @@
+import json
+import os
+
+from ansible_runner.utils.event_index import EventIndex
+from ansible_runner.utils.journal import EventJournal
+
+
+def make_event(counter, event='runner_on_ok', host=None, task_uuid=None):
+    event_data = {}
+    if host:
+        event_data['host'] = host
+    if task_uuid:
+        event_data['task_uuid'] = task_uuid
+    return {'counter': counter, 'uuid': 'uuid-{}'.format(counter), 'event': event, 'event_data': event_data}
+
+
+def test_event_index_find():
+    index = EventIndex()
+    index.add(make_event(1, event='playbook_on_start'), '1-uuid-1.json')
+    index.add(make_event(2, host='web1', task_uuid='t1'), '2-uuid-2.json')
+    index.add(make_event(3, host='web2', task_uuid='t1'), '3-uuid-3.json')
+    index.add(make_event(4, event='runner_on_failed', host='web1', task_uuid='t2'), '4-uuid-4.json')
+
+    assert [r[0] for r in index.find(host='web1')] == [2, 4]
+    assert [r[0] for r in index.find(task_uuid='t1')] == [2, 3]
+    assert [r[0] for r in index.find(host='web1', event='runner_on_ok')] == [2]
+    assert [r[0] for r in index.find(uuid='uuid-3')] == [3]
+    assert [r[0] for r in index.find(counter=1)] == [1]
+    assert index.find(counter=10) == []
+    assert index.find(host='db1') == []
+    assert len(index.find()) == 4
+
+
+def test_event_index_persist_and_load_files(tmp_path):
+    event_path = str(tmp_path / 'job_events')
+    os.mkdir(event_path)
+    index = EventIndex()
+    for counter, host in enumerate(['web1', 'web2', 'web1'], start=1):
+        event = make_event(counter, host=host)
+        filename = '{}-{}.json'.format(counter, event['uuid'])
+        with open(os.path.join(event_path, filename), 'w') as f:
+            json.dump(event, f)
+        index.add(event, filename)
+    index.dump(str(tmp_path / 'event_index.json'))
+
+    loaded = EventIndex.load(str(tmp_path / 'event_index.json'))
+    assert [e['counter'] for e in loaded.events(event_path, host='web1')] == [1, 3]
+
+
+def test_event_index_journal_locators(tmp_path):
+    journal = EventJournal(str(tmp_path), segment_size=200)
+    index = EventIndex()
+    for counter in range(1, 6):
+        event = make_event(counter, host='web{}'.format(counter % 2))
+        index.add(event, journal.write(event))
+    journal.close()
+
+    assert [e['counter'] for e in index.events(str(tmp_path), host='web1')] == [1, 3, 5]
+    assert [e['counter'] for e in index.events(str(tmp_path), host='web0')] == [2, 4]
+
+
+def test_event_index_load_missing(tmp_path):
+    assert EventIndex.load(str(tmp_path / 'event_index.json')) is None
@@ -0,0 +1,44 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from ansible_runner.utils.event_watch import InotifyWatcher, PollWatcher, POLL_MAX_INTERVAL, event_watcher
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is Linux only')
+def test_event_watcher_uses_inotify_on_linux(tmp_path):
+    watcher = event_watcher(str(tmp_path))
+    try:
+        assert isinstance(watcher, InotifyWatcher)
+    finally:
+        watcher.close()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is Linux only')
+def test_inotify_watcher_wakes_up_on_new_file(tmp_path):
+    watcher = event_watcher(str(tmp_path))
+    timer = threading.Timer(0.05, lambda: (tmp_path / '1-foo.json').write_text('{}'))
+    try:
+        timer.start()
+        start = time.time()
+        watcher.wait(timeout=10)
+        assert time.time() - start < 5
+    finally:
+        timer.cancel()
+        watcher.close()
+
+
+def test_poll_watcher_backs_off(tmp_path, mocker):
+    sleep = mocker.patch('ansible_runner.utils.event_watch.time.sleep')
+    watcher = PollWatcher(str(tmp_path))
+    for _ in range(20):
+        watcher.wait(timeout=10)
+    intervals = [c[0][0] for c in sleep.call_args_list]
+    assert intervals == sorted(intervals)
+    assert intervals[-1] == POLL_MAX_INTERVAL
+
+    watcher.reset()
+    watcher.wait(timeout=10)
+    assert sleep.call_args[0][0] == intervals[0]
@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from ansible_runner.utils.event_writer import EventWriter
+
+
+class GatedCallback(object):
+
+    def __init__(self):
+        self.events = []
+        self.gate = threading.Event()
+
+    def __call__(self, event_data):
+        self.gate.wait()
+        self.events.append(event_data)
+
+
+def test_event_writer_handles_events_in_order():
+    callback = GatedCallback()
+    callback.gate.set()
+    writer = EventWriter(callback, queue_size=2)
+    for counter in range(10):
+        writer.put({'counter': counter})
+    writer.close()
+    assert [e['counter'] for e in callback.events] == list(range(10))
+    assert writer.metrics['queued'] == 10
+    assert writer.metrics['queue_depth'] == 0
+
+
+def test_event_writer_drop_verbose():
+    callback = GatedCallback()
+    writer = EventWriter(callback, queue_size=1, backpressure='drop_verbose')
+    writer.put({'event': 'runner_on_ok', 'counter': 0})  # picked up by the writer thread, blocks on the gate
+    writer.put({'event': 'verbose', 'counter': 1})  # fills the queue
+    writer.put({'event': 'verbose', 'counter': 2})
+    writer.put({'event': 'verbose', 'counter': 3})
+    callback.gate.set()
+    writer.close()
+    assert writer.dropped >= 1
+    assert callback.events[0]['counter'] == 0
+    assert len(callback.events) == 4 - writer.dropped
+
+
+def test_event_writer_spill(tmp_path):
+    callback = GatedCallback()
+    writer = EventWriter(callback, queue_size=1, backpressure='spill', spill_dir=str(tmp_path))
+    for counter in range(20):
+        writer.put({'event': 'verbose', 'counter': counter})
+    assert writer.spilled >= 18
+    assert writer.max_queue_depth >= 18
+    callback.gate.set()
+    writer.close()
+    assert [e['counter'] for e in callback.events] == list(range(20))
+
+
+def test_event_writer_reraises_callback_error():
+    def callback(event_data):
+        raise RuntimeError('kaboom')
+
+    writer = EventWriter(callback)
+    writer.put({'counter': 0})
+    with pytest.raises(RuntimeError):
+        writer.close()
+
+
+def test_event_writer_invalid_backpressure():
+    with pytest.raises(ValueError):
+        EventWriter(lambda e: None, backpressure='bogus')
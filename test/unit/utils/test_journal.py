@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+import time
+
+from ansible_runner.utils.durability import DurabilityPolicy
+from ansible_runner.utils.journal import (
+    EventJournal,
+    JournalTicker,
+    collect_journal_events,
+    journal_segment_name,
+    journal_segments,
+)
+
+
+def test_journal_write_and_collect(tmp_path):
+    journal = EventJournal(str(tmp_path))
+    for counter in range(1, 4):
+        journal.write({'uuid': str(counter), 'counter': counter})
+    journal.close()
+
+    assert journal_segments(str(tmp_path)) == [0]
+    with open(os.path.join(str(tmp_path), journal_segment_name(0))) as f:
+        assert [json.loads(line)['counter'] for line in f] == [1, 2, 3]
+
+    events = [event for event, position in collect_journal_events(str(tmp_path))]
+    assert [event['counter'] for event in events] == [1, 2, 3]
+
+
+def test_journal_no_segment_until_first_write(tmp_path):
+    journal = EventJournal(str(tmp_path))
+    journal.close()
+    assert os.listdir(str(tmp_path)) == []
+    assert list(collect_journal_events(str(tmp_path))) == []
+
+
+def test_journal_segment_rotation(tmp_path):
+    journal = EventJournal(str(tmp_path), segment_size=1)
+    for counter in range(1, 4):
+        journal.write({'counter': counter})
+    journal.close()
+
+    assert journal_segments(str(tmp_path)) == [0, 1, 2]
+    events = [event for event, position in collect_journal_events(str(tmp_path))]
+    assert [event['counter'] for event in events] == [1, 2, 3]
+
+
+def test_journal_collect_resumes_from_position(tmp_path):
+    journal = EventJournal(str(tmp_path), flush_interval=0)
+    journal.write({'counter': 1})
+
+    collected = list(collect_journal_events(str(tmp_path)))
+    assert [event['counter'] for event, position in collected] == [1]
+    position = collected[-1][1]
+
+    journal.write({'counter': 2})
+    journal.close()
+    collected = list(collect_journal_events(str(tmp_path), position))
+    assert [event['counter'] for event, position in collected] == [2]
+
+
+def test_journal_collect_skips_incomplete_line(tmp_path):
+    with open(os.path.join(str(tmp_path), journal_segment_name(0)), 'w') as f:
+        f.write(json.dumps({'counter': 1}) + '\n')
+        f.write('{"counter": 2')
+
+    collected = list(collect_journal_events(str(tmp_path)))
+    assert [event['counter'] for event, position in collected] == [1]
+
+
+def test_journal_tick_flushes_when_due(tmp_path):
+    journal = EventJournal(str(tmp_path), flush_interval=60)
+    journal.write({'counter': 1})
+    journal.write({'counter': 2})
+    journal.tick()
+    assert list(collect_journal_events(str(tmp_path))) == []
+
+    journal._last_flush -= 60
+    journal.tick()
+    assert [event['counter'] for event, position in collect_journal_events(str(tmp_path))] == [1, 2]
+    journal.close()
+
+
+def test_journal_ticker(tmp_path):
+    journal = EventJournal(str(tmp_path), flush_interval=0.05)
+    ticker = JournalTicker(journal)
+    ticker.start()
+    try:
+        journal.write({'counter': 1})
+        journal.write({'counter': 2})
+        deadline = time.time() + 2
+        collected = []
+        while len(collected) < 2 and time.time() < deadline:
+            threading.Event().wait(0.02)
+            collected = list(collect_journal_events(str(tmp_path)))
+        # flushed without a later write or close
+        assert [event['counter'] for event, position in collected] == [1, 2]
+    finally:
+        ticker.stop()
+        journal.close()
+
+
+def test_journal_tick_commits_by_durability(tmp_path):
+    journal = EventJournal(str(tmp_path), durability=DurabilityPolicy('interval', interval=60, batch=0))
+    assert journal.tick_interval == 60
+    journal.write({'counter': 1})
+    journal.tick()
+    assert list(collect_journal_events(str(tmp_path))) == []
+
+    journal.durability._last_commit -= 60
+    journal.tick()
+    assert [event['counter'] for event, position in collect_journal_events(str(tmp_path))] == [1]
+    journal.close()
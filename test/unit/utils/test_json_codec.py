@@ -0,0 +1,60 @@
+import datetime
+import json
+
+import pytest
+
+from ansible_runner.utils import json_codec
+
+
+class Vault(object):
+    yaml_tag = '!vault'
+    _ciphertext = b'$ANSIBLE_VAULT;1.1;AES256'
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def codec(request, monkeypatch):
+    if request.param == 'json':
+        monkeypatch.setattr(json_codec, 'orjson', None)
+    elif json_codec.orjson is None:
+        pytest.skip('orjson is not installed')
+    return json_codec
+
+
+def test_round_trip(codec):
+    event_data = {'uuid': 'abc', 'counter': 1, 'stdout': u'caf\xe9\r\n', 'event_data': {'res': {'rc': 0, 'changed': False}}}
+    assert codec.loads(codec.dumpb(event_data)) == event_data
+    assert codec.loads(codec.dumps(event_data)) == event_data
+    assert json.loads(codec.dumps(event_data)) == event_data
+
+
+def test_ansible_types(codec):
+    data = {'secret': Vault(), 'created': datetime.datetime(2020, 1, 2, 3, 4, 5, 6), 'day': datetime.date(2020, 1, 2), 1: 'one'}
+    assert codec.loads(codec.dumpb(data)) == {
+        'secret': {'__ansible_vault': '$ANSIBLE_VAULT;1.1;AES256'},
+        'created': '2020-01-02T03:04:05.000006',
+        'day': '2020-01-02',
+        '1': 'one',
+    }
+
+
+def test_unserializable(codec):
+    with pytest.raises(TypeError):
+        codec.dumpb({'value': object()})
+
+
+def test_documents_orjson_refuses(codec):
+    assert codec.loads(codec.dumpb({'big': 2 ** 70})) == {'big': 2 ** 70}
+    assert codec.loads(b'{"value": NaN}')['value'] != 0
+
+
+def test_invalid_document(codec):
+    with pytest.raises(ValueError):
+        codec.loads(b'{"uuid": ')
+
+
+def test_merge_encoded(codec):
+    encoded = codec.dumpb({'uuid': 'abc', 'event': 'runner_on_ok', 'event_data': {'res': {}}})
+    merged = codec.merge_encoded({'counter': 1, 'event': 'verbose', 'stdout': u'ok\r\n'}, encoded)
+    assert codec.loads(merged) == {'counter': 1, 'stdout': u'ok\r\n', 'uuid': 'abc', 'event': 'runner_on_ok', 'event_data': {'res': {}}}
+    assert codec.merge_encoded({}, encoded) == encoded
+    assert codec.loads(codec.merge_encoded({'counter': 1}, b'{ }')) == {'counter': 1}
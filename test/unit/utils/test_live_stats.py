@@ -0,0 +1,48 @@
+from ansible_runner.utils.live_stats import LiveStats
+
+
+def _event(event, host, **event_data):
+    event_data['host'] = host
+    return {'event': event, 'event_data': event_data}
+
+
+def test_live_stats_counts_task_results():
+    stats = LiveStats()
+    stats.update(_event('runner_on_ok', 'host1', res={'changed': True}))
+    stats.update(_event('runner_on_ok', 'host1', res={'changed': False}))
+    stats.update(_event('runner_item_on_ok', 'host1', res={'changed': True}))
+    stats.update(_event('runner_on_failed', 'host2'))
+    stats.update(_event('runner_on_failed', 'host2', ignore_errors=True))
+    stats.update(_event('runner_on_unreachable', 'host3'))
+    stats.update(_event('runner_on_skipped', 'host3'))
+    stats.update({'event': 'verbose', 'stdout': 'noise'})
+
+    snapshot = stats.snapshot()
+    assert snapshot['ok'] == {'host1': 2, 'host2': 1}
+    assert snapshot['changed'] == {'host1': 1}
+    assert snapshot['failures'] == {'host2': 1}
+    assert snapshot['ignored'] == {'host2': 1}
+    assert snapshot['dark'] == {'host3': 1}
+    assert snapshot['skipped'] == {'host3': 1}
+    assert snapshot['processed'] == {'host1': 1, 'host2': 1, 'host3': 1}
+    assert stats.events == 8
+
+
+def test_live_stats_takes_play_recap():
+    stats = LiveStats()
+    stats.update(_event('runner_on_ok', 'host1'))
+    stats.update({'event': 'playbook_on_stats', 'event_data': {'ok': {'host1': 3}, 'rescued': {'host1': 1}}})
+    stats.update(_event('runner_on_ok', 'host1'))
+    snapshot = stats.snapshot()
+    assert stats.final
+    assert snapshot['ok'] == {'host1': 3}
+    assert snapshot['rescued'] == {'host1': 1}
+    assert snapshot['failures'] == {}
+
+
+def test_live_stats_snapshot_is_a_copy():
+    stats = LiveStats()
+    stats.update(_event('runner_on_ok', 'host1'))
+    snapshot = stats.snapshot()
+    snapshot['ok']['host1'] = 100
+    assert stats.snapshot()['ok'] == {'host1': 1}
@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+
+from ansible_runner.utils.timing_profile import DurationHistogram, TimingProfile
+
+
+def _event(event, host, task_uuid, duration, task='task'):
+    return {'event': event, 'event_data': {'host': host, 'task': task, 'task_uuid': task_uuid, 'duration': duration}}
+
+
+def test_duration_histogram_percentiles():
+    histogram = DurationHistogram()
+    for duration in range(1, 101):
+        histogram.add(float(duration))
+    summary = histogram.summary()
+    assert (summary['count'], summary['total'], summary['min'], summary['max']) == (100, 5050.0, 1.0, 100.0)
+    assert summary['p50'] == pytest.approx(50, rel=0.05)
+    assert summary['p95'] == pytest.approx(95, rel=0.05)
+    assert summary['p99'] == pytest.approx(99, rel=0.05)
+
+
+def test_duration_histogram_single_and_empty():
+    histogram = DurationHistogram()
+    assert histogram.percentile(0.5) is None
+    histogram.add(0.0)
+    assert histogram.summary()['p99'] == 0.0
+
+
+def test_timing_profile():
+    profile = TimingProfile(slowest=2)
+    for n in range(5):
+        profile.update(_event('runner_on_ok', 'host{}'.format(n), 'task1', float(n), task='setup'))
+    profile.update(_event('runner_on_failed', 'host0', 'task2', 10.0))
+    profile.update(_event('runner_item_on_ok', 'host0', 'task2', 100.0))
+    profile.update(_event('runner_on_ok', 'host0', 'task3', None))
+    profile.update({'event': 'verbose', 'stdout': 'noise'})
+    assert profile.results == 6
+
+    snapshot = profile.snapshot()
+    setup, task2 = snapshot['tasks']
+    assert (setup['task_uuid'], setup['task'], setup['count'], setup['max']) == ('task1', 'setup', 5, 4.0)
+    assert setup['slowest_hosts'] == [{'host': 'host4', 'duration': 4.0}, {'host': 'host3', 'duration': 3.0}]
+    assert (task2['count'], task2['p50']) == (1, 10.0)
+    assert snapshot['hosts']['host0']['total'] == 10.0
+    assert snapshot['slowest_hosts'] == [{'host': 'host0', 'total': 10.0}, {'host': 'host4', 'total': 4.0}]
+
+
+def test_timing_profile_dump(tmp_path):
+    profile = TimingProfile()
+    profile.update(_event('runner_on_ok', 'host1', 'task1', 1.5))
+    filename = str(tmp_path / 'timing_profile.json')
+    profile.dump(filename)
+    with open(filename) as f:
+        assert json.load(f) == profile.snapshot()
+    assert not os.path.exists(filename + '.tmp')
@@ -1,7 +1,9 @@
+import base64
 import io
 import json
 import os
 import signal
+import zipfile
 
 from pathlib import Path
 
@@ -11,6 +13,8 @@ from ansible_runner.utils import (
     isplaybook,
     isinventory,
     args2cmdline,
+    collect_new_events,
+    EventHighWaterMark,
     sanitize_container_name,
     signal_handler,
 )
@@ -58,7 +62,9 @@ def test_sanitize_container_name(container_name, expected_name):
     ('.', ['my_link/ordinary_directory/dir_file.txt', 'my_link/my_link/ordinary_file.txt']),
     ('filedoesnotexist.txt', [])
 ], ids=['global', 'local', 'directory', 'recursive', 'bad'])
-def test_transmit_symlink(tmp_path, symlink_dest, check_content):
+@pytest.mark.parametrize('streaming, binary', [(False, False), (True, False), (False, True), (True, True)],
+                         ids=['zipfile', 'zipstream', 'zipfile-binary', 'zipstream-binary'])
+def test_transmit_symlink(tmp_path, symlink_dest, check_content, streaming, binary):
     symlink_dest = Path(symlink_dest)
 
     # prepare the input private_data_dir directory to zip
@@ -84,7 +90,7 @@ def test_transmit_symlink(tmp_path, symlink_dest, check_content):
     # zip and stream the data into the in-memory buffer outgoing_buffer
     outgoing_buffer = io.BytesIO()
     outgoing_buffer.name = 'not_stdout'
-    stream_dir(pdd, outgoing_buffer)
+    stream_dir(pdd, outgoing_buffer, streaming=streaming, binary=binary)
 
     # prepare the destination private_data_dir to transmit to
     dest_dir = tmp_path / 'symlink_zip_dest'
@@ -97,7 +103,7 @@ def test_transmit_symlink(tmp_path, symlink_dest, check_content):
         outgoing_buffer.seek(0)
         first_line = outgoing_buffer.readline()
         size_data = json.loads(first_line.strip())
-        unstream_dir(outgoing_buffer, size_data['zipfile'], dest_dir)
+        unstream_dir(outgoing_buffer, size_data.get('zipfile'), dest_dir, binary=size_data.get('binary', False))
 
         # Assure the new symlink is still the same type of symlink
         new_symlink_path = dest_dir / 'my_link'
@@ -117,7 +123,9 @@ def test_transmit_symlink(tmp_path, symlink_dest, check_content):
     0o555,
     0o700,
 ])
-def test_transmit_permissions(tmp_path, fperm):
+@pytest.mark.parametrize('streaming, binary', [(False, False), (True, False), (False, True), (True, True)],
+                         ids=['zipfile', 'zipstream', 'zipfile-binary', 'zipstream-binary'])
+def test_transmit_permissions(tmp_path, fperm, streaming, binary):
     # breakpoint()
     pdd = tmp_path / 'transmit_permission_test'
     pdd.mkdir()
@@ -133,20 +141,109 @@ def test_transmit_permissions(tmp_path, fperm):
 
     outgoing_buffer = io.BytesIO()
     outgoing_buffer.name = 'not_stdout'
-    stream_dir(pdd, outgoing_buffer)
+    stream_dir(pdd, outgoing_buffer, streaming=streaming, binary=binary)
 
     dest_dir = tmp_path / 'transmit_permission_dest'
 
     outgoing_buffer.seek(0)
     first_line = outgoing_buffer.readline()
     size_data = json.loads(first_line.strip())
-    unstream_dir(outgoing_buffer, size_data['zipfile'], dest_dir)
+    unstream_dir(outgoing_buffer, size_data.get('zipfile'), dest_dir, binary=size_data.get('binary', False))
 
     # Assure the new file is the same permissions
     new_file_path = dest_dir / 'ordinary_file.txt'
     assert oct(new_file_path.stat().st_mode) == oct(old_file_path.stat().st_mode)
 
 
+def test_transmit_zipstream_is_zip_archive(tmp_path):
+    pdd = tmp_path / 'zipstream_test'
+    (pdd / 'env').mkdir(parents=True)
+    (pdd / 'env' / 'extravars').write_bytes(b'foo: bar\n')
+    (pdd / 'large.bin').write_bytes(os.urandom(3 * 1024 * 1024))
+
+    outgoing_buffer = io.BytesIO()
+    outgoing_buffer.name = 'not_stdout'
+    stream_dir(pdd, outgoing_buffer, streaming=True)
+
+    header, data, trailer = outgoing_buffer.getvalue().splitlines()
+    assert json.loads(header) == {'zipstream': True}
+    archive_data = base64.b64decode(data)
+    assert json.loads(trailer) == {'zipstream_size': len(archive_data)}
+
+    with zipfile.ZipFile(io.BytesIO(archive_data)) as archive:
+        assert archive.testzip() is None
+        assert archive.read('env/extravars') == b'foo: bar\n'
+        assert archive.read('large.bin') == (pdd / 'large.bin').read_bytes()
+
+
+def test_transmit_zipstream_empty(tmp_path):
+    outgoing_buffer = io.BytesIO()
+    outgoing_buffer.name = 'not_stdout'
+    stream_dir(None, outgoing_buffer, streaming=True)
+
+    outgoing_buffer.seek(0)
+    outgoing_buffer.readline()
+    dest_dir = tmp_path / 'zipstream_dest'
+    unstream_dir(outgoing_buffer, None, dest_dir)
+    assert outgoing_buffer.read() == b''
+
+
+def test_transmit_zipstream_binary_frames(tmp_path):
+    pdd = tmp_path / 'zipstream_test'
+    pdd.mkdir()
+    (pdd / 'large.bin').write_bytes(os.urandom(3 * 1024 * 1024))
+
+    outgoing_buffer = io.BytesIO()
+    outgoing_buffer.name = 'not_stdout'
+    stream_dir(pdd, outgoing_buffer, streaming=True, binary=True)
+
+    outgoing_buffer.seek(0)
+    assert json.loads(outgoing_buffer.readline()) == {'zipstream': True, 'binary': True}
+    archive_data = b''
+    while True:
+        length = int.from_bytes(outgoing_buffer.read(4), 'big')
+        if not length:
+            break
+        archive_data += outgoing_buffer.read(length)
+    assert json.loads(outgoing_buffer.readline()) == {'zipstream_size': len(archive_data)}
+    assert outgoing_buffer.read() == b''
+
+    with zipfile.ZipFile(io.BytesIO(archive_data)) as archive:
+        assert archive.read('large.bin') == (pdd / 'large.bin').read_bytes()
+
+
+@pytest.mark.parametrize('streaming', [False, True], ids=['zipfile', 'zipstream'])
+def test_transmit_binary_truncated(tmp_path, streaming):
+    pdd = tmp_path / 'binary_test'
+    pdd.mkdir()
+    (pdd / 'ordinary_file.txt').write_bytes(os.urandom(64 * 1024))
+
+    outgoing_buffer = io.BytesIO()
+    outgoing_buffer.name = 'not_stdout'
+    stream_dir(pdd, outgoing_buffer, streaming=streaming, binary=True)
+    sent = outgoing_buffer.getvalue()
+
+    truncated = io.BytesIO(sent[:len(sent) // 2])
+    size_data = json.loads(truncated.readline())
+    with pytest.raises(ValueError):
+        unstream_dir(truncated, size_data.get('zipfile'), tmp_path / 'binary_dest', binary=True)
+
+
+def test_transmit_zipstream_truncated(tmp_path):
+    pdd = tmp_path / 'zipstream_test'
+    pdd.mkdir()
+    (pdd / 'ordinary_file.txt').write_bytes(os.urandom(64 * 1024))
+
+    outgoing_buffer = io.BytesIO()
+    outgoing_buffer.name = 'not_stdout'
+    stream_dir(pdd, outgoing_buffer, streaming=True)
+    header, data, trailer = outgoing_buffer.getvalue().splitlines()
+
+    truncated = io.BytesIO(data[:len(data) // 2] + b'\n' + trailer + b'\n')
+    with pytest.raises(ValueError):
+        unstream_dir(truncated, None, tmp_path / 'zipstream_dest')
+
+
 def test_signal_handler(mocker):
     """Test the default handler is set to handle the correct signals"""
 
@@ -201,3 +298,54 @@ def test_signal_handler_set(mocker):
 
     with pytest.raises(AttributeError, match='Raised intentionally'):
         mock_signal.call_args[0][1]('number', 'frame')
+
+
+def _write_events(event_path, *counters):
+    for counter in counters:
+        (event_path / '{}-uuid{}.json'.format(counter, counter)).write_text(json.dumps({'counter': counter}))
+
+
+def test_collect_new_events_high_water_mark(tmp_path):
+    high_water_mark = EventHighWaterMark()
+    _write_events(tmp_path, 1, 2, 3)
+    (tmp_path / '4-uuid4-partial.json').write_text('{}')
+    assert [e['counter'] for e, _ in collect_new_events(str(tmp_path), high_water_mark)] == [1, 2, 3]
+    assert high_water_mark.next_counter == 4
+    assert not high_water_mark.pending
+
+    assert list(collect_new_events(str(tmp_path), high_water_mark)) == []
+    _write_events(tmp_path, 4, 5)
+    assert [e['counter'] for e, _ in collect_new_events(str(tmp_path), high_water_mark)] == [4, 5]
+
+
+def test_collect_new_events_gaps(tmp_path):
+    high_water_mark = EventHighWaterMark()
+    _write_events(tmp_path, 1, 3, 4)
+    assert [e['counter'] for e, _ in collect_new_events(str(tmp_path), high_water_mark)] == [1, 3, 4]
+    assert high_water_mark.pending == {3, 4}
+
+    # a late event filling the gap is still picked up
+    _write_events(tmp_path, 2)
+    assert [e['counter'] for e, _ in collect_new_events(str(tmp_path), high_water_mark)] == [2]
+    assert high_water_mark.next_counter == 5
+    assert not high_water_mark.pending
+
+
+def test_collect_new_events_skips_missing_counters(tmp_path):
+    high_water_mark = EventHighWaterMark()
+    _write_events(tmp_path, 1, 3)
+    list(collect_new_events(str(tmp_path), high_water_mark))
+    list(collect_new_events(str(tmp_path), high_water_mark))
+    assert list(collect_new_events(str(tmp_path), high_water_mark)) == []
+    # the gap survived a full pass, so the state no longer grows with it
+    assert high_water_mark.next_counter == 4
+    assert not high_water_mark.pending
+
+
+def test_collect_new_events_retries_incomplete_file(tmp_path):
+    high_water_mark = EventHighWaterMark()
+    _write_events(tmp_path, 1)
+    (tmp_path / '2-uuid2.json').write_text('{"counter"')
+    assert [e['counter'] for e, _ in collect_new_events(str(tmp_path), high_water_mark)] == [1]
+    _write_events(tmp_path, 2)
+    assert [e['counter'] for e, _ in collect_new_events(str(tmp_path), high_water_mark)] == [2]